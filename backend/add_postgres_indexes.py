@@ -82,6 +82,23 @@ def create_indexes():
                 "columns": "source_account_id, created_at"
             },
             
+            # Keyset pagination indexes on (created_at, id), overall and per account
+            {
+                "name": "ix_transactions_created_at_id",
+                "table": "transactions",
+                "columns": "created_at, id"
+            },
+            {
+                "name": "ix_transactions_source_created_at_id",
+                "table": "transactions",
+                "columns": "source_account_id, created_at, id"
+            },
+            {
+                "name": "ix_transactions_destination_created_at_id",
+                "table": "transactions",
+                "columns": "destination_account_id, created_at, id"
+            },
+            
             # Security settings index
             {
                 "name": "ix_security_settings_user_id",
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Add the scheduled_for column and its (status, scheduled_for) index to the
+transactions table, and backfill it for existing scheduled payments
+"""
+from app import create_app, db
+from sqlalchemy import text
+from datetime import datetime, timezone
+import json
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def parse_payment_date(value):
+    """Parse a stored payment_date into a naive UTC datetime"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def update_transaction_schema():
+    """
+    Add scheduled payment support to the transactions table
+    """
+    app = create_app()
+    with app.app_context():
+        logger.info("Starting transaction schema update...")
+        
+        # Get database engine
+        engine = db.engine
+        inspector = db.inspect(engine)
+        
+        # Check if the column already exists
+        columns = [col['name'] for col in inspector.get_columns('transactions')]
+        
+        if 'scheduled_for' not in columns:
+            logger.info("Adding scheduled_for column to transactions table")
+            with engine.connect() as conn:
+                conn.execute(text("ALTER TABLE transactions ADD COLUMN scheduled_for TIMESTAMP"))
+                conn.commit()
+        
+        logger.info("Creating ix_transactions_status_scheduled_for index")
+        with engine.connect() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_transactions_status_scheduled_for "
+                "ON transactions (status, scheduled_for)"
+            ))
+            conn.commit()
+        
+        # Backfill due dates of payments scheduled before the column existed
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT id, meta_data FROM transactions "
+                "WHERE status = 'scheduled' AND scheduled_for IS NULL"
+            )).fetchall()
+            
+            updated = 0
+            for row in rows:
+                meta_data = row.meta_data
+                if isinstance(meta_data, str):
+                    meta_data = json.loads(meta_data)
+                payment_date = (meta_data or {}).get('payment_date')
+                if not payment_date:
+                    logger.warning(f"Scheduled payment {row.id} has no payment_date")
+                    continue
+                conn.execute(
+                    text("UPDATE transactions SET scheduled_for = :scheduled_for WHERE id = :id"),
+                    {'scheduled_for': parse_payment_date(payment_date), 'id': row.id}
+                )
+                updated += 1
+            conn.commit()
+            logger.info(f"Backfilled scheduled_for on {updated} scheduled payments")
+        
+        logger.info("Transaction schema update completed successfully!")
+        
+if __name__ == "__main__":
+    update_transaction_schema()
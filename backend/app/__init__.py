@@ -36,10 +36,26 @@ def create_app(config_class=Config):
     cors.init_app(app)
     bcrypt.init_app(app)
     
+    # Request, pool, crypto and IDS metrics served at /metrics (if enabled)
+    from app.utils.metrics import init_metrics
+    init_metrics(app)
+    
+    # Count queries per request and log slow ones (if enabled)
+    from app.utils.query_stats import init_query_stats
+    init_query_stats(app)
+    
     # Initialize IDS middleware
     from app.security.ids_middleware import init_ids_middleware
     init_ids_middleware(app)
     
+    # Start background transaction signing (if enabled)
+    from app.security.signing_queue import init_signing_queue
+    init_signing_queue(app)
+    
+    # Start background ledger compaction (if enabled)
+    from app.services.ledger import init_ledger_compactor
+    init_ledger_compactor(app)
+    
     # Enable CORS for all routes
     CORS(app)
     
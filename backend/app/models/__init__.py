@@ -2,4 +2,7 @@
 from app.models.user import User
 from app.models.account import Account
 from app.models.transaction import Transaction
-from app.models.payee import Payee
\ No newline at end of file
+from app.models.payee import Payee
+from app.models.ledger import LedgerEntry, BalanceSnapshot
+from app.models.idempotency import IdempotencyKey
+from app.models.aggregate import BalanceAggregate
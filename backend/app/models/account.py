@@ -2,7 +2,7 @@ from app import db
 from datetime import datetime
 from uuid import uuid4
 from sqlalchemy import LargeBinary
-from app.security.encryption import encrypt_data, decrypt_data
+from app.security.encryption import encrypt_data, decrypt_data, decrypt_amounts
 
 class Account(db.Model):
     __tablename__ = 'accounts'
@@ -24,18 +24,40 @@ class Account(db.Model):
     
     @property
     def balance(self):
+        """The stored balance; with LEDGER_APPEND_ONLY it lags until compaction
+        (read current balances through app.services.ledger)"""
         return float(decrypt_data(self.balance_encrypted).decode('utf-8'))
     
     @balance.setter
     def balance(self, value):
         self.balance_encrypted = encrypt_data(str(value).encode('utf-8'))
     
-    def to_dict(self, include_user_details=False):
+    def to_dict(self, include_user_details=False, balance=None):
+        return self.bulk_to_dict([self], include_user_details, balances=None if balance is None else [balance])[0]
+    
+    @classmethod
+    def bulk_to_dict(cls, accounts, include_user_details=False, max_workers=None, balances=None):
+        """
+        Serialize a list of accounts
+        
+        Args:
+            balances (list): Current balances in the same order, from
+                app.services.ledger.current_balances; if omitted the stored
+                balances are decrypted in one pass
+        """
+        if balances is None:
+            balances = decrypt_amounts([account.balance_encrypted for account in accounts], max_workers)
+        return [
+            account._to_dict(balance, include_user_details)
+            for account, balance in zip(accounts, balances)
+        ]
+    
+    def _to_dict(self, balance, include_user_details=False):
         account_dict = {
             'id': self.id,
             'account_number': self.account_number,
             'account_type': self.account_type,
-            'balance': self.balance,
+            'balance': balance,
             'currency': 'USD',  # Default currency, could be stored in DB in a real app
             'is_active': self.is_active,
             'user_id': self.user_id,
@@ -43,12 +65,12 @@ class Account(db.Model):
         }
         
         # Include user details for admin views
-        if include_user_details and hasattr(self, 'user'):
+        if include_user_details and self.owner is not None:
             account_dict['user'] = {
-                'id': self.user.id,
-                'firstName': self.user.first_name,
-                'lastName': self.user.last_name,
-                'email': self.user.email
+                'id': self.owner.id,
+                'firstName': self.owner.first_name,
+                'lastName': self.owner.last_name,
+                'email': self.owner.email
             }
             
         return account_dict
\ No newline at end of file
@@ -0,0 +1,18 @@
+from app import db
+from datetime import datetime
+from sqlalchemy import LargeBinary
+
+class BalanceAggregate(db.Model):
+    """
+    One shard of the running balance total for an account type
+    
+    Writers add to a random shard so concurrent transfers do not all queue on
+    one row; readers sum the shards.
+    """
+    __tablename__ = 'balance_aggregates'
+    
+    account_type = db.Column(db.String(20), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    total_encrypted = db.Column(LargeBinary, nullable=False)
+    account_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
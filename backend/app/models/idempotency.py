@@ -0,0 +1,28 @@
+from app import db
+from datetime import datetime
+from uuid import uuid4
+from sqlalchemy import JSON
+
+class IdempotencyKey(db.Model):
+    """The stored outcome of a POST made with an Idempotency-Key header"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'endpoint', 'key', name='uq_idempotency_keys_user_endpoint_key'),
+    )
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
+    key = db.Column(db.String(255), nullable=False)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), default='in_progress', nullable=False)  # 'in_progress' or 'completed'
+    # The request holding an in-progress key; another request may take the key over once the lease expires
+    lease_id = db.Column(db.String(36), nullable=False, default=lambda: str(uuid4()))
+    lease_expires_at = db.Column(db.DateTime, nullable=False)
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(JSON, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key}>'
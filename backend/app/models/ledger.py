@@ -0,0 +1,49 @@
+from app import db
+from datetime import datetime
+from sqlalchemy import LargeBinary
+
+# SQLite only autoincrements INTEGER primary keys
+LedgerId = db.BigInteger().with_variant(db.Integer(), 'sqlite')
+
+class LedgerEntry(db.Model):
+    """One posting against one account; rows are only ever inserted"""
+    __tablename__ = 'ledger_entries'
+    __table_args__ = (
+        # Postings for an account after its latest snapshot
+        db.Index('ix_ledger_entries_account_id_id', 'account_id', 'id'),
+    )
+    
+    # Increasing id orders postings, and snapshots record the last id they include
+    id = db.Column(LedgerId, primary_key=True, autoincrement=True)
+    account_id = db.Column(db.String(36), db.ForeignKey('accounts.id'), nullable=False)
+    transaction_id = db.Column(db.String(36), db.ForeignKey('transactions.id'), nullable=False, index=True)
+    entry_type = db.Column(db.String(6), nullable=False)  # 'debit' or 'credit'
+    amount_encrypted = db.Column(LargeBinary, nullable=False)  # Signed: debits are negative
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Lets the unit of work insert the transaction before its postings
+    transaction = db.relationship('Transaction', backref=db.backref('ledger_entries', lazy=True))
+    
+    def to_dict(self, amount):
+        return {
+            'id': self.id,
+            'account_id': self.account_id,
+            'transaction_id': self.transaction_id,
+            'entry_type': self.entry_type,
+            'amount': amount,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class BalanceSnapshot(db.Model):
+    """An account's balance including every posting up to last_entry_id"""
+    __tablename__ = 'balance_snapshots'
+    __table_args__ = (
+        db.UniqueConstraint('account_id', 'last_entry_id', name='uq_balance_snapshots_account_entry'),
+    )
+    
+    id = db.Column(LedgerId, primary_key=True, autoincrement=True)
+    account_id = db.Column(db.String(36), db.ForeignKey('accounts.id'), nullable=False)
+    last_entry_id = db.Column(db.BigInteger, nullable=False, default=0)
+    balance_encrypted = db.Column(LargeBinary, nullable=False)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)  # Postings rolled up since the previous snapshot
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
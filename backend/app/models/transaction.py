@@ -2,11 +2,23 @@ from app import db
 from datetime import datetime
 from uuid import uuid4
 from sqlalchemy import LargeBinary, JSON
-from app.security.encryption import encrypt_data, decrypt_data
+from app.security.encryption import encrypt_data, decrypt_data, decrypt_amounts
 from app.security.digital_signature import sign_transaction, verify_transaction
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Keyset pagination on (created_at, id), overall and per account
+        db.Index('ix_transactions_created_at_id', 'created_at', 'id'),
+        db.Index('ix_transactions_source_created_at_id', 'source_account_id', 'created_at', 'id'),
+        db.Index('ix_transactions_destination_created_at_id', 'destination_account_id', 'created_at', 'id'),
+        # Due scheduled payments, for the payment scheduler
+        db.Index('ix_transactions_status_scheduled_for', 'status', 'scheduled_for'),
+        # Unsigned transactions, for the background signing sweep
+        db.Index('ix_transactions_unsigned_created_at', 'created_at',
+                 postgresql_where=db.text('digital_signature IS NULL'),
+                 sqlite_where=db.text('digital_signature IS NULL')),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
     transaction_type = db.Column(db.String(20), nullable=False)
@@ -22,6 +34,7 @@ class Transaction(db.Model):
     category = db.Column(db.String(50), nullable=True)
     currency = db.Column(db.String(3), default='USD')
     meta_data = db.Column(JSON, nullable=True)
+    scheduled_for = db.Column(db.DateTime, nullable=True)  # When a scheduled payment is due
     
     @property
     def amount(self):
@@ -42,12 +55,24 @@ class Transaction(db.Model):
         return verify_transaction(transaction_data, self.digital_signature, public_key)
     
     def to_dict(self):
+        return self._to_dict(self.amount)
+    
+    @classmethod
+    def bulk_to_dict(cls, transactions, max_workers=None):
+        """Serialize a list of transactions, decrypting all amounts in one pass"""
+        amounts = decrypt_amounts([transaction.amount_encrypted for transaction in transactions], max_workers)
+        return [
+            transaction._to_dict(amount)
+            for transaction, amount in zip(transactions, amounts)
+        ]
+    
+    def _to_dict(self, amount):
         return {
             'id': self.id,
             'transaction_type': self.transaction_type,
             'source_account_id': self.source_account_id,
             'destination_account_id': self.destination_account_id,
-            'amount': self.amount,
+            'amount': amount,
             'description': self.description,
             'status': self.status,
             'reference': self.reference,
@@ -55,5 +80,6 @@ class Transaction(db.Model):
             'currency': self.currency,
             'meta_data': self.meta_data,
             'created_at': self.created_at.isoformat(),
-            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'scheduled_for': self.scheduled_for.isoformat() if self.scheduled_for else None
         }
\ No newline at end of file
@@ -3,6 +3,13 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models.user import User
 from app.models.account import Account
+from app.models.transaction import Transaction
+from app.security.encryption import decrypt_amounts
+from app.utils.pagination import get_page_args, encode_cursor, decode_cursor
+from sqlalchemy import literal, tuple_, union_all
+from app.services.aggregates import record_new_account
+from app.services.ledger import current_balances
+from app.services.transfer_engine import parse_amount, TransferError
 import random
 import string
 import logging
@@ -33,7 +40,7 @@ def get_accounts():
             
         accounts = Account.query.filter_by(user_id=current_user_id).all()
         return jsonify({
-            'accounts': [account.to_dict() for account in accounts]
+            'accounts': Account.bulk_to_dict(accounts, balances=current_balances(accounts))
         }), 200
     except Exception as e:
         logging.error(f"Get accounts error: {str(e)}")
@@ -54,7 +61,7 @@ def get_account_details(account_id):
         if account.user_id != current_user_id:
             return jsonify({'message': 'Access denied'}), 403
             
-        return jsonify(account.to_dict()), 200
+        return jsonify(account.to_dict(balance=current_balances([account])[0])), 200
     except Exception as e:
         logging.error(f"Get account details error: {str(e)}")
         return jsonify({'message': 'Failed to retrieve account details', 'error': str(e)}), 500
@@ -66,6 +73,9 @@ def create_account():
     try:
         current_user_id = get_jwt_identity()
         data = request.get_json()
+        initial_deposit = parse_amount(
+            data.get('initial_deposit', 0), 'Initial deposit must be zero or a positive amount', allow_zero=True
+        )
         
         # Create new account
         new_account = Account(
@@ -75,20 +85,72 @@ def create_account():
         )
         
         # Set initial balance (encrypted)
-        new_account.balance = data.get('initial_deposit', 0)
+        new_account.balance = initial_deposit
         
         db.session.add(new_account)
+        record_new_account(new_account, initial_deposit)
         db.session.commit()
         
         return jsonify({
             'message': 'Account created successfully',
             'account': new_account.to_dict()
         }), 201
+    except TransferError as e:
+        return jsonify({'message': e.message}), e.status_code
     except Exception as e:
         logging.error(f"Create account error: {str(e)}")
         db.session.rollback()
         return jsonify({'message': 'Failed to create account', 'error': str(e)}), 500
 
+def _transaction_page(account_id, cursor, limit):
+    """
+    Fetch one page of an account's transactions, newest first, in a single query
+    
+    The outgoing and incoming sides are separate branches of a UNION ALL, so
+    each is an ordered range scan of its (account, created_at, id) index and
+    the direction is labelled in SQL. Only the listed columns are read.
+    
+    Returns:
+        tuple: (rows, next_cursor)
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    def branch(account_column, direction):
+        query = db.session.query(
+            Transaction.id,
+            Transaction.transaction_type,
+            Transaction.amount_encrypted,
+            Transaction.currency,
+            Transaction.description,
+            Transaction.status,
+            Transaction.reference,
+            Transaction.created_at,
+            literal(direction).label('direction')
+        ).filter(account_column == account_id)
+        if cursor:
+            created_at, row_id = decode_cursor(cursor)
+            query = query.filter(tuple_(Transaction.created_at, Transaction.id) < tuple_(created_at, row_id))
+        # Wrapped so each branch keeps its own ORDER BY/LIMIT inside the UNION
+        return db.session.query(
+            query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+                 .limit(limit + 1).subquery()
+        ).statement
+    
+    page = union_all(
+        branch(Transaction.source_account_id, 'outgoing'),
+        branch(Transaction.destination_account_id, 'incoming')
+    ).subquery()
+    rows = db.session.query(page).order_by(
+        page.c.created_at.desc(), page.c.id.desc()
+    ).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
 @account_bp.route('/<account_id>/transactions', methods=['GET'])
 @jwt_required()
 def get_account_transactions(account_id):
@@ -99,36 +161,26 @@ def get_account_transactions(account_id):
     if not account:
         return jsonify({'message': 'Account not found or unauthorized'}), 404
     
-    # Combine incoming and outgoing transactions
-    all_transactions = []
+    try:
+        cursor, limit = get_page_args(request.args)
+        rows, next_cursor = _transaction_page(account_id, cursor, limit)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    for tx in account.outgoing_transactions:
-        all_transactions.append({
-            'id': tx.id,
-            'type': tx.transaction_type,
-            'amount': tx.amount,
-            'currency': tx.currency,
-            'description': tx.description,
-            'status': tx.status,
-            'referenceNumber': tx.reference_number,
-            'direction': 'outgoing',
-            'createdAt': tx.created_at.isoformat()
-        })
+    amounts = decrypt_amounts([row.amount_encrypted for row in rows])
+    all_transactions = []
     
-    for tx in account.incoming_transactions:
+    for row, amount in zip(rows, amounts):
         all_transactions.append({
-            'id': tx.id,
-            'type': tx.transaction_type,
-            'amount': tx.amount,
-            'currency': tx.currency,
-            'description': tx.description,
-            'status': tx.status,
-            'referenceNumber': tx.reference_number,
-            'direction': 'incoming',
-            'createdAt': tx.created_at.isoformat()
+            'id': row.id,
+            'type': row.transaction_type,
+            'amount': amount,
+            'currency': row.currency,
+            'description': row.description,
+            'status': row.status,
+            'referenceNumber': row.reference,
+            'direction': row.direction,
+            'createdAt': row.created_at.isoformat()
         })
     
-    # Sort by date (newest first)
-    all_transactions.sort(key=lambda x: x['createdAt'], reverse=True)
-    
-    return jsonify({'transactions': all_transactions}), 200
\ No newline at end of file
+    return jsonify({'transactions': all_transactions, 'next_cursor': next_cursor}), 200
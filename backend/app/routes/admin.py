@@ -4,6 +4,10 @@ from app import db
 from app.models.user import User
 from app.models.account import Account
 from app.models.transaction import Transaction
+from app.services.aggregates import get_balance_totals
+from app.services.ledger import current_balances
+from app.utils.pagination import get_offset_page_args, apply_sort, parse_date_range, paginate_offset
+from sqlalchemy.orm import joinedload
 import logging
 
 admin_bp = Blueprint('admin', __name__)
@@ -21,16 +25,68 @@ def admin_required(fn):
     wrapper.__name__ = fn.__name__
     return wrapper
 
+USER_SORT_FIELDS = {
+    'created_at': User.created_at,
+    'username': User.username,
+    'email': User.email,
+    'last_login': User.last_login
+}
+
+ACCOUNT_SORT_FIELDS = {
+    'created_at': Account.created_at,
+    'account_number': Account.account_number,
+    'account_type': Account.account_type
+}
+
+TRANSACTION_SORT_FIELDS = {
+    'created_at': Transaction.created_at,
+    'completed_at': Transaction.completed_at,
+    'status': Transaction.status,
+    'transaction_type': Transaction.transaction_type
+}
+
+def _status_filter(query, column, status):
+    """Filter on an is_active column from status=active|inactive"""
+    if status == 'active':
+        return query.filter(column.is_(True))
+    if status == 'inactive':
+        return query.filter(column.is_(False))
+    if status:
+        raise ValueError('Status must be active or inactive')
+    return query
+
+def _date_filter(query, column, args):
+    start_date, end_date = parse_date_range(args)
+    if start_date:
+        query = query.filter(column >= start_date)
+    if end_date:
+        query = query.filter(column < end_date)
+    return query
+
 @admin_bp.route('/users', methods=['GET'])
 @jwt_required()
 @admin_required
 def get_all_users():
-    """Get all users (admin only)"""
+    """Get users, a page at a time (admin only)"""
     try:
-        users = User.query.all()
+        page, limit = get_offset_page_args(request.args)
+        
+        query = _status_filter(User.query, User.is_active, request.args.get('status'))
+        query = _date_filter(query, User.created_at, request.args)
+        if request.args.get('is_admin') is not None:
+            query = query.filter(User.is_admin.is_(request.args.get('is_admin') == 'true'))
+        if request.args.get('search'):
+            term = f"{request.args['search']}%"
+            query = query.filter(User.username.ilike(term) | User.email.ilike(term))
+        query = apply_sort(query, request.args.get('sort'), USER_SORT_FIELDS, '-created_at')
+        
+        users, pagination = paginate_offset(query, page, limit)
         return jsonify({
-            'users': [user.to_dict() for user in users]
+            'users': [user.to_dict() for user in users],
+            'pagination': pagination
         }), 200
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         logging.error(f"Admin get users error: {str(e)}")
         return jsonify({'message': 'Failed to retrieve users', 'error': str(e)}), 500
@@ -39,14 +95,27 @@ def get_all_users():
 @jwt_required()
 @admin_required
 def get_all_accounts():
-    """Get all accounts (admin only)"""
+    """Get accounts with their owners, a page at a time (admin only)"""
     try:
-        # Query accounts with user relationship to include user details
-        accounts = Account.query.join(User).all()
+        page, limit = get_offset_page_args(request.args)
+        
+        # Owners are loaded in the same query rather than one query per account
+        query = Account.query.options(joinedload(Account.owner))
+        query = _status_filter(query, Account.is_active, request.args.get('status'))
+        query = _date_filter(query, Account.created_at, request.args)
+        if request.args.get('type'):
+            query = query.filter(Account.account_type == request.args['type'])
+        if request.args.get('user_id'):
+            query = query.filter(Account.user_id == request.args['user_id'])
+        query = apply_sort(query, request.args.get('sort'), ACCOUNT_SORT_FIELDS, '-created_at')
         
+        accounts, pagination = paginate_offset(query, page, limit)
         return jsonify({
-            'accounts': [account.to_dict(include_user_details=True) for account in accounts]
+            'accounts': Account.bulk_to_dict(accounts, include_user_details=True, balances=current_balances(accounts)),
+            'pagination': pagination
         }), 200
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         logging.error(f"Admin get accounts error: {str(e)}")
         return jsonify({'message': 'Failed to retrieve accounts', 'error': str(e)}), 500
@@ -55,12 +124,36 @@ def get_all_accounts():
 @jwt_required()
 @admin_required
 def get_all_transactions():
-    """Get all transactions (admin only)"""
+    """Get transactions, a page at a time (admin only)"""
     try:
-        transactions = Transaction.query.all()
+        page, limit = get_offset_page_args(request.args)
+        
+        query = _date_filter(Transaction.query, Transaction.created_at, request.args)
+        if request.args.get('status'):
+            query = query.filter(Transaction.status == request.args['status'])
+        if request.args.get('type'):
+            query = query.filter(Transaction.transaction_type == request.args['type'])
+        if request.args.get('account_id'):
+            account_id = request.args['account_id']
+            query = query.filter(
+                (Transaction.source_account_id == account_id) |
+                (Transaction.destination_account_id == account_id)
+            )
+        if request.args.get('user_id'):
+            user_accounts = db.session.query(Account.id).filter(Account.user_id == request.args['user_id'])
+            query = query.filter(
+                Transaction.source_account_id.in_(user_accounts) |
+                Transaction.destination_account_id.in_(user_accounts)
+            )
+        query = apply_sort(query, request.args.get('sort'), TRANSACTION_SORT_FIELDS, '-created_at')
+        
+        transactions, pagination = paginate_offset(query, page, limit)
         return jsonify({
-            'transactions': [transaction.to_dict() for transaction in transactions]
+            'transactions': Transaction.bulk_to_dict(transactions),
+            'pagination': pagination
         }), 200
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         logging.error(f"Admin get transactions error: {str(e)}")
         return jsonify({'message': 'Failed to retrieve transactions', 'error': str(e)}), 500
@@ -104,14 +197,15 @@ def get_user(user_id):
         return jsonify({'message': 'User not found'}), 404
     
     accounts = Account.query.filter_by(user_id=user.id).all()
+    balances = current_balances(accounts)
     account_data = []
     
-    for account in accounts:
+    for account, balance in zip(accounts, balances):
         account_data.append({
             'id': account.id,
             'accountNumber': account.account_number,
             'accountType': account.account_type,
-            'balance': account.balance,
+            'balance': balance,
             'currency': 'USD',  # Default currency since it's not stored in the model
             'isActive': account.is_active,
             'createdAt': account.created_at.isoformat()
@@ -150,10 +244,15 @@ def get_dashboard():
     account_count = Account.query.count()
     transaction_count = Transaction.query.count()
     
-    # Calculate total balance - can't use SQL aggregation on encrypted property
-    # Need to iterate and sum manually
-    accounts = Account.query.all()
-    total_balance = sum(account.balance for account in accounts)
+    # Balances are encrypted, so totals come from the maintained per-type
+    # aggregates rather than decrypting every account
+    balance_totals = get_balance_totals()
+    if balance_totals is None:
+        logging.warning("Balance aggregates have not been built; run rebuild_balance_aggregates.py")
+        total_balance = None
+        balance_totals = {}
+    else:
+        total_balance = round(sum(entry['total'] for entry in balance_totals.values()), 2)
     
     # Get recent transactions
     recent_transactions = Transaction.query.order_by(Transaction.created_at.desc()).limit(5).all()
@@ -188,7 +287,8 @@ def get_dashboard():
             'userCount': user_count,
             'accountCount': account_count,
             'transactionCount': transaction_count,
-            'totalBalance': total_balance
+            'totalBalance': total_balance,
+            'balancesByType': balance_totals
         },
         'recentTransactions': tx_data,
         'newUsers': user_data
@@ -3,6 +3,7 @@ IDS API Routes for Security Monitoring
 Provides endpoints for viewing IDS data and managing security
 """
 
+import math
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from ..security.ids import banking_ids
@@ -58,7 +59,8 @@ def get_blocked_ips():
         return jsonify({
             'status': 'success',
             'data': {
-                'blocked_ips': list(banking_ids.blocked_ips)
+                'blocked_ips': sorted(banking_ids.blocked_ips),
+                'blocks': banking_ids.get_blocks()
             }
         }), 200
     except Exception as e:
@@ -67,6 +69,51 @@ def get_blocked_ips():
             'message': f'Failed to get blocked IPs: {str(e)}'
         }), 500
 
+@ids_bp.route('/security/block-ip', methods=['POST'])
+@jwt_required()
+@admin_required
+def block_ip():
+    """Block an IP address or CIDR range, optionally for a number of seconds"""
+    try:
+        data = request.get_json() or {}
+        ip_address = data.get('ip_address')
+        duration = data.get('duration')
+        
+        if not ip_address:
+            return jsonify({
+                'status': 'error',
+                'message': 'IP address is required'
+            }), 400
+        
+        # bool is an int subclass, and JSON NaN/Infinity parse to floats
+        if duration is not None and (
+            isinstance(duration, bool) or not isinstance(duration, (int, float))
+            or not math.isfinite(duration) or duration <= 0
+        ):
+            return jsonify({
+                'status': 'error',
+                'message': 'Duration must be a positive number of seconds'
+            }), 400
+        
+        try:
+            network = banking_ids.block_ip(ip_address, duration, data.get('reason') or 'manual')
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid IP address or CIDR range: {ip_address}'
+            }), 400
+        
+        return jsonify({
+            'status': 'success',
+            'message': f'{network} has been blocked' + (f' for {duration} seconds' if duration else '')
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to block IP: {str(e)}'
+        }), 500
+
 @ids_bp.route('/security/unblock-ip', methods=['POST'])
 @jwt_required()
 @admin_required
@@ -82,7 +129,13 @@ def unblock_ip():
                 'message': 'IP address is required'
             }), 400
         
-        success = banking_ids.unblock_ip(ip_address)
+        try:
+            success = banking_ids.unblock_ip(ip_address)
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid IP address or CIDR range: {ip_address}'
+            }), 400
         
         if success:
             return jsonify({
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models.user import User
@@ -7,8 +7,17 @@ from app.models.transaction import Transaction
 from app.models.payee import Payee
 from app.models.biller import Biller, SavedBiller
 from app.security.digital_signature import hash_data
+from app.utils.pagination import get_page_args, paginate_keyset_union
+from app.security.encryption import decrypt_amounts
+from app.services.idempotency import idempotent
+from app.services.scheduler import FREQUENCIES, build_next_occurrence, parse_datetime
 from app.security.transaction_signer import sign_bank_transaction
+from app.services.transfer_engine import execute_transfer, execute_payment, execute_batch, parse_amount, TransferError
 from datetime import datetime
+from itertools import islice
+import csv
+import io
+import json
 import logging
 import uuid
 
@@ -29,153 +38,171 @@ def get_account_transactions(account_id):
         if account.user_id != current_user_id:
             return jsonify({'message': 'Access denied'}), 403
         
-        # Get all transactions for this account (as source or destination)
-        transactions = Transaction.query.filter(
-            (Transaction.source_account_id == account_id) | 
-            (Transaction.destination_account_id == account_id)
-        ).all()
+        cursor, limit = get_page_args(request.args)
+        
+        # Get one page of transactions for this account (as source or destination),
+        # each side read from its own (account, created_at, id) index
+        transactions, next_cursor = paginate_keyset_union(Transaction, [
+            Transaction.source_account_id == account_id,
+            Transaction.destination_account_id == account_id
+        ], cursor, limit)
         
         return jsonify({
-            'transactions': [transaction.to_dict() for transaction in transactions]
+            'transactions': Transaction.bulk_to_dict(transactions),
+            'next_cursor': next_cursor
         }), 200
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         logging.error(f"Get transactions error: {str(e)}")
         return jsonify({'message': 'Failed to retrieve transactions', 'error': str(e)}), 500
 
+EXPORT_FIELDS = [
+    'id', 'created_at', 'transaction_type', 'direction', 'amount', 'currency',
+    'status', 'description', 'reference', 'source_account_id', 'destination_account_id'
+]
+
+def _export_rows(account_id, start_date=None, end_date=None):
+    """Stream an account's transactions oldest first, decrypting amounts chunk by chunk"""
+    chunk_size = current_app.config.get('EXPORT_CHUNK_SIZE', 1000)
+    
+    query = db.session.query(
+        Transaction.id,
+        Transaction.created_at,
+        Transaction.transaction_type,
+        Transaction.amount_encrypted,
+        Transaction.currency,
+        Transaction.status,
+        Transaction.description,
+        Transaction.reference,
+        Transaction.source_account_id,
+        Transaction.destination_account_id
+    ).filter(
+        (Transaction.source_account_id == account_id) |
+        (Transaction.destination_account_id == account_id)
+    )
+    if start_date:
+        query = query.filter(Transaction.created_at >= start_date)
+    if end_date:
+        query = query.filter(Transaction.created_at < end_date)
+    
+    # Server-side cursor: only one chunk of rows is held in memory at a time
+    rows = iter(query.order_by(Transaction.created_at, Transaction.id)
+                .execution_options(stream_results=True)
+                .yield_per(chunk_size))
+    
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        amounts = decrypt_amounts([row.amount_encrypted for row in chunk])
+        yield [
+            {
+                'id': row.id,
+                'created_at': row.created_at.isoformat() if row.created_at else None,
+                'transaction_type': row.transaction_type,
+                'direction': 'outgoing' if row.source_account_id == account_id else 'incoming',
+                'amount': amount,
+                'currency': row.currency,
+                'status': row.status,
+                'description': row.description,
+                'reference': row.reference,
+                'source_account_id': row.source_account_id,
+                'destination_account_id': row.destination_account_id
+            }
+            for row, amount in zip(chunk, amounts)
+        ]
+
+def _ndjson_chunks(chunks):
+    for records in chunks:
+        yield ''.join(json.dumps(record) + '\n' for record in records)
+
+def _csv_chunks(chunks):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for records in chunks:
+        writer.writerows(records)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+@transaction_bp.route('/account/<account_id>/export', methods=['GET'])
+@jwt_required()
+def export_account_transactions(account_id):
+    """Stream a full account statement as NDJSON or CSV"""
+    current_user_id = get_jwt_identity()
+    account = Account.query.get(account_id)
+    
+    if not account:
+        return jsonify({'message': 'Account not found'}), 404
+        
+    # Security check - ensure the account belongs to the current user
+    if account.user_id != current_user_id:
+        return jsonify({'message': 'Access denied'}), 403
+    
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'message': 'Format must be ndjson or csv'}), 400
+    
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        start_date = datetime.fromisoformat(start_date) if start_date else None
+        end_date = datetime.fromisoformat(end_date) if end_date else None
+    except ValueError:
+        return jsonify({'message': 'Dates must be in ISO format'}), 400
+    
+    chunks = _export_rows(account_id, start_date, end_date)
+    if export_format == 'csv':
+        body, mimetype = _csv_chunks(chunks), 'text/csv'
+    else:
+        body, mimetype = _ndjson_chunks(chunks), 'application/x-ndjson'
+    
+    filename = f"statement-{account.account_number}.{export_format}"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 @transaction_bp.route('/transfer', methods=['POST'])
 @jwt_required()
+@idempotent
 def transfer_money():
     """Transfer money between accounts"""
     try:
         current_user_id = get_jwt_identity()
         data = request.get_json()
         
-        # Get source account
-        source_account = Account.query.get(data['source_account_id'])
-        if not source_account:
-            return jsonify({'message': 'Source account not found'}), 404
-            
-        # Security check - ensure the source account belongs to the current user
-        if source_account.user_id != current_user_id:
-            return jsonify({'message': 'Access denied'}), 403
-            
-        # Get or create system account for external transfers
-        external_system_account = Account.query.filter_by(account_number='SYSTEM-EXTERNAL-BANK').first()
-        if not external_system_account:
-            # Create a system user if it doesn't exist
-            system_user = User.query.filter_by(username='system').first()
-            if not system_user:
-                system_user = User(
-                    username='system',
-                    email='system@bank.internal',
-                    first_name='System',
-                    last_name='Account',
-                    password='$uperSecurePassw0rd!',  # This is never used for login
-                    is_active=True
-                )
-                db.session.add(system_user)
-                db.session.flush()  # Flush to get the ID without committing
-                
-            # Create a system account for external transfers
-            external_system_account = Account(
-                account_number='SYSTEM-EXTERNAL-BANK',
-                account_type='system',
-                user_id=system_user.id,
-                is_active=True
-            )
-            external_system_account.balance = 0.0  # Use the property setter
-            db.session.add(external_system_account)
-            db.session.flush()  # Flush to get the ID without committing
-        
         # Log incoming data for debugging
         logging.info(f"Transfer data: {data}")
         
-        # Determine if this is an internal or external transfer
-        is_internal = 'destination_account_id' in data
-        is_external = 'destination_account_number' in data
+        def respond(transaction):
+            return {
+                'message': 'Transfer completed successfully',
+                'transaction': transaction.to_dict()
+            }, 200
         
-        # Check sufficient balance
-        amount = float(data['amount'])
-        if source_account.balance < amount:
-            return jsonify({'message': 'Insufficient funds'}), 400
-            
-        if is_internal:
-            # Internal transfer between accounts
-            destination_account = Account.query.get(data['destination_account_id'])
-            if not destination_account:
-                return jsonify({'message': 'Destination account not found'}), 404
-              # Create transaction
-            transaction = Transaction(
-                transaction_type='transfer',
-                source_account_id=source_account.id,
-                destination_account_id=destination_account.id,
-                description=data.get('description', 'Funds transfer'),
-                reference=data.get('reference') or f"TRF-{uuid.uuid4().hex[:8].upper()}"
-            )
-            transaction.amount = amount  # This uses the property to encrypt the amount
-            
-            # Update account balances
-            source_account.balance -= amount
-            destination_account.balance += amount
-            
-        elif is_external:
-            # External transfer to another bank
-            destination_number = data['destination_account_number']
-              # Create transaction WITH destination_account_id pointing to the system account
-            transaction = Transaction(
-                transaction_type='external_transfer',
-                source_account_id=source_account.id,
-                destination_account_id=external_system_account.id,  # Use system account as destination
-                description=data.get('description', 'External funds transfer'),
-                reference=data.get('reference') or f"EXT-{uuid.uuid4().hex[:8].upper()}"
-            )
-            transaction.amount = amount
-            
-            # Update source account balance
-            source_account.balance -= amount
-            
-            # Store external account details in meta_data
-            transaction.meta_data = {
-                'destination_account_number': destination_number,
-                'beneficiary_id': data.get('beneficiary_id'),
-                'transaction_type': data.get('transaction_type', 'external_transfer')            }
-        else:
-            return jsonify({'message': 'Either destination_account_id or destination_account_number must be provided'}), 400
-            
-        transaction.status = 'completed'
-        transaction.completed_at = datetime.utcnow()
-        
-        db.session.add(transaction)
-        
-        # Retry database commit if it fails due to locking
-        retry_count = 0
-        max_retries = 3
-        success = False
-        
-        while retry_count < max_retries and not success:
-            try:
-                db.session.commit()
-                success = True
-                # Add digital signature to the transaction AFTER commit when ID is available
-                sign_bank_transaction(transaction)
-                # Commit the signature
-                db.session.commit()
-            except Exception as e:
-                # Log the error
-                logging.error(f"Transfer commit error: {str(e)}")
-                # Roll back the session
-                db.session.rollback()
-                # Increment retry counter
-                retry_count += 1
-                # If we've reached max retries, raise the exception
-                if retry_count >= max_retries:
-                    logging.error("Max retries reached for transfer commit")
-                    raise
+        # Internal transfers name a destination account, external ones an account number
+        body, status = execute_transfer(
+            current_user_id,
+            data['source_account_id'],
+            parse_amount(data.get('amount')),
+            destination_account_id=data.get('destination_account_id'),
+            destination_account_number=data.get('destination_account_number'),
+            description=data.get('description'),
+            reference=data.get('reference'),
+            beneficiary_id=data.get('beneficiary_id'),
+            transaction_type=data.get('transaction_type'),
+            respond=respond
+        )
         
-        return jsonify({
-            'message': 'Transfer completed successfully',
-            'transaction': transaction.to_dict()
-        }), 200
+        return jsonify(body), status
+    except TransferError as e:
+        return jsonify({'message': e.message}), e.status_code
     except Exception as e:
         logging.error(f"Transfer error: {str(e)}")
         db.session.rollback()
@@ -183,6 +210,7 @@ def transfer_money():
 
 @transaction_bp.route('/payment', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_bill_payment():
     """Create a new bill payment transaction"""
     try:
@@ -209,13 +237,7 @@ def create_bill_payment():
         if not biller:
             return jsonify({'message': 'Biller not found'}), 404
         
-        # Check sufficient funds
-        amount = float(data.get('amount', 0))
-        if amount <= 0:
-            return jsonify({'message': 'Invalid amount'}), 400
-            
-        if source_account.balance < amount:
-            return jsonify({'message': 'Insufficient funds'}), 400
+        amount = parse_amount(data.get('amount', 0), 'Invalid amount')
         
         # Determine if this is an immediate or future payment
         payment_date_str = data.get('payment_date')
@@ -228,75 +250,100 @@ def create_bill_payment():
         
         # Is this payment due now or in the future?
         is_immediate = payment_date.date() <= datetime.utcnow().date()
-          # Create the transaction
-        transaction = Transaction(
-            transaction_type='payment',
-            source_account_id=source_account.id,
-            description=data.get('description', f"Payment to {biller.name}"),
-            status='completed' if is_immediate else 'scheduled',
-            reference=data.get('reference_number') or f"PAY-{uuid.uuid4().hex[:6].upper()}"
-        )
-        transaction.amount = amount  # This uses the property to encrypt the amount
         
-        # For immediate payments, update the account balance
-        if is_immediate:
-            source_account.balance -= amount
-            transaction.completed_at = datetime.utcnow()
+        is_recurring = bool(data.get('is_recurring', False))
+        if is_recurring and data.get('frequency') not in FREQUENCIES:
+            return jsonify({'message': f"Frequency must be one of: {', '.join(FREQUENCIES)}"}), 400
+        
+        def build_payment():
+            # Create the transaction (immediate payments are debited by the transfer engine,
+            # future ones by the payment scheduler when they fall due)
+            transaction = Transaction(
+                id=str(uuid.uuid4()),
+                created_at=datetime.utcnow(),
+                transaction_type='payment',
+                source_account_id=source_account.id,
+                description=data.get('description', f"Payment to {biller.name}"),
+                status='completed' if is_immediate else 'scheduled',
+                reference=data.get('reference_number') or f"PAY-{uuid.uuid4().hex[:6].upper()}",
+                scheduled_for=None if is_immediate else parse_datetime(payment_date.isoformat())
+            )
+            
+            # Store metadata about the transaction
+            transaction.meta_data = {
+                'biller_id': biller.id,
+                'biller_name': biller.name,
+                'biller_account_number': data.get('biller_account_number'),
+                'is_recurring': is_recurring,
+                'frequency': data.get('frequency'),
+                'end_date': data.get('end_date'),
+                'payment_date': payment_date.isoformat()        }
+            
+            # Update saved biller's last payment date if using a saved biller
+            if data.get('saved_biller_id'):
+                saved_biller = SavedBiller.query.get(data.get('saved_biller_id'))
+                if saved_biller and saved_biller.user_id == current_user_id:
+                    saved_biller.last_payment_date = datetime.utcnow()
+            
+            # A recurring payment made today is followed by its next scheduled occurrence
+            if is_immediate and is_recurring:
+                transaction.amount = amount
+                upcoming = build_next_occurrence(transaction, amount)
+                if upcoming is not None:
+                    sign_bank_transaction(upcoming)
+                    db.session.add(upcoming)
+            return transaction
+        
+        def respond(transaction):
+            return {
+                'message': 'Payment successful',
+                'transaction': transaction.to_dict()
+            }, 201
         
-        # Store metadata about the transaction
-        transaction.meta_data = {
-            'biller_id': biller.id,
-            'biller_name': biller.name,
-            'biller_account_number': data.get('biller_account_number'),
-            'is_recurring': data.get('is_recurring', False),
-            'frequency': data.get('frequency'),
-            'end_date': data.get('end_date'),
-            'payment_date': payment_date.isoformat()        }
+        body, status = execute_payment(current_user_id, source_account.id, amount, build_payment, respond=respond)
+        return jsonify(body), status
+    except TransferError as e:
+        return jsonify({'message': e.message}), e.status_code
+    except Exception as e:
+        logging.error(f"Payment error: {str(e)}")
+        db.session.rollback()
+        return jsonify({'message': 'Payment failed', 'error': str(e)}), 500
+
+@transaction_bp.route('/batch', methods=['POST'])
+@jwt_required()
+@idempotent
+def create_batch():
+    """Run a batch of transfers and bill payments (e.g. a payroll run) in one request"""
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json() or {}
         
-        db.session.add(transaction)
+        items = data.get('items')
+        if not isinstance(items, list) or not items:
+            return jsonify({'message': 'items must be a non-empty list'}), 400
         
-        # Update saved biller's last payment date if using a saved biller
-        if data.get('saved_biller_id'):
-            saved_biller = SavedBiller.query.get(data.get('saved_biller_id'))
-            if saved_biller and saved_biller.user_id == current_user_id:
-                saved_biller.last_payment_date = datetime.utcnow()
-                
-        # If this is a recurring payment, we would normally create a schedule here
-        # But for now, we'll just store the info in the transaction metadata
+        max_items = current_app.config.get('BATCH_MAX_ITEMS', 1000)
+        if len(items) > max_items:
+            return jsonify({'message': f'A batch can contain at most {max_items} items'}), 400
         
-        # Retry database commit if it fails due to locking
-        retry_count = 0
-        max_retries = 3
-        success = False
+        atomic = bool(data.get('atomic', False))
         
-        while retry_count < max_retries and not success:
-            try:
-                db.session.commit()
-                success = True
-                # Add digital signature to the payment transaction AFTER commit when ID is available
-                sign_bank_transaction(transaction)
-                # Commit the signature
-                db.session.commit()
-            except Exception as e:
-                # Log the error
-                logging.error(f"Payment commit error: {str(e)}")
-                # Roll back the session
-                db.session.rollback()
-                # Increment retry counter
-                retry_count += 1
-                # If we've reached max retries, raise the exception
-                if retry_count >= max_retries:
-                    logging.error("Max retries reached for payment commit")
-                    raise
+        def respond(results):
+            completed = sum(1 for result in results if result['status'] == 'completed')
+            return {
+                'message': 'Batch processed',
+                'completed': completed,
+                'rejected': sum(1 for result in results if result['status'] == 'rejected'),
+                'results': results
+            }, 422 if atomic and completed < len(items) else 200
         
-        return jsonify({
-            'message': 'Payment successful',
-            'transaction': transaction.to_dict()
-        }), 201
+        body, status = execute_batch(current_user_id, items, atomic=atomic, respond=respond)
+        logging.info(f"Batch of {len(items)} items: {body['completed']} completed")
+        return jsonify(body), status
     except Exception as e:
-        logging.error(f"Payment error: {str(e)}")
+        logging.error(f"Batch error: {str(e)}")
         db.session.rollback()
-        return jsonify({'message': 'Payment failed', 'error': str(e)}), 500
+        return jsonify({'message': 'Batch failed', 'error': str(e)}), 500
 
 @transaction_bp.route('/payees', methods=['GET'])
 @jwt_required()
@@ -405,24 +452,29 @@ def get_transactions():
         current_user_id = get_jwt_identity()
         
         # Get query parameters
-        limit = request.args.get('limit', default=20, type=int)
+        cursor, limit = get_page_args(request.args, default_limit=20)
         
         # Find all accounts owned by the user
-        accounts = Account.query.filter_by(user_id=current_user_id).all()
-        account_ids = [account.id for account in accounts]
+        account_ids = [
+            account_id for (account_id,) in
+            Account.query.with_entities(Account.id).filter_by(user_id=current_user_id)
+        ]
         
         if not account_ids:
-            return jsonify({'transactions': []}), 200
+            return jsonify({'transactions': [], 'next_cursor': None}), 200
         
-        # Find all transactions related to any of the user's accounts
-        transactions = Transaction.query.filter(
-            (Transaction.source_account_id.in_(account_ids)) | 
-            (Transaction.destination_account_id.in_(account_ids))
-        ).order_by(Transaction.created_at.desc()).limit(limit).all()
+        # Find one page of transactions related to any of the user's accounts, with
+        # one indexed branch per account and side
+        conditions = [Transaction.source_account_id == account_id for account_id in account_ids] + \
+            [Transaction.destination_account_id == account_id for account_id in account_ids]
+        transactions, next_cursor = paginate_keyset_union(Transaction, conditions, cursor, limit)
         
         return jsonify({
-            'transactions': [transaction.to_dict() for transaction in transactions]
+            'transactions': Transaction.bulk_to_dict(transactions),
+            'next_cursor': next_cursor
         }), 200
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         logging.error(f"Get transactions error: {str(e)}")
         return jsonify({'message': 'Failed to retrieve transactions', 'error': str(e)}), 500
@@ -1,7 +1,8 @@
 # Import security modules
 from app.security.encryption import (
     generate_key_pair, asymmetric_encrypt, asymmetric_decrypt,
-    get_encryption_key, encrypt_data, decrypt_data
+    get_encryption_key, encrypt_data, decrypt_data,
+    get_cipher, get_cipher_stats
 )
 from app.security.hashing import hash_data, verify_hash
 from app.security.digital_signature import sign_data, verify_signature
@@ -0,0 +1,177 @@
+"""
+IP block list with CIDR ranges and expiry
+Blocked networks (single addresses are /32 or /128 networks) are stored in a
+binary prefix trie per IP version, so checking an address walks at most 32 or
+128 nodes however many ranges are blocked. Entries can expire; expired
+entries are ignored on lookup and removed in expiry order from a heap.
+"""
+
+import heapq
+import ipaddress
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Union
+
+@dataclass
+class BlockEntry:
+    """A blocked network"""
+    network: str  # e.g. '203.0.113.0/24', or '198.51.100.7' for a single address
+    expires_at: Optional[float] = None  # Unix time, None for a permanent block
+    reason: str = ''
+    created_at: float = 0.0
+
+    def is_active(self, now: float) -> bool:
+        return self.expires_at is None or self.expires_at > now
+
+    def to_dict(self):
+        return {
+            'network': self.network,
+            'expires_at': self.expires_at,
+            'reason': self.reason,
+            'created_at': self.created_at
+        }
+
+def parse_network(value: str) -> Union[ipaddress.IPv4Network, ipaddress.IPv6Network]:
+    """
+    Parse an IP address or CIDR range (host bits are cleared)
+
+    Raises:
+        ValueError: If the value is not an IP address or network
+    """
+    network = ipaddress.ip_network(value.strip(), strict=False)
+    # Treat IPv4-mapped IPv6 addresses as the IPv4 address they carry
+    if network.version == 6 and network.prefixlen == 128 and network.network_address.ipv4_mapped:
+        network = ipaddress.ip_network(network.network_address.ipv4_mapped)
+    return network
+
+def format_network(network) -> str:
+    """Canonical text of a parsed network: the bare address for a single host"""
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+    return str(network)
+
+def normalize_network(value: str) -> str:
+    """Get the canonical form of an address or CIDR range (raises ValueError)"""
+    return format_network(parse_network(value))
+
+def _parse_address(value: str):
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address
+
+class BlockList:
+    """Blocked networks with longest-prefix lookup
+
+    Trie nodes are [zero child, one child, entry] lists.
+    """
+
+    def __init__(self):
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self._entries = {}  # network string -> BlockEntry
+        self._expiry = []  # (expires_at, network string) heap
+        self._lock = threading.Lock()
+
+    def _path(self, network, create: bool):
+        """Nodes from the root to the network's node (None if missing and not creating)"""
+        node = self._roots[network.version]
+        path = [node]
+        value = int(network.network_address)
+        bits = network.max_prefixlen
+        for i in range(network.prefixlen):
+            bit = (value >> (bits - 1 - i)) & 1
+            child = node[bit]
+            if child is None:
+                if not create:
+                    return None
+                child = node[bit] = [None, None, None]
+            node = child
+            path.append(node)
+        return path
+
+    def add(self, network: str, expires_at: Optional[float] = None, reason: str = '',
+            created_at: Optional[float] = None) -> BlockEntry:
+        """Block a network, replacing any existing block on exactly that network"""
+        now = time.time()
+        parsed = parse_network(network)
+        entry = BlockEntry(format_network(parsed), expires_at, reason, now if created_at is None else created_at)
+        with self._lock:
+            self._path(parsed, create=True)[-1][2] = entry
+            self._entries[entry.network] = entry
+            if expires_at is not None:
+                heapq.heappush(self._expiry, (expires_at, entry.network))
+            self._purge(now)
+        return entry
+
+    def _remove(self, network: str) -> bool:
+        """Remove a network's entry and prune empty nodes (lock held)"""
+        parsed = parse_network(network)
+        path = self._path(parsed, create=False)
+        if path is None or path[-1][2] is None:
+            return False
+        path[-1][2] = None
+        del self._entries[format_network(parsed)]
+
+        # Drop nodes left with no entry and no children, bottom-up
+        value = int(parsed.network_address)
+        bits = parsed.max_prefixlen
+        for depth in range(len(path) - 1, 0, -1):
+            node = path[depth]
+            if node[0] is not None or node[1] is not None or node[2] is not None:
+                break
+            path[depth - 1][(value >> (bits - depth)) & 1] = None
+        return True
+
+    def remove(self, network: str) -> bool:
+        """Unblock exactly this network; returns False if it was not blocked"""
+        with self._lock:
+            return self._remove(network)
+
+    def _purge(self, now: float):
+        """Remove entries whose expiry has passed (lock held)"""
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, network = heapq.heappop(self._expiry)
+            entry = self._entries.get(network)
+            # Skip heap items for blocks that were replaced or removed since
+            if entry is not None and entry.expires_at == expires_at:
+                self._remove(network)
+
+    def match(self, ip_address: str, now: Optional[float] = None) -> Optional[BlockEntry]:
+        """Get the most specific active block covering an address, or None"""
+        address = _parse_address(ip_address)
+        if address is None:
+            return None
+        now = time.time() if now is None else now
+
+        if self._expiry and self._expiry[0][0] <= now:
+            with self._lock:
+                self._purge(now)
+
+        node = self._roots[address.version]
+        value = int(address)
+        found = node[2] if node[2] is not None and node[2].is_active(now) else None
+        for shift in range(address.max_prefixlen - 1, -1, -1):
+            node = node[(value >> shift) & 1]
+            if node is None:
+                break
+            entry = node[2]
+            if entry is not None and entry.is_active(now):
+                found = entry
+        return found
+
+    def __contains__(self, ip_address: str) -> bool:
+        return self.match(ip_address) is not None
+
+    def entries(self, now: Optional[float] = None) -> List[BlockEntry]:
+        """Active blocks, oldest first"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entries = [entry for entry in self._entries.values() if entry.is_active(now)]
+        return sorted(entries, key=lambda entry: entry.created_at)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,133 @@
+"""
+Bounded tracking tables for the IDS
+A dict-like table with a maximum size and a time-to-live per entry, so state
+keyed by client IP or user cannot grow without limit under a scan from
+rotating addresses. Sizes and evictions are reported in the metrics.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+from app.utils.metrics import ids_table_entries, ids_table_evictions
+
+_MISSING = object()
+
+class BoundedTTLTable:
+    """Table whose entries expire `ttl` seconds after last use, holding at most `max_entries`
+
+    Entries are kept in order of last use, so the expired ones are always at
+    the front: writes sweep a few of them and, when the table is full, evict
+    the least recently used entry. Every operation is O(1) amortised.
+
+    Args:
+        name (str): Table name in the metrics
+        max_entries (int): Capacity
+        ttl (float): Seconds an unused entry is kept
+        default_factory (callable): Creates missing entries on table[key], as defaultdict does
+    """
+
+    SWEEP_LIMIT = 64  # Expired entries removed per write
+
+    def __init__(self, name: str, max_entries: int, ttl: float,
+                 default_factory: Optional[Callable[[], Any]] = None, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.default_factory = default_factory
+        self.clock = clock
+        self._data = OrderedDict()  # key -> [value, last used]
+        self._lock = threading.Lock()
+        self.evictions = {'expired': 0, 'capacity': 0}
+
+    def _evict(self, now: float):
+        """Drop expired entries from the front, then trim to capacity (lock held)"""
+        expired = 0
+        data = self._data
+        while data and expired < self.SWEEP_LIMIT:
+            key, entry = next(iter(data.items()))
+            if now - entry[1] < self.ttl:
+                break
+            del data[key]
+            expired += 1
+
+        evicted = 0
+        while len(data) > self.max_entries:
+            data.popitem(last=False)
+            evicted += 1
+
+        if expired:
+            self.evictions['expired'] += expired
+            ids_table_evictions.inc(expired, table=self.name, reason='expired')
+        if evicted:
+            self.evictions['capacity'] += evicted
+            ids_table_evictions.inc(evicted, table=self.name, reason='capacity')
+        ids_table_entries.set(len(data), table=self.name)
+
+    def _get(self, key, now: float):
+        """Get a live value and mark it used, or _MISSING (lock held)"""
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        if now - entry[1] >= self.ttl:
+            del self._data[key]
+            self.evictions['expired'] += 1
+            ids_table_evictions.inc(table=self.name, reason='expired')
+            return _MISSING
+        entry[1] = now
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def _set(self, key, value, now: float):
+        self._data[key] = [value, now]
+        self._data.move_to_end(key)
+        self._evict(now)
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._get(key, self.clock())
+        return default if value is _MISSING else value
+
+    def __getitem__(self, key):
+        with self._lock:
+            now = self.clock()
+            value = self._get(key, now)
+            if value is _MISSING:
+                if self.default_factory is None:
+                    raise KeyError(key)
+                value = self.default_factory()
+                self._set(key, value, now)
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._set(key, value, self.clock())
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and self.clock() - entry[1] < self.ttl
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            ids_table_entries.set(len(self._data), table=self.name)
+        return default if entry is None else entry[0]
+
+    def __len__(self):
+        return len(self._data)
+
+    def items(self):
+        """Live (key, value) pairs, least recently used first"""
+        now = self.clock()
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._data.items() if now - entry[1] < self.ttl]
+
+    def get_stats(self):
+        """Get size and eviction counters"""
+        return {
+            'entries': len(self._data),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'evictions': dict(self.evictions)
+        }
@@ -1,8 +1,10 @@
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, ed25519
 from cryptography.exceptions import InvalidSignature
 import base64
+from functools import lru_cache
+from app.utils.metrics import track_crypto
 
 def sign_data(private_key_pem, data):
     """Create a digital signature for the provided data"""
@@ -75,46 +77,124 @@ def hash_data(data):
     digest.update(data.encode('utf-8') if isinstance(data, str) else data)
     return digest.finalize()
 
+@lru_cache(maxsize=16)
+def _load_private_key(private_key_pem):
+    """Parse a PEM private key once and reuse the key object"""
+    return serialization.load_pem_private_key(private_key_pem, password=None)
+
+@lru_cache(maxsize=16)
+def _load_public_key(public_key_pem):
+    """Parse a PEM public key once and reuse the key object"""
+    return serialization.load_pem_public_key(public_key_pem)
+
+_PSS_PADDING = padding.PSS(
+    mgf=padding.MGF1(hashes.SHA256()),
+    salt_length=padding.PSS.MAX_LENGTH
+)
+
+class RSAPSSAlgorithm:
+    """RSA-2048 with PSS padding and SHA-256 (the original bank signature scheme)"""
+    name = 'rsa-pss-sha256'
+    key_types = (rsa.RSAPrivateKey, rsa.RSAPublicKey)
+    
+    def generate_private_key(self):
+        return rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=2048,
+            backend=default_backend()
+        )
+    
+    def sign(self, private_key, data):
+        return private_key.sign(data, _PSS_PADDING, hashes.SHA256())
+    
+    def verify(self, public_key, data, signature):
+        public_key.verify(signature, data, _PSS_PADDING, hashes.SHA256())
+
+class Ed25519Algorithm:
+    """Ed25519 - much faster signing and 64-byte signatures"""
+    name = 'ed25519'
+    key_types = (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)
+    
+    def generate_private_key(self):
+        return ed25519.Ed25519PrivateKey.generate()
+    
+    def sign(self, private_key, data):
+        return private_key.sign(data)
+    
+    def verify(self, public_key, data, signature):
+        public_key.verify(signature, data)
+
+# Signatures without an algorithm tag predate this registry and are RSA-PSS
+DEFAULT_SIGNATURE_ALGORITHM = RSAPSSAlgorithm.name
+
+SIGNATURE_ALGORITHMS = {
+    algorithm.name: algorithm
+    for algorithm in (RSAPSSAlgorithm(), Ed25519Algorithm())
+}
+
+def get_signature_algorithm(name=None):
+    """Look up a signature algorithm by name"""
+    name = name or DEFAULT_SIGNATURE_ALGORITHM
+    if name not in SIGNATURE_ALGORITHMS:
+        raise ValueError(f"Unsupported signature algorithm: {name}")
+    return SIGNATURE_ALGORITHMS[name]
+
+def algorithm_for_key(key):
+    """Get the signature algorithm that matches a private or public key"""
+    for algorithm in SIGNATURE_ALGORITHMS.values():
+        if isinstance(key, algorithm.key_types):
+            return algorithm
+    raise ValueError(f"Unsupported signing key type: {type(key).__name__}")
+
+def verify_with_public_key(public_key, data, signature, algorithm_name=None):
+    """Verify a binary signature over raw bytes with a parsed public key"""
+    algorithm = SIGNATURE_ALGORITHMS.get(algorithm_name) if algorithm_name else algorithm_for_key(public_key)
+    
+    # The key must belong to the algorithm the signature claims to use
+    if algorithm is None or not isinstance(public_key, algorithm.key_types):
+        return False
+    
+    try:
+        with track_crypto('verify'):
+            algorithm.verify(public_key, data, signature)
+        return True
+    except InvalidSignature:
+        return False
+
+class TransactionSigner:
+    """Signs transaction data with an already-parsed private key"""
+    
+    def __init__(self, private_key):
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.algorithm = algorithm_for_key(private_key)
+    
+    @classmethod
+    def from_pem(cls, private_key_pem):
+        """Create a signer from PEM private key bytes"""
+        return cls(_load_private_key(private_key_pem))
+    
+    def sign(self, data):
+        """Sign raw bytes and return the binary signature"""
+        with track_crypto('sign'):
+            return self.algorithm.sign(self.private_key, data)
+    
+    def verify(self, data, signature):
+        """Verify a binary signature over raw bytes"""
+        return verify_with_public_key(self.public_key, data, signature, self.algorithm.name)
+
 def sign_transaction(transaction_data, private_key_pem):
     """Sign transaction data with private key"""
-    # Load the private key
-    private_key = serialization.load_pem_private_key(
-        private_key_pem,
-        password=None
-    )
-    
     # Ensure transaction_data is properly encoded
     data_to_sign = transaction_data.encode('utf-8') if isinstance(transaction_data, str) else transaction_data
     
-    # Sign the data using PSS padding with SHA-256
-    signature = private_key.sign(
-        data_to_sign,
-        padding.PSS(
-            mgf=padding.MGF1(hashes.SHA256()),
-            salt_length=padding.PSS.MAX_LENGTH
-        ),
-        hashes.SHA256()
-    )
-    
-    # Return raw binary signature data
-    return signature
+    # Sign with the key's algorithm (the parsed key is cached per PEM)
+    return TransactionSigner(_load_private_key(private_key_pem)).sign(data_to_sign)
 
 def verify_transaction(transaction_data, signature, public_key_pem):
     """Verify transaction signature with public key"""
-    # Load the public key
-    public_key = serialization.load_pem_public_key(public_key_pem)
+    # Load the public key (parsed once per PEM)
+    public_key = _load_public_key(public_key_pem)
     
-    try:
-        # Verify the signature
-        public_key.verify(
-            signature,
-            transaction_data.encode('utf-8') if isinstance(transaction_data, str) else transaction_data,
-            padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ),
-            hashes.SHA256()
-        )
-        return True
-    except InvalidSignature:
-        return False
\ No newline at end of file
+    data = transaction_data.encode('utf-8') if isinstance(transaction_data, str) else transaction_data
+    return verify_with_public_key(public_key, data, signature)
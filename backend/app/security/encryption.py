@@ -4,27 +4,162 @@ from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.fernet import Fernet
 import base64
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
+from app.utils.metrics import track_crypto
 
 # Symmetric key encryption (for data at rest)
-def get_encryption_key():
+def _derive_key():
+    """Derive the Fernet key from the app's SYMMETRIC_KEY (None outside an app)"""
     try:
         key = current_app.config['SYMMETRIC_KEY']
         # Ensure the key is valid for Fernet (32 url-safe base64-encoded bytes)
         return base64.urlsafe_b64encode(key.encode()[:32].ljust(32, b' '))
     except:
+        return None
+
+def get_encryption_key():
+    key = _derive_key()
+    if key is None:
         # For testing/development only - in production, this would come from a secure source
         return Fernet.generate_key()
+    return key
+
+class CipherRegistry:
+    """Key-versioned cache of Fernet ciphers shared across threads
+    
+    Ciphers are built once per derived key, so a changed SYMMETRIC_KEY
+    gets a new cipher (and version) instead of reusing a stale one, and
+    the ciphers for the keys it replaced are dropped.
+    """
+    
+    def __init__(self):
+        self._ciphers = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+    
+    def get_cipher(self):
+        """Return the Fernet cipher for the current app's key"""
+        key = _derive_key()
+        if key is None:
+            # No app context - keep the old throwaway-key behaviour, uncached
+            with self._lock:
+                self.misses += 1
+            return Fernet(Fernet.generate_key())
+        
+        with self._lock:
+            cipher = self._ciphers.get(key)
+            if cipher is not None:
+                self.hits += 1
+                return cipher[1]
+            
+            self.misses += 1
+            self.version += 1
+            cipher = (self.version, Fernet(key))
+            self._ciphers.clear()
+            self._ciphers[key] = cipher
+        return cipher[1]
+    
+    def clear(self):
+        """Drop all cached ciphers"""
+        with self._lock:
+            self._ciphers.clear()
+    
+    def get_stats(self):
+        """Get cache hit/miss counters"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'cached_ciphers': len(self._ciphers),
+                'key_version': self.version
+            }
+
+# Global cipher registry
+cipher_registry = CipherRegistry()
+
+def get_cipher():
+    """Get the cached Fernet cipher for the current key"""
+    return cipher_registry.get_cipher()
+
+def get_cipher_stats():
+    """Get cipher registry hit/miss counters"""
+    return cipher_registry.get_stats()
 
 def encrypt_data(data):
     """Encrypt data using symmetric key encryption"""
-    cipher = Fernet(get_encryption_key())
-    return cipher.encrypt(data)
+    with track_crypto('encrypt'):
+        return get_cipher().encrypt(data)
 
 def decrypt_data(encrypted_data):
     """Decrypt data using symmetric key encryption"""
-    cipher = Fernet(get_encryption_key())
-    return cipher.decrypt(encrypted_data)
+    with track_crypto('decrypt'):
+        return get_cipher().decrypt(encrypted_data)
+
+_decrypt_pool = None
+_decrypt_pool_size = 0
+_decrypt_pool_lock = threading.Lock()
+
+def _get_decrypt_pool(max_workers):
+    """Get the shared thread pool used for bulk decryption, and its size
+    
+    The pool is created once, sized from BULK_DECRYPT_WORKERS (or the first
+    caller's max_workers outside an app); callers asking for more threads
+    are capped at that size rather than getting a new pool.
+    """
+    global _decrypt_pool, _decrypt_pool_size
+    with _decrypt_pool_lock:
+        if _decrypt_pool is None:
+            try:
+                size = current_app.config.get('BULK_DECRYPT_WORKERS', 0)
+            except RuntimeError:
+                size = 0
+            _decrypt_pool_size = size if size > 1 else max_workers
+            _decrypt_pool = ThreadPoolExecutor(max_workers=_decrypt_pool_size, thread_name_prefix='decrypt')
+        return _decrypt_pool, _decrypt_pool_size
+
+def decrypt_many(encrypted_values, max_workers=None):
+    """Decrypt a whole result set with a single cipher lookup
+    
+    Args:
+        encrypted_values (iterable): Encrypted tokens to decrypt
+        max_workers (int): Threads to spread the work over. Defaults to the
+            app's BULK_DECRYPT_WORKERS setting; 0 or 1 decrypts inline.
+        
+    Returns:
+        list: Decrypted bytes, in the same order as the input
+    """
+    values = list(encrypted_values)
+    with track_crypto('decrypt_bulk', len(values)):
+        return _decrypt_many(values, max_workers)
+
+def _decrypt_many(values, max_workers):
+    cipher = get_cipher()
+    
+    min_parallel = 0
+    if max_workers is None:
+        try:
+            max_workers = current_app.config.get('BULK_DECRYPT_WORKERS', 0)
+            min_parallel = current_app.config.get('BULK_DECRYPT_MIN_ROWS', 0)
+        except RuntimeError:
+            max_workers = 0
+    
+    if max_workers <= 1 or len(values) < max(min_parallel, max_workers):
+        return [cipher.decrypt(value) for value in values]
+    
+    # Split into one chunk per worker so each task amortises the pool overhead
+    pool, pool_size = _get_decrypt_pool(max_workers)
+    chunk_size = -(-len(values) // min(max_workers, pool_size))
+    chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+    results = pool.map(lambda chunk: [cipher.decrypt(value) for value in chunk], chunks)
+    return [value for chunk in results for value in chunk]
+
+def decrypt_amounts(encrypted_values, max_workers=None):
+    """Decrypt a list of encrypted amounts/balances to floats"""
+    return [float(value.decode('utf-8')) for value in decrypt_many(encrypted_values, max_workers)]
 
 # Asymmetric key encryption (for secure key exchange)
 def generate_key_pair():
@@ -10,8 +10,11 @@ from collections import defaultdict, deque
 from datetime import datetime, timedelta
 from dataclasses import dataclass
 from typing import Dict, List, Optional
-import re
 import ipaddress
+from .blocklist import normalize_network
+from .bounded_table import BoundedTTLTable
+from .ids_state import IDSStateBackend, LocalStateBackend
+from .threat_matcher import ThreatMatcher, ThreatRule, DEFAULT_RULES
 
 # Configure logging for IDS
 logging.basicConfig(
@@ -34,19 +37,11 @@ class SecurityEvent:
 class IntrusionDetectionSystem:
     """Basic Intrusion Detection System for banking application"""
     
-    def __init__(self):
-        # Request tracking
-        self.request_history = defaultdict(lambda: deque(maxlen=100))
-        self.failed_logins = defaultdict(lambda: deque(maxlen=10))
-        self.user_sessions = defaultdict(dict)
-        
-        # Threat patterns
-        self.suspicious_patterns = [
-            r'(union|select|insert|delete|drop|exec|script)',  # SQL injection
-            r'(<script|javascript:|vbscript:)',  # XSS attempts
-            r'(\.\.\/|\.\.\\)',  # Path traversal
-            r'(eval\(|exec\()',  # Code injection
-        ]
+    def __init__(self, state_backend: Optional[IDSStateBackend] = None, max_entries: int = 100000):
+        self.start_time = time.time()
+        
+        # Threat signatures, compiled into a single-pass matcher
+        self.threat_matcher = ThreatMatcher(DEFAULT_RULES)
         
         # Rate limiting thresholds
         self.rate_limits = {
@@ -54,13 +49,91 @@ class IntrusionDetectionSystem:
             'api_requests': {'limit': 100, 'window': 60},   # 100 requests per minute
             'failed_auth': {'limit': 3, 'window': 180},     # 3 failures per 3 minutes
         }
+        self.login_endpoints = {'auth.login', '/api/auth/login'}
         
-        # Security events storage
-        self.security_events = deque(maxlen=1000)
-        self.blocked_ips = set()
+        # An IP's n-th automatic block lasts block_durations[n - 1] seconds (the
+        # last one repeats); offences are forgotten after the backend's strike TTL
+        self.block_durations = [300, 3600, 86400]
+        
+        # Request tracking (this process only; decisions use the state backend).
+        # Keyed by IP, so bounded and expired to survive scans from rotating IPs
+        self.request_history = BoundedTTLTable(
+            'request_history', max_entries, self.rate_limits['api_requests']['window'], lambda: deque(maxlen=100)
+        )
+        self.failed_logins = BoundedTTLTable(
+            'failed_logins', max_entries, self.rate_limits['failed_auth']['window'], lambda: deque(maxlen=10)
+        )
+        
+        # Rate counters, blocked IPs, sessions and events, shared by all
+        # workers unless the backend is local
+        self.state = state_backend or LocalStateBackend(self.rate_limits, max_entries=max_entries)
         
         ids_logger.info("🛡️ Banking IDS initialized successfully")
     
+    def set_table_limit(self, max_entries: int):
+        """Set how many IPs the request and failed login tables track"""
+        self.request_history.max_entries = max_entries
+        self.failed_logins.max_entries = max_entries
+    
+    def get_table_stats(self) -> Dict:
+        """Get size and eviction counters of the tracking tables"""
+        return {
+            'request_history': self.request_history.get_stats(),
+            'failed_logins': self.failed_logins.get_stats()
+        }
+    
+    def set_state_backend(self, state_backend: IDSStateBackend):
+        """Switch to a different state backend (e.g. one shared by all workers)"""
+        self.state = state_backend
+        ids_logger.info(f"IDS state backend: {type(state_backend).__name__}")
+    
+    @property
+    def blocked_ips(self) -> set:
+        """Currently blocked IP addresses and CIDR ranges"""
+        return {entry.network for entry in self.state.get_blocked_ips()}
+    
+    def get_blocks(self) -> List[Dict]:
+        """Get the active blocks with their expiry"""
+        return [
+            {
+                'network': entry.network,
+                'reason': entry.reason,
+                'blocked_at': datetime.fromtimestamp(entry.created_at).isoformat(),
+                'expires_at': datetime.fromtimestamp(entry.expires_at).isoformat() if entry.expires_at else None
+            }
+            for entry in self.state.get_blocked_ips()
+        ]
+    
+    def block_ip(self, network: str, duration: Optional[float] = None, reason: str = 'manual') -> str:
+        """
+        Block an IP address or CIDR range
+        
+        Args:
+            network (str): e.g. '198.51.100.7', '203.0.113.0/24' or '2001:db8::/32'
+            duration (float): Seconds until the block expires; None blocks permanently
+            
+        Returns:
+            str: The blocked network in canonical form
+            
+        Raises:
+            ValueError: If the address or range is malformed
+        """
+        network = normalize_network(network)
+        expires_at = time.time() + duration if duration else None
+        self.state.block_ip(network, expires_at, reason)
+        ids_logger.warning(f"⛔ {network} blocked {f'for {duration:.0f}s' if duration else 'permanently'}: {reason}")
+        return network
+    
+    def _block_offender(self, source_ip: str, reason: str):
+        """Block an IP for longer each time it offends"""
+        try:
+            offences = self.state.record_offence(source_ip)
+            duration = self.block_durations[min(offences, len(self.block_durations)) - 1]
+            self.block_ip(source_ip, duration, f"{reason} (offence {offences})")
+        except ValueError:
+            # Not an IP address (e.g. 'unknown'), so there is nothing to block
+            pass
+    
     def analyze_request(self, request_data: Dict) -> Optional[SecurityEvent]:
         """Analyze incoming request for threats"""
         
@@ -73,19 +146,20 @@ class IntrusionDetectionSystem:
         
         current_time = datetime.now()
         
-        # Check if IP is already blocked
-        if source_ip in self.blocked_ips:
+        # Check if IP (or a range containing it) is already blocked
+        block = self.state.get_block(source_ip)
+        if block:
             return self._create_event(
                 'blocked_ip_attempt',
                 'high',
                 source_ip,
                 user_id,
                 f"Request from blocked IP: {source_ip}",
-                {'endpoint': endpoint, 'method': method}
+                {'endpoint': endpoint, 'method': method, 'blocked_network': block.network, 'expires_at': block.expires_at}
             )
         
         # Rate limiting analysis
-        rate_limit_event = self._check_rate_limits(source_ip, user_id, current_time)
+        rate_limit_event = self._check_rate_limits(source_ip, user_id, endpoint)
         if rate_limit_event:
             return rate_limit_event
         
@@ -114,44 +188,69 @@ class IntrusionDetectionSystem:
         
         return None
     
-    def _check_rate_limits(self, source_ip: str, user_id: Optional[str], current_time: datetime) -> Optional[SecurityEvent]:
+    def _check_rate_limits(self, source_ip: str, user_id: Optional[str], endpoint: str) -> Optional[SecurityEvent]:
         """Check for rate limiting violations"""
         
         # Check API request rate
-        recent_requests = [
-            req for req in self.request_history[source_ip]
-            if current_time - req['timestamp'] < timedelta(seconds=self.rate_limits['api_requests']['window'])
-        ]
+        api_limit = self.rate_limits['api_requests']
+        request_count = round(self.state.hit('api_requests', source_ip))
         
-        if len(recent_requests) > self.rate_limits['api_requests']['limit']:
+        if request_count > api_limit['limit']:
             # Temporarily block IP
-            self.blocked_ips.add(source_ip)
+            self._block_offender(source_ip, 'API rate limit exceeded')
             return self._create_event(
                 'rate_limit_exceeded',
                 'medium',
                 source_ip,
                 user_id,
-                f"API rate limit exceeded: {len(recent_requests)} requests in {self.rate_limits['api_requests']['window']}s",
-                {'request_count': len(recent_requests), 'limit': self.rate_limits['api_requests']['limit']}
+                f"API rate limit exceeded: {request_count} requests in {api_limit['window']}s",
+                {'request_count': request_count, 'limit': api_limit['limit']}
             )
         
+        # Check login attempt rate
+        if endpoint in self.login_endpoints:
+            login_limit = self.rate_limits['login_attempts']
+            attempt_count = round(self.state.hit('login_attempts', source_ip))
+            
+            if attempt_count > login_limit['limit']:
+                return self._create_event(
+                    'login_rate_exceeded',
+                    'high',
+                    source_ip,
+                    user_id,
+                    f"Login attempt limit exceeded: {attempt_count} attempts in {login_limit['window']}s",
+                    {'attempt_count': attempt_count, 'limit': login_limit['limit']}
+                )
+        
         return None
     
+    def set_rules(self, rules: List[ThreatRule]):
+        """Replace the threat signature rules"""
+        self.threat_matcher = ThreatMatcher(rules)
+        ids_logger.info(f"Loaded {len(rules)} threat rules ({self.threat_matcher.signature_count} signatures)")
+    
     def _check_malicious_patterns(self, payload: str, source_ip: str, user_id: Optional[str], endpoint: str) -> Optional[SecurityEvent]:
         """Check for malicious patterns in request payload"""
         
-        payload_lower = payload.lower()
+        if not payload:
+            return None
         
-        for pattern in self.suspicious_patterns:
-            if re.search(pattern, payload_lower, re.IGNORECASE):
-                return self._create_event(
-                    'malicious_pattern_detected',
-                    'high',
-                    source_ip,
-                    user_id,
-                    f"Malicious pattern detected: {pattern}",
-                    {'endpoint': endpoint, 'pattern': pattern, 'payload_snippet': payload[:100]}
-                )
+        match = self.threat_matcher.match(payload)
+        if match:
+            return self._create_event(
+                'malicious_pattern_detected',
+                match.rule.severity,
+                source_ip,
+                user_id,
+                f"Malicious pattern detected: {match.rule.name} ({match.matched})",
+                {
+                    'endpoint': endpoint,
+                    'rule': match.rule.name,
+                    'category': match.rule.category,
+                    'pattern': match.matched,
+                    'payload_snippet': payload[:100]
+                }
+            )
         
         return None
     
@@ -181,8 +280,9 @@ class IntrusionDetectionSystem:
             return None
         
         # Check for multiple IPs for same user (session hijacking)
-        if user_id in self.user_sessions:
-            last_ip = self.user_sessions[user_id].get('last_ip')
+        session = self.state.get_session(user_id)
+        if session:
+            last_ip = session.get('last_ip')
             if last_ip and last_ip != source_ip:
                 # Check if IPs are from different regions (simplified)
                 if not self._are_ips_similar(last_ip, source_ip):
@@ -196,11 +296,11 @@ class IntrusionDetectionSystem:
                     )
         
         # Update user session
-        self.user_sessions[user_id] = {
+        self.state.set_session(user_id, {
             'last_ip': source_ip,
-            'last_access': current_time,
+            'last_access': current_time.isoformat(),
             'last_endpoint': endpoint
-        }
+        })
         
         return None
     
@@ -219,44 +319,44 @@ class IntrusionDetectionSystem:
         
         current_time = datetime.now()
         self.failed_logins[source_ip].append({
-            'timestamp': current_time,
+            'timestamp': current_time.isoformat(),
             'user_id': user_id,
             'reason': reason
         })
         
         # Check for brute force attempts
-        recent_failures = [
-            failure for failure in self.failed_logins[source_ip]
-            if current_time - failure['timestamp'] < timedelta(seconds=self.rate_limits['failed_auth']['window'])
-        ]
+        failure_count = round(self.state.hit('failed_auth', source_ip))
         
-        if len(recent_failures) >= self.rate_limits['failed_auth']['limit']:
+        if failure_count >= self.rate_limits['failed_auth']['limit']:
+            recent_failures = list(self.failed_logins[source_ip])[-3:]
             event = self._create_event(
                 'brute_force_attempt',
                 'critical',
                 source_ip,
                 user_id,
-                f"Brute force login attempt detected: {len(recent_failures)} failures",
-                {'failure_count': len(recent_failures), 'recent_failures': recent_failures[-3:]}
+                f"Brute force login attempt detected: {failure_count} failures",
+                {'failure_count': failure_count, 'recent_failures': recent_failures}
             )
             
             # Block IP for brute force
-            self.blocked_ips.add(source_ip)
+            self._block_offender(source_ip, 'Brute force login attempt')
+            self.state.reset('failed_auth', source_ip)
             self._log_security_event(event)
     
     def record_successful_login(self, source_ip: str, user_id: str):
         """Record successful login"""
         
         # Clear failed attempts for this IP
-        if source_ip in self.failed_logins:
-            self.failed_logins[source_ip].clear()
+        self.failed_logins.pop(source_ip)
+        self.state.reset('failed_auth', source_ip)
         
         # Update user session
-        self.user_sessions[user_id] = {
+        now = datetime.now().isoformat()
+        self.state.set_session(user_id, {
             'last_ip': source_ip,
-            'last_access': datetime.now(),
-            'login_time': datetime.now()
-        }
+            'last_access': now,
+            'login_time': now
+        })
     
     def _create_event(self, event_type: str, severity: str, source_ip: str, user_id: Optional[str], description: str, details: Dict) -> SecurityEvent:
         """Create a security event"""
@@ -277,7 +377,16 @@ class IntrusionDetectionSystem:
     def _log_security_event(self, event: SecurityEvent):
         """Log security event"""
         
-        self.security_events.append(event)
+        self.state.add_event({
+            'timestamp': event.timestamp.isoformat(),
+            'created_at': event.timestamp.timestamp(),
+            'type': event.event_type,
+            'severity': event.severity,
+            'source_ip': event.source_ip,
+            'user_id': event.user_id,
+            'description': event.description,
+            'details': event.details
+        })
         
         # Log with appropriate level
         log_level = {
@@ -295,47 +404,34 @@ class IntrusionDetectionSystem:
     def get_security_status(self) -> Dict:
         """Get current security status"""
         
-        current_time = datetime.now()
-        recent_events = [
-            event for event in self.security_events
-            if current_time - event.timestamp < timedelta(hours=24)
-        ]
+        recent_events = self.state.get_events(since=time.time() - 24 * 3600)
         
         # Count events by severity
         severity_counts = defaultdict(int)
         for event in recent_events:
-            severity_counts[event.severity] += 1
+            severity_counts[event['severity']] += 1
         
         return {
             'total_events_24h': len(recent_events),
             'severity_breakdown': dict(severity_counts),
-            'blocked_ips': list(self.blocked_ips),
-            'active_sessions': len(self.user_sessions),
+            'blocked_ips': sorted(self.blocked_ips),
+            'active_sessions': self.state.session_count(),
+            'tracking_tables': self.get_table_stats(),
             'status': 'SECURE' if severity_counts['critical'] == 0 else 'ALERT'
         }
     
     def get_recent_events(self, limit: int = 10) -> List[Dict]:
         """Get recent security events"""
         
-        recent = list(self.security_events)[-limit:]
         return [
-            {
-                'timestamp': event.timestamp.isoformat(),
-                'type': event.event_type,
-                'severity': event.severity,
-                'source_ip': event.source_ip,
-                'user_id': event.user_id,
-                'description': event.description,
-                'details': event.details
-            }
-            for event in recent
+            {key: value for key, value in event.items() if key != 'created_at'}
+            for event in self.state.get_events(limit=limit)
         ]
     
     def unblock_ip(self, ip_address: str) -> bool:
-        """Manually unblock an IP address"""
+        """Manually unblock an IP address or CIDR range (raises ValueError if malformed)"""
         
-        if ip_address in self.blocked_ips:
-            self.blocked_ips.remove(ip_address)
+        if self.state.unblock_ip(normalize_network(ip_address)):
             ids_logger.info(f"✅ IP {ip_address} has been unblocked")
             return True
         return False
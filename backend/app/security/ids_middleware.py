@@ -5,8 +5,37 @@ Integrates the Intrusion Detection System with Flask requests
 
 from flask import request, jsonify, g
 from functools import wraps
+import logging
 import time
 from .ids import banking_ids
+from .threat_matcher import load_rules
+from .ids_state import create_state_backend
+from app.utils.metrics import ids_decisions
+
+ids_logger = logging.getLogger('banking_ids')
+
+def _analyze(request_data):
+    """
+    Run the IDS on a request, letting it through if the state backend fails
+    
+    A busy or damaged state store must not turn every request into a 500, so
+    the error is logged and the request is handled as if nothing was found.
+    """
+    try:
+        return banking_ids.analyze_request(request_data)
+    except Exception:
+        ids_logger.exception("IDS state backend error; letting the request through")
+        ids_decisions.inc(decision='error', event_type='none')
+        return False
+
+def _record_decision(security_event):
+    """Count the IDS decision for a request in the metrics"""
+    if security_event is None:
+        ids_decisions.inc(decision='allowed', event_type='none')
+    elif security_event.severity in ['high', 'critical']:
+        ids_decisions.inc(decision='blocked', event_type=security_event.event_type)
+    else:
+        ids_decisions.inc(decision='flagged', event_type=security_event.event_type)
 
 def ids_monitor():
     """Decorator to monitor requests with IDS"""
@@ -24,7 +53,9 @@ def ids_monitor():
             }
             
             # Analyze request for threats
-            security_event = banking_ids.analyze_request(request_data)
+            security_event = _analyze(request_data)
+            if security_event is not False:
+                _record_decision(security_event)
             
             if security_event:
                 # Block request if it's a security threat
@@ -48,15 +79,39 @@ def ids_monitor():
 
 def log_failed_login(source_ip: str, user_id: str = None, reason: str = "Invalid credentials"):
     """Log failed login attempt to IDS"""
-    banking_ids.record_failed_login(source_ip, user_id, reason)
+    try:
+        banking_ids.record_failed_login(source_ip, user_id, reason)
+    except Exception:
+        ids_logger.exception("IDS state backend error while recording a failed login")
 
 def log_successful_login(source_ip: str, user_id: str):
     """Log successful login to IDS"""
-    banking_ids.record_successful_login(source_ip, user_id)
+    try:
+        banking_ids.record_successful_login(source_ip, user_id)
+    except Exception:
+        ids_logger.exception("IDS state backend error while recording a login")
 
 def init_ids_middleware(app):
     """Initialize IDS middleware with Flask app"""
     
+    # Share rate counters, blocks, sessions and events between workers (if configured)
+    max_entries = app.config.get('IDS_TABLE_MAX_ENTRIES', 100000)
+    banking_ids.set_table_limit(max_entries)
+    banking_ids.set_state_backend(create_state_backend(
+        app.config.get('IDS_STATE_BACKEND', 'local'),
+        banking_ids.rate_limits,
+        app.config.get('IDS_STATE_PATH'),
+        max_entries=max_entries,
+        session_ttl=app.config.get('IDS_SESSION_TTL', 86400),
+        strike_ttl=app.config.get('IDS_BLOCK_STRIKE_TTL', 604800)
+    ))
+    banking_ids.block_durations = app.config.get('IDS_BLOCK_DURATIONS') or banking_ids.block_durations
+    
+    # Replace the built-in threat signatures with a rule file, if configured
+    rules_path = app.config.get('IDS_RULES_PATH')
+    if rules_path:
+        banking_ids.set_rules(load_rules(rules_path))
+    
     @app.before_request
     def ids_before_request():
         """Monitor all incoming requests for security threats"""
@@ -79,7 +134,9 @@ def init_ids_middleware(app):
         }
         
         # Analyze request for threats
-        security_event = banking_ids.analyze_request(request_data)
+        security_event = _analyze(request_data)
+        if security_event is not False:
+            _record_decision(security_event)
         
         if security_event:
             # Block request if it's a security threat
@@ -96,7 +153,7 @@ def init_ids_middleware(app):
         """Get IDS system status"""
         return jsonify({
             'status': 'active',
-            'total_events': len(banking_ids.security_events),
+            'total_events': banking_ids.state.event_count(),
             'blocked_ips': len(banking_ids.blocked_ips),
             'uptime': time.time() - banking_ids.start_time
         })
@@ -0,0 +1,414 @@
+"""
+IDS state backends
+The IDS keeps rate counters, blocked IPs, user sessions and security events
+in a state backend, so that with several worker processes every worker makes
+the same decisions and the admin views show the whole server's state.
+
+LocalStateBackend keeps everything in the process (one worker only).
+SQLiteStateBackend shares state between the workers on one host through a
+SQLite database in WAL mode on local disk, so the hot path is a local file
+read rather than a network round trip. Another store (e.g. Redis) can be
+added by implementing IDSStateBackend.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from .blocklist import BlockEntry, BlockList, normalize_network
+from .bounded_table import BoundedTTLTable
+from .rate_limit import RateLimiter, window_count, window_hit
+
+class IDSStateBackend:
+    """Interface for IDS state storage
+
+    Rate limits are named as in IntrusionDetectionSystem.rate_limits. Events
+    and sessions are JSON-serialisable dicts.
+    """
+
+    def hit(self, name: str, key: str, now: Optional[float] = None) -> float:
+        """Record a hit against a named rate limit; returns the hits in its window"""
+        raise NotImplementedError
+
+    def reset(self, name: str, key: str):
+        """Forget a key's hits for a named rate limit"""
+        raise NotImplementedError
+
+    def get_block(self, ip_address: str) -> Optional[BlockEntry]:
+        """Get the active block covering an address (its own or a range's), or None"""
+        raise NotImplementedError
+
+    def block_ip(self, network: str, expires_at: Optional[float] = None, reason: str = ''):
+        """Block an address or CIDR range until expires_at (None = permanently)"""
+        raise NotImplementedError
+
+    def unblock_ip(self, network: str) -> bool:
+        """Remove the block on exactly this address or range; returns False if there was none"""
+        raise NotImplementedError
+
+    def get_blocked_ips(self) -> List[BlockEntry]:
+        """Get the active blocks"""
+        raise NotImplementedError
+
+    def record_offence(self, ip_address: str) -> int:
+        """Count a blockable offence; returns the address's offences within the strike TTL"""
+        raise NotImplementedError
+
+    def get_session(self, user_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def set_session(self, user_id: str, session: Dict):
+        raise NotImplementedError
+
+    def session_count(self) -> int:
+        raise NotImplementedError
+
+    def add_event(self, event: Dict):
+        raise NotImplementedError
+
+    def get_events(self, limit: Optional[int] = None, since: Optional[float] = None) -> List[Dict]:
+        """Get events, oldest first: the last `limit`, or those after the `since` timestamp"""
+        raise NotImplementedError
+
+    def event_count(self) -> int:
+        raise NotImplementedError
+
+class LocalStateBackend(IDSStateBackend):
+    """In-process state: each worker process has its own
+
+    Rate counters, sessions and offence counts are bounded tables, holding at
+    most `max_entries` keys each; sessions expire `session_ttl` seconds after
+    the user's last request and offences `strike_ttl` seconds after the last.
+    """
+
+    def __init__(self, rate_limits: Dict[str, Dict], max_events: int = 1000,
+                 max_entries: int = 100000, session_ttl: float = 86400, strike_ttl: float = 604800):
+        self.rate_limiter = RateLimiter(rate_limits, max_entries)
+        self.blocklist = BlockList()
+        self.offences = BoundedTTLTable('block_offences', max_entries, strike_ttl)
+        self.sessions = BoundedTTLTable('sessions', max_entries, session_ttl)
+        self.events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    def hit(self, name, key, now=None):
+        return self.rate_limiter.hit(name, key, now)
+
+    def reset(self, name, key):
+        self.rate_limiter.reset(name, key)
+
+    def get_block(self, ip_address):
+        return self.blocklist.match(ip_address)
+
+    def block_ip(self, network, expires_at=None, reason=''):
+        self.blocklist.add(network, expires_at, reason)
+
+    def unblock_ip(self, network):
+        return self.blocklist.remove(network)
+
+    def get_blocked_ips(self):
+        return self.blocklist.entries()
+
+    def record_offence(self, ip_address):
+        with self._lock:
+            count = self.offences.get(ip_address, 0) + 1
+            self.offences[ip_address] = count
+        return count
+
+    def get_session(self, user_id):
+        return self.sessions.get(user_id)
+
+    def set_session(self, user_id, session):
+        self.sessions[user_id] = session
+
+    def session_count(self):
+        return len(self.sessions)
+
+    def add_event(self, event):
+        self.events.append(event)
+
+    def get_events(self, limit=None, since=None):
+        with self._lock:
+            events = list(self.events)
+        if since is not None:
+            events = [event for event in events if event['created_at'] >= since]
+        return events[-limit:] if limit else events
+
+    def event_count(self):
+        return len(self.events)
+
+class SQLiteStateBackend(IDSStateBackend):
+    """State shared by all worker processes on a host through a WAL-mode SQLite file
+
+    Each thread uses its own connection. Rate counter updates run in a
+    BEGIN IMMEDIATE transaction, so concurrent workers never lose a hit.
+    Counters that have run down and sessions idle for `session_ttl` seconds
+    are deleted every PRUNE_INTERVAL seconds.
+
+    Each process keeps the blocks in its own BlockList trie and, before each
+    lookup, applies the block rows changed since its last look (every change
+    takes the next number from a sequence). Unblocked rows stay as tombstones
+    for TOMBSTONE_TTL seconds so every worker sees the removal; a worker idle
+    for longer reloads all blocks.
+    """
+
+    PRUNE_INTERVAL = 60
+    TOMBSTONE_TTL = 3600
+
+    def __init__(self, path: str, rate_limits: Dict[str, Dict], max_events: int = 1000,
+                 session_ttl: float = 86400, strike_ttl: float = 604800):
+        self.path = path
+        self.windows = {name: settings['window'] for name, settings in rate_limits.items()}
+        self.max_events = max_events
+        self.session_ttl = session_ttl
+        self.strike_ttl = strike_ttl
+        self._local = threading.local()
+        self._next_prune = 0.0
+
+        self._blocklist = BlockList()
+        self._block_seq = 0
+        self._blocks_synced_at = 0.0
+        self._block_lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_counters ("
+                "name TEXT NOT NULL, key TEXT NOT NULL, window_number INTEGER NOT NULL, "
+                "previous INTEGER NOT NULL, current INTEGER NOT NULL, PRIMARY KEY (name, key))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ip_blocks ("
+                "network TEXT PRIMARY KEY, expires_at REAL, reason TEXT NOT NULL DEFAULT '', "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "removed INTEGER NOT NULL DEFAULT 0, seq INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_ip_blocks_seq ON ip_blocks (seq)")
+            conn.execute("CREATE TABLE IF NOT EXISTS ids_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO ids_meta (key, value) VALUES ('block_seq', 0)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ip_offences ("
+                "ip TEXT PRIMARY KEY, count INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+            # Carry over permanent blocks from state files that predate block expiry
+            legacy = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'blocked_ips'"
+            ).fetchone()
+            if legacy:
+                for ip_address, blocked_at in conn.execute("SELECT ip, blocked_at FROM blocked_ips").fetchall():
+                    self._write_block(conn, ip_address, None, '', blocked_at)
+                conn.execute("DROP TABLE blocked_ips")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "user_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL DEFAULT 0)"
+            )
+            # State files created before sessions expired have no updated_at
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+            if 'updated_at' not in columns:
+                conn.execute("ALTER TABLE sessions ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_events_created_at ON events (created_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are not carried across a fork (e.g. gunicorn --preload)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            # A failed COMMIT (e.g. SQLITE_BUSY) leaves the transaction open on this
+            # thread's connection; some errors have already rolled it back
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def prune(self, now: Optional[float] = None):
+        """Delete rate counters that have run down and expired sessions"""
+        now = time.time() if now is None else now
+        with self._transaction() as conn:
+            for name, window in self.windows.items():
+                conn.execute(
+                    "DELETE FROM rate_counters WHERE name = ? AND window_number < ?",
+                    (name, int(now // window) - 1)
+                )
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.session_ttl,))
+            conn.execute("DELETE FROM ip_offences WHERE updated_at < ?", (now - self.strike_ttl,))
+            # Expired blocks are ignored by every worker's trie already
+            conn.execute(
+                "DELETE FROM ip_blocks WHERE expires_at < ? OR (removed = 1 AND updated_at < ?)",
+                (now, now - self.TOMBSTONE_TTL)
+            )
+
+    def hit(self, name, key, now=None):
+        now = time.time() if now is None else now
+        if now >= self._next_prune:
+            self._next_prune = now + self.PRUNE_INTERVAL
+            self.prune(now)
+        window = self.windows[name]
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT window_number, previous, current FROM rate_counters WHERE name = ? AND key = ?",
+                (name, key)
+            ).fetchone()
+            state = window_hit(list(row) if row else None, now, window)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_counters (name, key, window_number, previous, current) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (name, key, *state)
+            )
+        return window_count(state, now, window)
+
+    def reset(self, name, key):
+        self._connection().execute("DELETE FROM rate_counters WHERE name = ? AND key = ?", (name, key))
+
+    def _next_block_seq(self, conn) -> int:
+        conn.execute("UPDATE ids_meta SET value = value + 1 WHERE key = 'block_seq'")
+        return conn.execute("SELECT value FROM ids_meta WHERE key = 'block_seq'").fetchone()[0]
+
+    def _write_block(self, conn, network, expires_at, reason, created_at):
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO ip_blocks "
+            "(network, expires_at, reason, created_at, updated_at, removed, seq) VALUES (?, ?, ?, ?, ?, 0, ?)",
+            (normalize_network(network), expires_at, reason, created_at or now, now, self._next_block_seq(conn))
+        )
+
+    def _sync_blocks(self):
+        """Bring this process's trie up to date with the block rows"""
+        now = time.time()
+        conn = self._connection()
+        with self._block_lock:
+            if now - self._blocks_synced_at > self.TOMBSTONE_TTL:
+                # Tombstones this process has not seen may be gone: reload everything.
+                # The sequence is read first, so a concurrent change is applied again next time
+                seq = conn.execute("SELECT value FROM ids_meta WHERE key = 'block_seq'").fetchone()[0]
+                rows = conn.execute(
+                    "SELECT network, expires_at, reason, created_at, removed, seq FROM ip_blocks WHERE removed = 0"
+                ).fetchall()
+                self._blocklist = BlockList()
+            else:
+                seq = self._block_seq
+                rows = conn.execute(
+                    "SELECT network, expires_at, reason, created_at, removed, seq FROM ip_blocks "
+                    "WHERE seq > ? ORDER BY seq",
+                    (seq,)
+                ).fetchall()
+
+            for network, expires_at, reason, created_at, removed, row_seq in rows:
+                if removed:
+                    self._blocklist.remove(network)
+                else:
+                    self._blocklist.add(network, expires_at, reason, created_at)
+                seq = max(seq, row_seq)
+
+            self._block_seq = seq
+            self._blocks_synced_at = now
+
+    def get_block(self, ip_address):
+        self._sync_blocks()
+        return self._blocklist.match(ip_address)
+
+    def block_ip(self, network, expires_at=None, reason=''):
+        with self._transaction() as conn:
+            self._write_block(conn, network, expires_at, reason, None)
+
+    def unblock_ip(self, network):
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE ip_blocks SET removed = 1, updated_at = ?, seq = ? "
+                "WHERE network = ? AND removed = 0 AND (expires_at IS NULL OR expires_at > ?)",
+                (now, self._next_block_seq(conn), normalize_network(network), now)
+            )
+        return cursor.rowcount > 0
+
+    def get_blocked_ips(self):
+        self._sync_blocks()
+        return self._blocklist.entries()
+
+    def record_offence(self, ip_address):
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT count, updated_at FROM ip_offences WHERE ip = ?", (ip_address,)).fetchone()
+            count = row[0] + 1 if row and row[1] >= now - self.strike_ttl else 1
+            conn.execute(
+                "INSERT OR REPLACE INTO ip_offences (ip, count, updated_at) VALUES (?, ?, ?)",
+                (ip_address, count, now)
+            )
+        return count
+
+    def get_session(self, user_id):
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE user_id = ? AND updated_at >= ?", (user_id, time.time() - self.session_ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_session(self, user_id, session):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO sessions (user_id, data, updated_at) VALUES (?, ?, ?)",
+            (user_id, json.dumps(session), time.time())
+        )
+
+    def session_count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def add_event(self, event):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO events (created_at, data) VALUES (?, ?)",
+                (event['created_at'], json.dumps(event, default=str))
+            )
+            # Keep the newest max_events
+            conn.execute("DELETE FROM events WHERE id <= ?", (cursor.lastrowid - self.max_events,))
+
+    def get_events(self, limit=None, since=None):
+        query = "SELECT data FROM events"
+        params = []
+        if since is not None:
+            query += " WHERE created_at >= ?"
+            params.append(since)
+        query += " ORDER BY id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self._connection().execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def event_count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+def create_state_backend(name: str, rate_limits: Dict[str, Dict], path: Optional[str] = None,
+                         max_entries: int = 100000, session_ttl: float = 86400,
+                         strike_ttl: float = 604800) -> IDSStateBackend:
+    """
+    Create a state backend by name ('local' or 'sqlite')
+
+    Raises:
+        ValueError: If the backend is unknown or sqlite has no path
+    """
+    if name == 'local':
+        return LocalStateBackend(rate_limits, max_entries=max_entries, session_ttl=session_ttl, strike_ttl=strike_ttl)
+    if name == 'sqlite':
+        if not path:
+            raise ValueError("The sqlite IDS state backend needs IDS_STATE_PATH")
+        return SQLiteStateBackend(path, rate_limits, session_ttl=session_ttl, strike_ttl=strike_ttl)
+    raise ValueError(f"Unknown IDS state backend: {name}")
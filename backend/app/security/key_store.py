@@ -0,0 +1,154 @@
+"""
+Bank signing key store
+Loads the bank's signing keys from disk once and keeps the parsed key objects
+in memory, generating and saving a key on first run
+"""
+
+from cryptography.hazmat.primitives import serialization
+from app.security.digital_signature import TransactionSigner, get_signature_algorithm
+import logging
+import os
+import tempfile
+import threading
+
+key_logger = logging.getLogger('banking_keys')
+
+class BankKeyStore:
+    """Disk-backed store of bank signing keys, addressed by key ID"""
+
+    def __init__(self, key_dir: str, active_key_id: str, algorithm: str = None):
+        self.key_dir = key_dir
+        self.active_key_id = active_key_id
+        # Only used when generating new keys; existing keys keep their own type
+        self.algorithm = get_signature_algorithm(algorithm)
+        self._private_keys = {}
+        self._public_keys = {}
+        self._signers = {}
+        self._lock = threading.Lock()
+
+    def _private_key_path(self, key_id: str) -> str:
+        return os.path.join(self.key_dir, f"{key_id}.pem")
+
+    def _public_key_path(self, key_id: str) -> str:
+        return os.path.join(self.key_dir, f"{key_id}.pub.pem")
+
+    def _write_once(self, path: str, data: bytes):
+        """Write a file only if it does not exist yet (safe across worker processes)"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.key_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # link() fails if another worker already saved this key, in which case theirs wins
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+
+    def _generate_key(self, key_id: str):
+        """Generate a new signing key and save it to disk"""
+        os.makedirs(self.key_dir, exist_ok=True)
+
+        private_key = self.algorithm.generate_private_key()
+
+        self._write_once(self._private_key_path(key_id), private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        ))
+        # Another worker may have saved its key first; the public half must match whichever won
+        with open(self._private_key_path(key_id), 'rb') as f:
+            private_key = serialization.load_pem_private_key(f.read(), password=None)
+        self._write_once(self._public_key_path(key_id), private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ))
+        key_logger.info(f"Generated new {self.algorithm.name} bank signing key '{key_id}' in {self.key_dir}")
+
+    def _load(self, key_id: str, create: bool):
+        """Load a key pair from disk into memory (caller holds the lock)"""
+        private_path = self._private_key_path(key_id)
+        public_path = self._public_key_path(key_id)
+
+        if not os.path.exists(private_path) and not os.path.exists(public_path):
+            if not create:
+                raise KeyError(f"Unknown signing key: {key_id}")
+            self._generate_key(key_id)
+
+        if os.path.exists(private_path):
+            with open(private_path, 'rb') as f:
+                private_key = serialization.load_pem_private_key(f.read(), password=None)
+            self._private_keys[key_id] = private_key
+            self._public_keys[key_id] = private_key.public_key()
+        else:
+            # Retired keys may only keep their public half for verification
+            with open(public_path, 'rb') as f:
+                self._public_keys[key_id] = serialization.load_pem_public_key(f.read())
+
+    def get_private_key(self, key_id: str = None):
+        """Get the parsed private key (defaults to the active key)"""
+        key_id = key_id or self.active_key_id
+        key = self._private_keys.get(key_id)
+        if key is None:
+            with self._lock:
+                if key_id not in self._private_keys:
+                    self._load(key_id, create=(key_id == self.active_key_id))
+                key = self._private_keys.get(key_id)
+            if key is None:
+                raise KeyError(f"No private key available for: {key_id}")
+        return key
+
+    def get_public_key(self, key_id: str = None):
+        """Get the parsed public key (defaults to the active key)"""
+        key_id = key_id or self.active_key_id
+        key = self._public_keys.get(key_id)
+        if key is None:
+            with self._lock:
+                if key_id not in self._public_keys:
+                    self._load(key_id, create=(key_id == self.active_key_id))
+                key = self._public_keys[key_id]
+        return key
+
+    def get_signer(self, key_id: str = None) -> TransactionSigner:
+        """Get a signer holding the parsed private key (defaults to the active key)"""
+        key_id = key_id or self.active_key_id
+        signer = self._signers.get(key_id)
+        if signer is None:
+            signer = TransactionSigner(self.get_private_key(key_id))
+            self._signers[key_id] = signer
+        return signer
+
+    def get_private_key_pem(self, key_id: str = None) -> bytes:
+        """Get the private key as PEM bytes"""
+        return self.get_private_key(key_id).private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        )
+
+    def get_public_key_pem(self, key_id: str = None) -> bytes:
+        """Get the public key as PEM bytes"""
+        return self.get_public_key(key_id).public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+
+    def rotate(self, new_key_id: str, algorithm: str = None):
+        """Make a new key the active signing key; older keys stay available for verification"""
+        with self._lock:
+            if algorithm:
+                self.algorithm = get_signature_algorithm(algorithm)
+            if new_key_id not in self._private_keys:
+                self._load(new_key_id, create=True)
+            self.active_key_id = new_key_id
+        key_logger.info(f"Active bank signing key is now '{new_key_id}'")
+
+    def key_ids(self):
+        """List the IDs of all keys saved on disk"""
+        if not os.path.isdir(self.key_dir):
+            return []
+        return sorted({
+            name[:-len('.pub.pem')] if name.endswith('.pub.pem') else name[:-len('.pem')]
+            for name in os.listdir(self.key_dir)
+            if name.endswith('.pem')
+        })
@@ -0,0 +1,75 @@
+"""
+SHA-256 Merkle trees for batch transaction signatures
+One signature over the root covers every transaction in the batch; each
+transaction keeps the inclusion proof linking its own hash to that root
+"""
+
+from app.security.digital_signature import hash_data
+
+# Domain separation so a leaf can never be passed off as an interior node
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+def merkle_leaf(data):
+    """Hash transaction data into a Merkle leaf"""
+    data = data.encode('utf-8') if isinstance(data, str) else data
+    return hash_data(LEAF_PREFIX + data)
+
+def _merkle_node(left, right):
+    return hash_data(NODE_PREFIX + left + right)
+
+def build_merkle_tree(leaves):
+    """
+    Build a Merkle tree from leaf hashes
+
+    Args:
+        leaves (list): Leaf hashes (bytes), in batch order
+
+    Returns:
+        list: Tree levels from the leaves up to the single root hash
+    """
+    if not leaves:
+        raise ValueError("Cannot build a Merkle tree without leaves")
+
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_merkle_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        # An odd node is promoted unchanged rather than paired with itself
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+def merkle_root(levels):
+    """Get the root hash of a tree built by build_merkle_tree"""
+    return levels[-1][0]
+
+def merkle_proof(levels, index):
+    """
+    Get the inclusion proof for the leaf at the given index
+
+    Returns:
+        list: Sibling hashes as {'hash': hex, 'position': 'left'|'right'}, leaf to root
+    """
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({
+                'hash': level[sibling].hex(),
+                'position': 'left' if sibling < index else 'right'
+            })
+        index //= 2
+    return proof
+
+def verify_merkle_proof(leaf, proof, root):
+    """Check that a leaf hash is included under the given root hash"""
+    node = leaf
+    for step in proof:
+        sibling = bytes.fromhex(step['hash'])
+        if step['position'] == 'left':
+            node = _merkle_node(sibling, node)
+        else:
+            node = _merkle_node(node, sibling)
+    return node == root
@@ -0,0 +1,94 @@
+"""
+Constant-time rate counters for the IDS
+Each key keeps two fixed-window counts (the current and previous window). The
+number of hits in the last `window` seconds is estimated by weighting the
+previous window's count by how much of it still overlaps, which approximates
+a sliding-window log with a few integers per key and no per-hit history.
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+from .bounded_table import BoundedTTLTable
+
+def window_count(state: Optional[list], now: float, window: float) -> float:
+    """Hits in the window ending now, given a key's [window number, previous, current]"""
+    if state is None:
+        return 0.0
+    window_number = int(now // window)
+    number, previous, current = state
+    if number == window_number:
+        pass
+    elif number == window_number - 1:
+        previous, current = current, 0
+    else:
+        return 0.0
+    overlap = 1.0 - (now % window) / window
+    return previous * overlap + current
+
+def window_hit(state: Optional[list], now: float, window: float) -> list:
+    """Get a key's state after one more hit (the input is not modified)"""
+    window_number = int(now // window)
+    if state is None or state[0] < window_number - 1:
+        return [window_number, 0, 1]
+    if state[0] == window_number - 1:
+        return [window_number, state[2], 1]
+    return [window_number, state[1], state[2] + 1]
+
+class SlidingWindowCounter:
+    """Per-key hit counter over a sliding time window
+
+    A key's counts are all zero two windows after its last hit, so keys are
+    forgotten after that; at most `max_entries` keys are tracked.
+    """
+
+    def __init__(self, limit: int, window: float, max_entries: int = 100000, name: str = 'rate_counter'):
+        self.limit = limit
+        self.window = window
+        # key -> [window number, previous window count, current window count]
+        self._counts = BoundedTTLTable(name, max_entries, 2 * window)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, now: Optional[float] = None) -> float:
+        """Record a hit and return the hits in the window, including this one"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._counts[key] = window_hit(self._counts.get(key), now, self.window)
+            return window_count(state, now, self.window)
+
+    def count(self, key: str, now: Optional[float] = None) -> float:
+        """Get the hits in the window without recording one"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return window_count(self._counts.get(key), now, self.window)
+
+    def reset(self, key: str):
+        """Forget a key's hits"""
+        self._counts.pop(key, None)
+
+    def __len__(self):
+        return len(self._counts)
+
+class RateLimiter:
+    """One sliding-window counter per named limit
+
+    Args:
+        rate_limits (dict): Limit name -> {'limit': hits, 'window': seconds}
+        max_entries (int): Keys tracked per limit
+    """
+
+    def __init__(self, rate_limits: Dict[str, Dict], max_entries: int = 100000):
+        self.counters = {
+            name: SlidingWindowCounter(settings['limit'], settings['window'], max_entries, f'rate_{name}')
+            for name, settings in rate_limits.items()
+        }
+
+    def hit(self, name: str, key: str, now: Optional[float] = None) -> float:
+        """Record a hit against a named limit; returns the hits in its window"""
+        return self.counters[name].hit(key, now)
+
+    def count(self, name: str, key: str, now: Optional[float] = None) -> float:
+        return self.counters[name].count(key, now)
+
+    def reset(self, name: str, key: str):
+        self.counters[name].reset(key)
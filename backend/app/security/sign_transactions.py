@@ -21,21 +21,22 @@ def get_transaction_signature_details(transaction):
         'signature': None,
         'signed_by': None,
         'signed_at': None,
-        'signature_type': None
+        'signature_type': None,
+        'signature_status': 'unsigned'
     }
     
     # Check for string signature in meta_data
-    if transaction.meta_data and isinstance(transaction.meta_data, dict):
-        if 'string_signature' in transaction.meta_data:
-            result['has_signature'] = True
-            result['signature'] = transaction.meta_data['string_signature']
-            result['signature_type'] = 'string'
+    if (transaction.meta_data and isinstance(transaction.meta_data, dict)
+            and 'string_signature' in transaction.meta_data):
+        result['has_signature'] = True
+        result['signature'] = transaction.meta_data['string_signature']
+        result['signature_type'] = 'string'
+        
+        if 'signed_by' in transaction.meta_data:
+            result['signed_by'] = transaction.meta_data['signed_by']
             
-            if 'signed_by' in transaction.meta_data:
-                result['signed_by'] = transaction.meta_data['signed_by']
-                
-            if 'signed_at' in transaction.meta_data:
-                result['signed_at'] = transaction.meta_data['signed_at']
+        if 'signed_at' in transaction.meta_data:
+            result['signed_at'] = transaction.meta_data['signed_at']
     
     # Check for digital signature in the dedicated column
     elif transaction.digital_signature:
@@ -45,11 +46,25 @@ def get_transaction_signature_details(transaction):
         
         # Try to get signer information from meta_data
         if transaction.meta_data and isinstance(transaction.meta_data, dict):
+            signature_info = transaction.meta_data.get('signature_info') or {}
+            
             if 'signed_by' in transaction.meta_data:
                 result['signed_by'] = transaction.meta_data['signed_by']
+            elif 'signed_by' in signature_info:
+                result['signed_by'] = signature_info['signed_by']
                 
             if 'signed_at' in transaction.meta_data:
                 result['signed_at'] = transaction.meta_data['signed_at']
+            elif 'signed_at' in signature_info:
+                result['signed_at'] = signature_info['signed_at']
+    
+    # Signed, or committed and still waiting for the background signer
+    if result['has_signature']:
+        result['signature_status'] = 'signed'
+    elif transaction.meta_data and isinstance(transaction.meta_data, dict):
+        signature_info = transaction.meta_data.get('signature_info') or {}
+        if signature_info.get('status') == 'pending':
+            result['signature_status'] = 'pending'
     
     return result
 
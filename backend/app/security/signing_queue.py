@@ -0,0 +1,241 @@
+"""
+Background transaction signing
+Signs committed transactions off the request path and writes the signatures
+back in batched UPDATEs. Failed batches are retried with backoff, and a sweep
+(at startup, then every SIGNING_SWEEP_INTERVAL seconds) re-queues committed
+transactions still waiting for a signature, such as those left in the queue
+of a process that stopped.
+"""
+
+from app import db
+from app.models.transaction import Transaction
+from app.security.transaction_signer import (
+    create_bank_signature, create_batch_signatures, sign_bank_transaction
+)
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+signing_logger = logging.getLogger('banking_signing')
+
+class SigningQueue:
+    """Bounded queue of transaction IDs drained by a pool of signing workers"""
+
+    STARTUP_SWEEP_DELAY = 5  # Seconds
+
+    def __init__(self):
+        self.app = None
+        self.queue = None
+        self.workers = []
+        self.batch_size = 50
+        self.batch_wait = 0.05
+        self.mode = 'single'
+        self.max_retries = 3
+        self.retry_backoff = 1.0
+        self.sweep_interval = 300
+        self.sweep_grace = 60
+        self.signed_count = 0
+        self.failed_count = 0
+        self.retried_count = 0
+        self.swept_count = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.queue is not None
+
+    def init_app(self, app):
+        """Start the signing workers if ASYNC_SIGNING_ENABLED is set"""
+        if not app.config.get('ASYNC_SIGNING_ENABLED', False) or self.enabled:
+            return
+
+        self.app = app
+        self.queue = queue.Queue(maxsize=app.config.get('SIGNING_QUEUE_SIZE', 10000))
+        self.batch_size = app.config.get('SIGNING_BATCH_SIZE', 50)
+        self.batch_wait = app.config.get('SIGNING_BATCH_WAIT', 0.05)
+        self.mode = app.config.get('SIGNING_MODE', 'single')
+        self.max_retries = app.config.get('SIGNING_MAX_RETRIES', 3)
+        self.retry_backoff = app.config.get('SIGNING_RETRY_BACKOFF', 1.0)
+        self.sweep_interval = app.config.get('SIGNING_SWEEP_INTERVAL', 300)
+        self.sweep_grace = app.config.get('SIGNING_SWEEP_GRACE', 60)
+
+        for i in range(app.config.get('SIGNING_WORKERS', 2)):
+            worker = threading.Thread(target=self._worker, name=f"signing-worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+        sweeper = threading.Thread(target=self._sweeper, name="signing-sweeper", daemon=True)
+        sweeper.start()
+
+        signing_logger.info(f"Background signing enabled with {len(self.workers)} workers ({self.mode} mode)")
+
+    def submit(self, transaction_id: str) -> bool:
+        """Queue a committed transaction for signing; False if signing must happen inline"""
+        if not self.enabled:
+            return False
+        try:
+            self.queue.put_nowait(transaction_id)
+            return True
+        except queue.Full:
+            signing_logger.warning(f"Signing queue full, signing transaction {transaction_id} inline")
+            return False
+
+    def pending_count(self) -> int:
+        return self.queue.qsize() if self.enabled else 0
+
+    def _next_batch(self):
+        """Block for one transaction ID, then gather more for up to batch_wait seconds"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._sign_with_retry(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _sign_with_retry(self, batch):
+        """Sign a batch, retrying with exponential backoff; a batch that still fails is left to the sweep"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.app.app_context():
+                    self.sign_batch(batch)
+                self.signed_count += len(batch)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed_count += len(batch)
+                    signing_logger.error(f"Failed to sign batch of {len(batch)} transactions "
+                                         f"after {attempt + 1} attempts: {str(e)}")
+                    return
+                self.retried_count += 1
+                delay = self.retry_backoff * (2 ** attempt)
+                signing_logger.warning(f"Signing batch of {len(batch)} transactions failed, "
+                                       f"retrying in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+
+    def _sweeper(self):
+        # The first sweep waits for the app to finish starting up
+        time.sleep(self.STARTUP_SWEEP_DELAY)
+        while True:
+            try:
+                with self.app.app_context():
+                    swept = self.sweep()
+                if swept:
+                    signing_logger.info(f"Re-queued {swept} transactions awaiting a signature")
+            except Exception as e:
+                signing_logger.error(f"Signing sweep failed: {str(e)}")
+            time.sleep(self.sweep_interval)
+
+    def sweep(self) -> int:
+        """
+        Queue committed transactions still marked pending, oldest first
+
+        Transactions queued in the last sweep_grace seconds are skipped, as
+        they are most likely still in some worker's queue. Only as many as the
+        queue has room for are queued; the rest wait for the next sweep.
+
+        Returns:
+            int: Number of transactions queued
+        """
+        room = self.queue.maxsize - self.queue.qsize() if self.queue.maxsize else self.batch_size * 100
+        if room <= 0:
+            return 0
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.sweep_grace)
+            rows = db.session.query(Transaction.id, Transaction.meta_data).filter(
+                Transaction.digital_signature.is_(None),
+                Transaction.created_at <= cutoff
+            ).order_by(Transaction.created_at).limit(room).all()
+        finally:
+            db.session.remove()
+
+        swept = 0
+        for transaction_id, meta_data in rows:
+            signature_info = (meta_data or {}).get('signature_info') or {}
+            if signature_info.get('status') != 'pending':
+                continue
+            try:
+                self.queue.put_nowait(transaction_id)
+            except queue.Full:
+                break
+            swept += 1
+        self.swept_count += swept
+        return swept
+
+    def sign_batch(self, transaction_ids):
+        """Sign a batch of committed transactions and write them back in one UPDATE"""
+        try:
+            transactions = Transaction.query.filter(
+                Transaction.id.in_(transaction_ids),
+                Transaction.digital_signature.is_(None)
+            ).all()
+
+            if self.mode == 'merkle':
+                # One signature over the batch's Merkle root
+                signatures = create_batch_signatures(transactions)
+            else:
+                signatures = [create_bank_signature(transaction) for transaction in transactions]
+
+            mappings = []
+            for transaction, (signature, meta_data) in zip(transactions, signatures):
+                mappings.append({
+                    'id': transaction.id,
+                    'digital_signature': signature,
+                    'meta_data': meta_data
+                })
+
+            if mappings:
+                db.session.bulk_update_mappings(Transaction, mappings)
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+# Global signing queue instance
+signing_queue = SigningQueue()
+
+def init_signing_queue(app):
+    """Initialize background signing with the Flask app"""
+    signing_queue.init_app(app)
+
+def mark_signature_pending(transaction):
+    """Record on a transaction that its signature will be added in the background"""
+    meta_data = dict(transaction.meta_data or {})
+    meta_data['signature_info'] = {
+        'status': 'pending',
+        'queued_at': datetime.utcnow().isoformat()
+    }
+    transaction.meta_data = meta_data
+
+def sign_or_enqueue(transaction):
+    """
+    Sign a committed transaction in the background, or inline if the queue is off or full
+
+    Args:
+        transaction (Transaction): A transaction that has already been committed
+
+    Returns:
+        bool: True if the transaction was queued, False if it was signed inline
+    """
+    if signing_queue.submit(transaction.id):
+        return True
+
+    sign_bank_transaction(transaction)
+    db.session.commit()
+    return False
@@ -0,0 +1,160 @@
+"""
+Single-pass threat signature matcher for the IDS
+Literal signatures are compiled into one Aho-Corasick automaton, so a payload
+is scanned once, at a constant cost per character however many signatures
+are loaded. Rules that need a real regular expression are combined into one
+alternation with a named group per rule.
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+@dataclass
+class ThreatRule:
+    """A named group of signatures reported as one threat"""
+    name: str
+    category: str
+    severity: str = 'high'  # 'low', 'medium', 'high', 'critical'
+    signatures: List[str] = field(default_factory=list)  # Case-insensitive substrings
+    regex: Optional[str] = None  # Case-insensitive regular expression
+
+@dataclass
+class ThreatMatch:
+    """The rule that matched a payload and where"""
+    rule: ThreatRule
+    matched: str
+    position: int
+
+# The IDS's original patterns, as literal signatures
+DEFAULT_RULES = [
+    ThreatRule('sql_injection', 'injection', signatures=['union', 'select', 'insert', 'delete', 'drop', 'exec', 'script']),
+    ThreatRule('xss', 'xss', signatures=['<script', 'javascript:', 'vbscript:']),
+    ThreatRule('path_traversal', 'traversal', signatures=['../', '..\\']),
+    ThreatRule('code_injection', 'injection', signatures=['eval(', 'exec(']),
+]
+
+def load_rules(path: str) -> List[ThreatRule]:
+    """
+    Load rules from a JSON file
+
+    The file holds a list of objects with name, category, optional severity,
+    and signatures (list of strings) and/or regex.
+
+    Raises:
+        ValueError: If a rule is malformed
+    """
+    with open(path) as f:
+        data = json.load(f)
+
+    rules = []
+    for entry in data:
+        if 'name' not in entry or not (entry.get('signatures') or entry.get('regex')):
+            raise ValueError(f"Rule needs a name and signatures or a regex: {entry}")
+        rules.append(ThreatRule(
+            name=entry['name'],
+            category=entry.get('category', 'custom'),
+            severity=entry.get('severity', 'high'),
+            signatures=list(entry.get('signatures', [])),
+            regex=entry.get('regex')
+        ))
+    return rules
+
+class ThreatMatcher:
+    """Matches payloads against a rule set in one pass
+
+    When several rules match, the one listed first wins, so rule order sets
+    priority (as the IDS's pattern list did).
+    """
+
+    def __init__(self, rules: List[ThreatRule]):
+        self.rules = list(rules)
+        self._build_automaton()
+        self._build_regex()
+
+    def _build_automaton(self):
+        # Trie of lowercased signatures; node 0 is the root
+        goto: List[Dict[str, int]] = [{}]
+        # Per node: the best (rule index, signature) ending there, or None
+        output: List[Optional[Tuple[int, str]]] = [None]
+
+        for rule_index, rule in enumerate(self.rules):
+            for signature in rule.signatures:
+                signature = signature.lower()
+                if not signature:
+                    continue
+                node = 0
+                for ch in signature:
+                    next_node = goto[node].get(ch)
+                    if next_node is None:
+                        next_node = len(goto)
+                        goto[node][ch] = next_node
+                        goto.append({})
+                        output.append(None)
+                    node = next_node
+                if output[node] is None or rule_index < output[node][0]:
+                    output[node] = (rule_index, signature)
+
+        # Breadth-first failure links, folded into per-node transition tables
+        # so the scan never backtracks. Transitions that lead back to a child
+        # of the root are left out of the tables and taken from the root's.
+        root = goto[0]
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [{} for _ in goto]
+        queue = list(root.values())
+        for node in queue:
+            # A match ending at the failure state also ends here
+            best = output[fail[node]]
+            if best is not None and (output[node] is None or best[0] < output[node][0]):
+                output[node] = best
+
+            delta[node].update(delta[fail[node]])
+            for ch, child in goto[node].items():
+                fail[child] = delta[fail[node]].get(ch) or root.get(ch, 0)
+                delta[node][ch] = child
+                queue.append(child)
+
+        self._root = root
+        self._delta = delta
+        self._output = output
+
+    def _build_regex(self):
+        parts = [
+            f'(?P<r{index}>{rule.regex})'
+            for index, rule in enumerate(self.rules) if rule.regex
+        ]
+        self._regex = re.compile('|'.join(parts), re.IGNORECASE) if parts else None
+
+    @property
+    def signature_count(self) -> int:
+        return sum(len(rule.signatures) for rule in self.rules)
+
+    def match(self, payload: str) -> Optional[ThreatMatch]:
+        """Find the highest-priority rule matching the payload, or None"""
+        best = None
+        best_end = 0
+
+        root = self._root
+        delta = self._delta
+        output = self._output
+        state = 0
+        for position, ch in enumerate(payload.lower()):
+            state = delta[state].get(ch) or root.get(ch, 0)
+            found = output[state]
+            if found is not None and (best is None or found[0] < best[0]):
+                best, best_end = found, position + 1
+                if found[0] == 0:
+                    break
+
+        # Regex rules cost one search of the combined pattern
+        if self._regex is not None and (best is None or best[0] > 0):
+            for m in self._regex.finditer(payload):
+                index = int(m.lastgroup[1:])
+                if best is None or index < best[0]:
+                    best, best_end = (index, m.group()), m.end()
+
+        if best is None:
+            return None
+        rule_index, matched = best
+        return ThreatMatch(self.rules[rule_index], matched, best_end - len(matched))
@@ -1,37 +1,102 @@
-from app.security.digital_signature import sign_transaction
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
-from cryptography.hazmat.backends import default_backend
+from app.security.digital_signature import verify_with_public_key, DEFAULT_SIGNATURE_ALGORITHM
+from app.security.key_store import BankKeyStore
+from app.security.merkle import (
+    merkle_leaf, build_merkle_tree, merkle_root, merkle_proof, verify_merkle_proof
+)
+from flask import current_app
 import logging
-import os
+import threading
 from datetime import datetime
 
-# Generate a deterministic bank key pair for signing transactions
-# In a production environment, these would be securely stored and rotated
+_key_store = None
+_key_store_lock = threading.Lock()
+
+def get_key_store():
+    """
+    Get the bank key store, creating it on first use
+    
+    Keys are loaded from SIGNING_KEY_DIR (or generated and saved there on first run),
+    so every worker process signs and verifies with the same key pair.
+    """
+    global _key_store
+    if _key_store is None:
+        with _key_store_lock:
+            if _key_store is None:
+                try:
+                    config = current_app.config
+                except RuntimeError:
+                    from config import Config
+                    config = vars(Config)
+                _key_store = BankKeyStore(
+                    config['SIGNING_KEY_DIR'],
+                    config['SIGNING_KEY_ID'],
+                    config.get('SIGNING_ALGORITHM')
+                )
+    return _key_store
+
+def set_key_store(key_store):
+    """Use an explicitly configured key store (e.g. in worker processes without an app)"""
+    global _key_store
+    with _key_store_lock:
+        _key_store = key_store
+
 def get_bank_keys():
-    # Generate a fixed key for consistent test data
-    BANK_PRIVATE_KEY = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048,
-        backend=default_backend()
+    """Get the active bank key pair as PEM bytes"""
+    key_store = get_key_store()
+    return key_store.get_private_key_pem(), key_store.get_public_key_pem()
+
+def format_transaction_data(transaction_id, source_account_id, destination_account_id, amount, created_at):
+    """Build the string that is signed for a transaction from its raw fields"""
+    source_id = source_account_id or "UNKNOWN"
+    dest_id = destination_account_id or "UNKNOWN"
+    return f"{transaction_id}:{source_id}:{dest_id}:{amount}:{created_at}"
+
+def get_transaction_data(transaction):
+    """Build the string that is signed for a transaction"""
+    return format_transaction_data(
+        transaction.id,
+        transaction.source_account_id,
+        transaction.destination_account_id,
+        transaction.amount,
+        transaction.created_at
     )
+
+def create_bank_signature(transaction):
+    """
+    Compute the bank signature for a transaction without modifying it
     
-    BANK_PRIVATE_KEY_PEM = BANK_PRIVATE_KEY.private_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.PKCS8,
-        encryption_algorithm=serialization.NoEncryption()
-    )
+    Args:
+        transaction (Transaction): The transaction to sign
+        
+    Returns:
+        tuple: (binary signature, updated meta_data dict)
+    """
+    # Prepare transaction data string with all critical fields
+    transaction_data = get_transaction_data(transaction)
     
-    BANK_PUBLIC_KEY = BANK_PRIVATE_KEY.public_key()
-    BANK_PUBLIC_KEY_PEM = BANK_PUBLIC_KEY.public_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PublicFormat.SubjectPublicKeyInfo
-    )
+    # Sign the transaction data - ensuring we get binary signature data
+    key_store = get_key_store()
+    key_id = key_store.active_key_id
+    signer = key_store.get_signer(key_id)
+    binary_signature = signer.sign(transaction_data.encode('utf-8'))
     
-    return BANK_PRIVATE_KEY_PEM, BANK_PUBLIC_KEY_PEM
-
-# Get the bank keys
-BANK_PRIVATE_KEY_PEM, BANK_PUBLIC_KEY_PEM = get_bank_keys()
+    # Store digital signature details in meta_data for easy retrieval
+    # (a new dict, so the JSON column change is detected)
+    meta_data = dict(transaction.meta_data or {})
+    
+    # Use the current time for the signature timestamp
+    current_time = datetime.utcnow()
+    
+    meta_data['signature_info'] = {
+        'status': 'signed',
+        'signed_at': current_time.isoformat(),
+        'signed_by': 'bank_system',
+        'signature_type': 'bank_digital',
+        'algorithm': signer.algorithm.name,
+        'key_id': key_id
+    }
+    
+    return binary_signature, meta_data
 
 def sign_bank_transaction(transaction):
     """
@@ -48,33 +113,120 @@ def sign_bank_transaction(transaction):
         if not transaction.id:
             logging.warning("Cannot sign transaction without ID")
             return False
-            
-        # Ensure the required fields are present
-        source_id = transaction.source_account_id or "UNKNOWN"
-        dest_id = transaction.destination_account_id or "UNKNOWN"
-        
-        # Prepare transaction data string with all critical fields
-        transaction_data = f"{transaction.id}:{source_id}:{dest_id}:{transaction.amount}:{transaction.created_at}"
-        
-        # Sign the transaction data - ensuring we get binary signature data
-        binary_signature = sign_transaction(transaction_data, BANK_PRIVATE_KEY_PEM)
         
-        # Store binary signature
-        transaction.digital_signature = binary_signature
-          # Store digital signature details in meta_data for easy retrieval
-        if not transaction.meta_data:
-            transaction.meta_data = {}
+        transaction.digital_signature, transaction.meta_data = create_bank_signature(transaction)
         
-        # Use the current time for the signature timestamp
-        current_time = datetime.utcnow()
+        return True
+    except Exception as e:
+        logging.error(f"Error signing transaction {transaction.id}: {str(e)}")
+        return False
+
+def create_batch_signatures(transactions):
+    """
+    Sign a batch of transactions with a single signature over their Merkle root
+    
+    Each transaction gets the root signature plus its own inclusion proof in
+    meta_data['signature_info'], so it can still be verified on its own.
+    
+    Args:
+        transactions (list): Transactions to sign (must already have IDs)
         
-        transaction.meta_data['signature_info'] = {
-            'signed_at': current_time.isoformat(),
+    Returns:
+        list: (binary signature, updated meta_data dict) for each transaction, in order
+    """
+    if not transactions:
+        return []
+    
+    levels = build_merkle_tree([merkle_leaf(get_transaction_data(tx)) for tx in transactions])
+    root = merkle_root(levels)
+    
+    key_store = get_key_store()
+    key_id = key_store.active_key_id
+    signer = key_store.get_signer(key_id)
+    root_signature = signer.sign(root)
+    signed_at = datetime.utcnow().isoformat()
+    
+    results = []
+    for index, transaction in enumerate(transactions):
+        meta_data = dict(transaction.meta_data or {})
+        meta_data['signature_info'] = {
+            'status': 'signed',
+            'signed_at': signed_at,
             'signed_by': 'bank_system',
-            'signature_type': 'bank_digital'
+            'signature_type': 'merkle_batch',
+            'algorithm': signer.algorithm.name,
+            'key_id': key_id,
+            'merkle_root': root.hex(),
+            'merkle_proof': merkle_proof(levels, index),
+            'leaf_index': index,
+            'batch_size': len(transactions)
         }
-        
+        results.append((root_signature, meta_data))
+    
+    return results
+
+def sign_bank_transactions(transactions):
+    """
+    Sign several transactions at once under one Merkle root signature
+    
+    Returns:
+        bool: True if signing was successful, False otherwise
+    """
+    try:
+        for transaction, (signature, meta_data) in zip(transactions, create_batch_signatures(transactions)):
+            transaction.digital_signature = signature
+            transaction.meta_data = meta_data
         return True
     except Exception as e:
-        logging.error(f"Error signing transaction {transaction.id}: {str(e)}")
+        logging.error(f"Error batch signing {len(transactions)} transactions: {str(e)}")
         return False
+
+def verify_transaction_signature(transaction_data, signature, signature_info):
+    """
+    Verify a stored bank signature, either per-transaction or Merkle batch
+    
+    Args:
+        transaction_data (str): The signed transaction data (see get_transaction_data)
+        signature (bytes): The stored digital_signature
+        signature_info (dict): The stored meta_data['signature_info'] (may be empty)
+        
+    Returns:
+        bool: True if the signature is valid, False otherwise
+    """
+    if not signature:
+        return False
+    
+    signature_info = signature_info or {}
+    
+    try:
+        public_key = get_key_store().get_public_key(signature_info.get('key_id'))
+    except KeyError:
+        logging.warning(f"Unknown signing key: {signature_info.get('key_id')}")
+        return False
+    
+    data = transaction_data.encode('utf-8')
+    
+    if signature_info.get('signature_type') == 'merkle_batch':
+        root = bytes.fromhex(signature_info['merkle_root'])
+        if not verify_merkle_proof(merkle_leaf(data), signature_info.get('merkle_proof', []), root):
+            return False
+        data = root
+    
+    # Untagged signatures predate the algorithm registry and are RSA-PSS
+    algorithm_name = signature_info.get('algorithm', DEFAULT_SIGNATURE_ALGORITHM)
+    return verify_with_public_key(public_key, data, signature, algorithm_name)
+
+def verify_bank_transaction(transaction):
+    """
+    Verify a transaction's bank signature with the key that signed it
+    
+    Args:
+        transaction (Transaction): The transaction to verify
+        
+    Returns:
+        bool: True if the signature is valid, False otherwise
+    """
+    signature_info = (transaction.meta_data or {}).get('signature_info')
+    return verify_transaction_signature(
+        get_transaction_data(transaction), transaction.digital_signature, signature_info
+    )
@@ -0,0 +1,188 @@
+"""
+Encrypted running balance totals per account type
+Every write path that changes a balance (transfers, payments, account
+creation) adds its per-type delta to a sharded aggregate row in the same
+database transaction, so the admin dashboard can read the totals without
+decrypting every account. The totals are first built by
+rebuild_balance_aggregates.py at deploy time.
+"""
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.account import Account
+from app.models.aggregate import BalanceAggregate
+from app.security.encryption import encrypt_data, decrypt_amounts
+from collections import defaultdict
+from datetime import datetime
+import logging
+import random
+
+aggregate_logger = logging.getLogger('banking_aggregates')
+
+# Internal booking accounts are not customer money
+EXCLUDED_ACCOUNT_TYPES = {'system'}
+
+# Row written by each rebuild; until the first one the totals are incomplete
+REBUILT_MARKER = '_rebuilt'
+
+def _encrypt_total(value):
+    return encrypt_data(str(round(value, 2)).encode('utf-8'))
+
+def _shard_count():
+    return current_app.config.get('BALANCE_AGGREGATE_SHARDS', 8)
+
+def _lock_shard(account_type, shard):
+    """
+    Lock an aggregate shard row, creating it if this is its first use
+    
+    Writers always take a shard row lock, even before the first rebuild, so a
+    rebuild holding the table lock makes them wait until its totals are written.
+    """
+    row = BalanceAggregate.query.filter_by(account_type=account_type, shard=shard) \
+        .with_for_update().populate_existing().first()
+    if row is not None:
+        return row
+    
+    try:
+        with db.session.begin_nested():
+            db.session.add(BalanceAggregate(
+                account_type=account_type, shard=shard,
+                total_encrypted=_encrypt_total(0), account_count=0
+            ))
+    except IntegrityError:
+        # Another writer created it first
+        pass
+    
+    return BalanceAggregate.query.filter_by(account_type=account_type, shard=shard) \
+        .with_for_update().populate_existing().one()
+
+def record_balance_changes(balance_deltas, count_deltas=None):
+    """
+    Add balance and account count changes to the aggregates
+    
+    Must be called inside the write's database transaction (the caller commits).
+    Shard rows are locked in account type order so writers cannot deadlock.
+    
+    Args:
+        balance_deltas (dict): account_type -> change in total balance
+        count_deltas (dict): account_type -> change in number of accounts
+    """
+    count_deltas = count_deltas or {}
+    account_types = sorted(
+        account_type for account_type in set(balance_deltas) | set(count_deltas)
+        if account_type not in EXCLUDED_ACCOUNT_TYPES and
+        (balance_deltas.get(account_type) or count_deltas.get(account_type))
+    )
+    if not account_types:
+        return
+    
+    shard = random.randrange(_shard_count())
+    rows = [_lock_shard(account_type, shard) for account_type in account_types]
+    totals = decrypt_amounts([row.total_encrypted for row in rows])
+    
+    for row, total in zip(rows, totals):
+        row.total_encrypted = _encrypt_total(total + balance_deltas.get(row.account_type, 0))
+        row.account_count += count_deltas.get(row.account_type, 0)
+
+def record_transfer(source_account, credit_account, amount):
+    """Record a debit from one account and credit to another"""
+    deltas = defaultdict(float)
+    deltas[source_account.account_type] -= amount
+    if credit_account is not None:
+        deltas[credit_account.account_type] += amount
+    record_balance_changes(deltas)
+
+def record_new_account(account, balance):
+    """Record a newly opened account and its opening balance"""
+    record_balance_changes({account.account_type: balance}, {account.account_type: 1})
+
+def get_balance_totals():
+    """
+    Get the total balance and number of accounts for each account type
+    
+    Reads one row per shard per account type, however many accounts exist.
+    
+    Returns:
+        dict: account_type -> {'total': float, 'count': int}, or None if the
+        aggregates have never been built
+    """
+    rows = BalanceAggregate.query.all()
+    if not any(row.account_type == REBUILT_MARKER for row in rows):
+        return None
+    rows = [row for row in rows if row.account_type != REBUILT_MARKER]
+    
+    totals = {}
+    for row, total in zip(rows, decrypt_amounts([row.total_encrypted for row in rows])):
+        entry = totals.setdefault(row.account_type, {'total': 0.0, 'count': 0})
+        entry['total'] += total
+        entry['count'] += row.account_count
+    
+    for entry in totals.values():
+        entry['total'] = round(entry['total'], 2)
+    return totals
+
+def rebuild_balance_aggregates(chunk_size=1000):
+    """
+    Recompute the aggregates from every account's balance
+    
+    On PostgreSQL the aggregate table is locked before the accounts are read,
+    so a write either committed before the scan (and is counted by it) or
+    waits for the rebuild and is then added on top of the rebuilt totals.
+    Elsewhere the existing shard rows are locked. Run it from
+    rebuild_balance_aggregates.py, not on a request.
+    
+    Returns:
+        dict: The rebuilt totals (see get_balance_totals)
+    """
+    from app.services.ledger import is_append_only, get_balances
+    
+    try:
+        if db.engine.dialect.name == 'postgresql':
+            # Conflicts with the row locks and inserts of every writer
+            db.session.execute(text('LOCK TABLE balance_aggregates IN EXCLUSIVE MODE'))
+        existing = BalanceAggregate.query.with_for_update().populate_existing().all()
+        
+        totals = defaultdict(float)
+        counts = defaultdict(int)
+        
+        def add_chunk(chunk):
+            if is_append_only():
+                ledger_balances = get_balances([row.id for row in chunk])
+                balances = [ledger_balances[row.id] for row in chunk]
+            else:
+                balances = decrypt_amounts([row.balance_encrypted for row in chunk])
+            for row, balance in zip(chunk, balances):
+                totals[row.account_type] += balance
+                counts[row.account_type] += 1
+        
+        chunk = []
+        for row in db.session.query(Account.id, Account.account_type, Account.balance_encrypted) \
+                .filter(Account.account_type.notin_(EXCLUDED_ACCOUNT_TYPES)) \
+                .yield_per(chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                add_chunk(chunk)
+                chunk = []
+        if chunk:
+            add_chunk(chunk)
+        
+        # Everything goes in shard 0; the other shards (and any deltas written
+        # before the first rebuild) start again from zero
+        for row in existing:
+            row.total_encrypted = _encrypt_total(0)
+            row.account_count = 0
+        for account_type in totals:
+            row = _lock_shard(account_type, 0)
+            row.total_encrypted = _encrypt_total(totals[account_type])
+            row.account_count = counts[account_type]
+        marker = _lock_shard(REBUILT_MARKER, 0)
+        marker.updated_at = datetime.utcnow()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    aggregate_logger.info(f"Rebuilt balance aggregates for {sum(counts.values())} accounts")
+    return get_balance_totals() or {}
@@ -0,0 +1,275 @@
+"""
+Idempotency keys for money-moving POSTs
+A client sends the same Idempotency-Key header on every retry of a request; the
+first response is stored and replayed for the retries, so a retried transfer
+never moves money (or signs a transaction) twice. Stored responses live in the
+idempotency_keys table, with an in-process LRU cache in front of it.
+"""
+
+from flask import current_app, request, jsonify, make_response, g
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.idempotency import IdempotencyKey
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from functools import wraps
+from uuid import uuid4
+import hashlib
+import logging
+import threading
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+class ResponseCache:
+    """Thread-safe LRU cache of completed responses"""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cache_key):
+        """Get (request_hash, status, body), or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is None or entry[0] <= datetime.utcnow():
+                if entry is not None:
+                    del self.entries[cache_key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(cache_key)
+            self.hits += 1
+            return entry[1:]
+
+    def put(self, cache_key, expires_at, request_hash, status, body):
+        with self.lock:
+            self.entries[cache_key] = (expires_at, request_hash, status, body)
+            self.entries.move_to_end(cache_key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+# Global response cache instance (sized from config on first use)
+response_cache = ResponseCache()
+
+def _request_hash():
+    """Fingerprint the request so a key cannot be reused for a different request"""
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.path}\n".encode('utf-8'))
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+def _replay(status, body):
+    response = make_response(jsonify(body), status)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _mismatch():
+    return jsonify({'message': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 422
+
+# A request's hold on its key. Kept as plain values, because the ORM row would
+# reload the lease from the database and pick up a retry's takeover
+Claim = namedtuple('Claim', ['id', 'key', 'lease_id', 'expires_at'])
+
+class IdempotencyConflict(Exception):
+    """The request lost its claim on its Idempotency-Key (its lease expired and a retry took it over)"""
+
+def _claim(user_id, endpoint, key, request_hash, ttl, lease):
+    """
+    Insert an in-progress row for the key, or take over one whose lease expired
+    
+    Returns:
+        tuple: (Claim, None) if the key was claimed, else (None, existing row)
+    """
+    now = datetime.utcnow()
+    for _ in range(2):
+        claim = Claim(str(uuid4()), key, str(uuid4()), now + timedelta(seconds=ttl))
+        try:
+            db.session.add(IdempotencyKey(
+                id=claim.id,
+                key=key,
+                user_id=user_id,
+                endpoint=endpoint,
+                request_hash=request_hash,
+                lease_id=claim.lease_id,
+                lease_expires_at=now + timedelta(seconds=lease),
+                expires_at=claim.expires_at
+            ))
+            db.session.commit()
+            return claim, None
+        except IntegrityError:
+            db.session.rollback()
+        
+        existing = IdempotencyKey.query.filter_by(user_id=user_id, endpoint=endpoint, key=key).first()
+        if existing is None:
+            continue
+        if existing.expires_at <= now:
+            # An expired key may be reused
+            db.session.delete(existing)
+            db.session.commit()
+            continue
+        if (existing.status == 'in_progress' and existing.lease_expires_at <= now
+                and existing.request_hash == request_hash):
+            # The request holding the key crashed (or is stuck): nothing it did was
+            # committed, as the key would be completed, so a retry may run it again
+            claim = Claim(existing.id, key, str(uuid4()), existing.expires_at)
+            taken = IdempotencyKey.query.filter_by(
+                id=existing.id, status='in_progress', lease_id=existing.lease_id
+            ).update({
+                'lease_id': claim.lease_id,
+                'lease_expires_at': now + timedelta(seconds=lease)
+            }, synchronize_session=False)
+            db.session.commit()
+            if taken:
+                return claim, None
+            continue
+        return None, existing
+    
+    return None, IdempotencyKey.query.filter_by(user_id=user_id, endpoint=endpoint, key=key).first()
+
+def _release(claim):
+    """Drop an in-progress claim so the client can retry"""
+    try:
+        IdempotencyKey.query.filter_by(
+            id=claim.id, status='in_progress', lease_id=claim.lease_id
+        ).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Failed to release idempotency key {claim.key}: {str(e)}")
+
+def _complete(claim, status, body):
+    """Mark the claimed key completed with its response, in the current database transaction"""
+    completed = IdempotencyKey.query.filter_by(
+        id=claim.id, status='in_progress', lease_id=claim.lease_id
+    ).update({
+        'status': 'completed',
+        'response_status': status,
+        'response_body': body
+    }, synchronize_session=False)
+    if not completed:
+        raise IdempotencyConflict(f'{IDEMPOTENCY_HEADER} {claim.key} was taken over by a retry')
+
+def store_response(body, status):
+    """
+    Store a request's response for its Idempotency-Key in the current database transaction
+    
+    Called just before the commit that books a transfer or payment, so the
+    key is completed if and only if the money moves: when that transaction
+    rolls back the key is released for a retry, and once it commits retries
+    get this response even if the view fails afterwards. Does nothing for
+    requests without the header.
+    
+    Raises:
+        IdempotencyConflict: If a retry has taken over the key; the caller's
+            transaction must then roll back
+    """
+    claim = g.get('idempotency_claim')
+    if claim is not None:
+        _complete(claim, status, body)
+
+def purge_expired_keys():
+    """Delete expired idempotency keys; returns the number removed"""
+    try:
+        removed = IdempotencyKey.query.filter(
+            IdempotencyKey.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return removed
+    except Exception:
+        db.session.rollback()
+        raise
+
+def idempotent(fn):
+    """
+    Decorator making a JWT-protected POST safe to retry with an Idempotency-Key header
+    
+    Requests without the header run as before. Completed responses (anything
+    but a 5xx) are stored and replayed for retries with the same key; a retry
+    while the first request is still running gets 409, and reusing a key for a
+    different request body gets 422. Views that move money store their
+    response with store_response() in the same transaction as the money
+    movement. A request that dies without completing its key holds it for
+    IDEMPOTENCY_LEASE_TIMEOUT seconds, after which a retry can take it over.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'message': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+        
+        user_id = get_jwt_identity()
+        endpoint = request.endpoint
+        request_hash = _request_hash()
+        cache_key = (user_id, endpoint, key)
+        response_cache.max_size = current_app.config.get('IDEMPOTENCY_CACHE_SIZE', 10000)
+        
+        # Fast path: a recent retry answered from memory
+        cached = response_cache.get(cache_key)
+        if cached:
+            cached_hash, status, body = cached
+            if cached_hash != request_hash:
+                return _mismatch()
+            return _replay(status, body)
+        
+        ttl = current_app.config.get('IDEMPOTENCY_KEY_TTL', 86400)
+        lease = current_app.config.get('IDEMPOTENCY_LEASE_TIMEOUT', 60)
+        claim, existing = _claim(user_id, endpoint, key, request_hash, ttl, lease)
+        if existing is not None:
+            if existing.request_hash != request_hash:
+                return _mismatch()
+            if existing.status != 'completed':
+                return jsonify({'message': 'A request with this Idempotency-Key is still being processed'}), 409
+            response_cache.put(cache_key, existing.expires_at, existing.request_hash,
+                               existing.response_status, existing.response_body)
+            return _replay(existing.response_status, existing.response_body)
+        
+        g.idempotency_claim = claim
+        error = None
+        try:
+            response = make_response(fn(*args, **kwargs))
+        except Exception as e:
+            db.session.rollback()
+            error = e
+            response = None
+        finally:
+            g.pop('idempotency_claim', None)
+        
+        # Whether the view's transaction committed decides the key's fate
+        stored = IdempotencyKey.query.populate_existing().get(claim.id)
+        if stored is not None and stored.status == 'completed' and stored.lease_id == claim.lease_id:
+            response_cache.put(cache_key, stored.expires_at, request_hash, stored.response_status, stored.response_body)
+            if error is not None or response.status_code >= 500:
+                # The money moved, so a failure after the commit still answers with the stored response
+                return _replay(stored.response_status, stored.response_body)
+            return response
+        
+        body = response.get_json(silent=True) if response is not None else None
+        if error is not None or response.status_code >= 500 or body is None:
+            # Failed requests are not remembered, so the client can retry them
+            _release(claim)
+            if error is not None:
+                raise error
+            return response
+        
+        # Responses that booked nothing (e.g. validation errors) are stored on their own
+        try:
+            _complete(claim, response.status_code, body)
+            db.session.commit()
+            response_cache.put(cache_key, claim.expires_at, request_hash, response.status_code, body)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to store response for idempotency key {key}: {str(e)}")
+            _release(claim)
+        
+        return response
+    return wrapper
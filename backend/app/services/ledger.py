@@ -0,0 +1,293 @@
+"""
+Double-entry ledger
+Every completed transfer or payment posts a debit to the paying account and a
+credit to the receiving one. An account's balance is its latest snapshot plus
+the postings made since, and a background compactor rolls postings up into new
+snapshots so balance reads stay cheap.
+
+With LEDGER_APPEND_ONLY set, transfers stop rewriting Account.balance_encrypted
+and only insert postings; the compactor then refreshes the stored balance.
+"""
+
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.models.account import Account
+from app.models.ledger import LedgerEntry, BalanceSnapshot
+from app.security.encryption import encrypt_data, decrypt_amounts
+import logging
+import threading
+
+ledger_logger = logging.getLogger('banking_ledger')
+
+def is_append_only():
+    """True when balances are only changed through ledger postings"""
+    return current_app.config.get('LEDGER_APPEND_ONLY', False)
+
+def _encrypt_amount(value):
+    return encrypt_data(str(value).encode('utf-8'))
+
+def post_transfer(transaction, amount, source_account_id, destination_account_id):
+    """
+    Post the balanced debit and credit for a completed transaction
+    
+    Args:
+        transaction (Transaction): The transaction being booked (may not be flushed yet)
+        amount (float): Amount moved
+        source_account_id (str): Account debited
+        destination_account_id (str): Account credited
+        
+    Returns:
+        list: The two new LedgerEntry rows (added to the session)
+    """
+    entries = [
+        LedgerEntry(transaction=transaction, account_id=source_account_id,
+                    entry_type='debit', amount_encrypted=_encrypt_amount(-amount)),
+        LedgerEntry(transaction=transaction, account_id=destination_account_id,
+                    entry_type='credit', amount_encrypted=_encrypt_amount(amount))
+    ]
+    db.session.add_all(entries)
+    return entries
+
+def ensure_opening_snapshot(account):
+    """
+    Record an account's stored balance as its opening snapshot before its first posting
+    
+    Needed before the stored balance is updated in place, so postings are not
+    counted twice. The caller must hold the account row lock.
+    """
+    exists = db.session.query(
+        BalanceSnapshot.query.filter_by(account_id=account.id).exists()
+    ).scalar()
+    if not exists:
+        db.session.add(BalanceSnapshot(
+            account_id=account.id,
+            last_entry_id=0,
+            balance_encrypted=account.balance_encrypted
+        ))
+
+def _ledger_state(account_ids):
+    """
+    Work out balances from the latest snapshots and the postings since
+    
+    Returns:
+        dict: account_id -> (balance, last_entry_id, postings since the snapshot)
+    """
+    account_ids = list(set(account_ids))
+    if not account_ids:
+        return {}
+    
+    latest = db.session.query(
+        BalanceSnapshot.account_id,
+        func.max(BalanceSnapshot.last_entry_id).label('last_entry_id')
+    ).filter(
+        BalanceSnapshot.account_id.in_(account_ids)
+    ).group_by(BalanceSnapshot.account_id).subquery()
+    
+    snapshots = db.session.query(
+        BalanceSnapshot.account_id,
+        BalanceSnapshot.last_entry_id,
+        BalanceSnapshot.balance_encrypted
+    ).join(
+        latest,
+        (BalanceSnapshot.account_id == latest.c.account_id) &
+        (BalanceSnapshot.last_entry_id == latest.c.last_entry_id)
+    ).all()
+    
+    baselines = {row.account_id: (row.last_entry_id, row.balance_encrypted) for row in snapshots}
+    
+    # An account without a snapshot has never been compacted, so its stored
+    # balance is still its opening balance
+    missing = [account_id for account_id in account_ids if account_id not in baselines]
+    if missing:
+        for row in db.session.query(Account.id, Account.balance_encrypted).filter(Account.id.in_(missing)):
+            baselines[row.id] = (0, row.balance_encrypted)
+    
+    # Compare against the snapshot ids read above (not a fresh subquery), so a
+    # compaction committing in between cannot make postings drop out
+    since = min(last_entry_id for last_entry_id, _ in baselines.values()) if baselines else 0
+    postings = [
+        row for row in db.session.query(
+            LedgerEntry.id, LedgerEntry.account_id, LedgerEntry.amount_encrypted
+        ).filter(
+            LedgerEntry.account_id.in_(list(baselines)),
+            LedgerEntry.id > since
+        )
+        if row.id > baselines[row.account_id][0]
+    ]
+    
+    ordered_ids = list(baselines)
+    amounts = decrypt_amounts(
+        [baselines[account_id][1] for account_id in ordered_ids] +
+        [row.amount_encrypted for row in postings]
+    )
+    
+    state = {
+        account_id: [amount, baselines[account_id][0], 0]
+        for account_id, amount in zip(ordered_ids, amounts)
+    }
+    for row, amount in zip(postings, amounts[len(ordered_ids):]):
+        account_state = state[row.account_id]
+        account_state[0] += amount
+        account_state[1] = max(account_state[1], row.id)
+        account_state[2] += 1
+    
+    return {account_id: (round(balance, 2), last_id, count) for account_id, (balance, last_id, count) in state.items()}
+
+def get_balances(account_ids):
+    """
+    Get ledger balances for several accounts in one pass
+    
+    Returns:
+        dict: account_id -> balance
+    """
+    return {account_id: state[0] for account_id, state in _ledger_state(account_ids).items()}
+
+def get_balance(account_id):
+    """Get one account's ledger balance"""
+    return get_balances([account_id]).get(account_id)
+
+def current_balances(accounts, max_workers=None):
+    """
+    Get the current balance of each account, in the same order
+    
+    The stored balances are decrypted in one pass, except in append-only mode,
+    where they lag until the next compaction and the ledger is read instead.
+    """
+    if is_append_only():
+        balances = get_balances([account.id for account in accounts])
+        return [balances[account.id] for account in accounts]
+    return decrypt_amounts([account.balance_encrypted for account in accounts], max_workers)
+
+def get_account_entries(account_id, limit=100):
+    """Get an account's most recent postings, newest first"""
+    entries = LedgerEntry.query.filter_by(account_id=account_id) \
+        .order_by(LedgerEntry.id.desc()).limit(limit).all()
+    amounts = decrypt_amounts([entry.amount_encrypted for entry in entries])
+    return [entry.to_dict(amount) for entry, amount in zip(entries, amounts)]
+
+def compact_account(account_id):
+    """
+    Roll an account's postings up into a new balance snapshot
+    
+    Takes the account row lock, which waits for in-flight postings to the
+    account to commit, so no posting can be left out of the snapshot.
+    
+    Returns:
+        BalanceSnapshot: The new snapshot, or None if there was nothing to compact
+    """
+    try:
+        account = Account.query.filter_by(id=account_id) \
+            .with_for_update().populate_existing().first()
+        if not account:
+            db.session.rollback()
+            return None
+        
+        balance, last_entry_id, count = _ledger_state([account_id])[account_id]
+        if count == 0:
+            db.session.rollback()
+            return None
+        
+        snapshot = BalanceSnapshot(
+            account_id=account_id,
+            last_entry_id=last_entry_id,
+            balance_encrypted=_encrypt_amount(balance),
+            entry_count=count
+        )
+        db.session.add(snapshot)
+        
+        if is_append_only():
+            account.balance = balance
+        elif abs(account.balance - balance) >= 0.005:
+            ledger_logger.warning(
+                f"Ledger balance {balance} for account {account_id} does not match stored balance {account.balance}"
+            )
+        
+        db.session.commit()
+        return snapshot
+    except Exception:
+        db.session.rollback()
+        raise
+
+def accounts_to_compact(threshold, limit=100):
+    """Find accounts with at least threshold postings since their latest snapshot"""
+    latest = db.session.query(
+        BalanceSnapshot.account_id,
+        func.max(BalanceSnapshot.last_entry_id).label('last_entry_id')
+    ).group_by(BalanceSnapshot.account_id).subquery()
+    
+    rows = db.session.query(LedgerEntry.account_id).outerjoin(
+        latest, LedgerEntry.account_id == latest.c.account_id
+    ).filter(
+        LedgerEntry.id > func.coalesce(latest.c.last_entry_id, 0)
+    ).group_by(LedgerEntry.account_id).having(
+        func.count(LedgerEntry.id) >= threshold
+    ).order_by(func.count(LedgerEntry.id).desc()).limit(limit).all()
+    
+    return [row.account_id for row in rows]
+
+def compact_ledger(threshold=None, limit=100):
+    """
+    Compact the accounts with the most postings since their last snapshot
+    
+    Returns:
+        int: Number of snapshots written
+    """
+    if threshold is None:
+        threshold = current_app.config.get('LEDGER_COMPACTION_THRESHOLD', 100)
+    
+    compacted = 0
+    for account_id in accounts_to_compact(threshold, limit):
+        try:
+            if compact_account(account_id):
+                compacted += 1
+        except Exception as e:
+            ledger_logger.error(f"Failed to compact ledger for account {account_id}: {str(e)}")
+    return compacted
+
+class LedgerCompactor:
+    """Background thread that periodically rolls ledger postings into snapshots"""
+
+    def __init__(self):
+        self.app = None
+        self.thread = None
+        self.interval = 60
+        self.stop_event = threading.Event()
+        self.snapshot_count = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.thread is not None
+
+    def init_app(self, app):
+        """Start the compactor if LEDGER_COMPACTION_ENABLED is set"""
+        if not app.config.get('LEDGER_COMPACTION_ENABLED', False) or self.enabled:
+            return
+
+        self.app = app
+        self.interval = app.config.get('LEDGER_COMPACTION_INTERVAL', 60)
+        self.thread = threading.Thread(target=self._run, name='ledger-compactor', daemon=True)
+        self.thread.start()
+
+        ledger_logger.info(f"Ledger compaction every {self.interval}s")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    try:
+                        self.snapshot_count += compact_ledger()
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                ledger_logger.error(f"Ledger compaction failed: {str(e)}")
+
+# Global ledger compactor instance
+ledger_compactor = LedgerCompactor()
+
+def init_ledger_compactor(app):
+    """Initialize background ledger compaction with the Flask app"""
+    ledger_compactor.init_app(app)
@@ -0,0 +1,213 @@
+"""
+Scheduled and recurring bill payments
+Due payments are found through the (status, scheduled_for) index and claimed
+with SELECT ... FOR UPDATE SKIP LOCKED, so any number of scheduler workers (in
+one process or several) can drain them in parallel without taking the same
+payment twice. Each claimed batch is debited, signed under one Merkle root and
+committed together with the next occurrence of any recurring payments.
+"""
+
+from flask import current_app
+from app import db
+from app.models.transaction import Transaction
+from app.security.transaction_signer import sign_bank_transactions
+from app.services.transfer_engine import execute_scheduled_payments
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from calendar import monthrange
+from uuid import uuid4
+import logging
+
+scheduler_logger = logging.getLogger('banking_scheduler')
+
+# Recurrence steps: (weeks, months)
+FREQUENCIES = {
+    'weekly': (1, 0),
+    'biweekly': (2, 0),
+    'monthly': (0, 1),
+    'quarterly': (0, 3),
+    'annually': (0, 12)
+}
+
+def parse_datetime(value):
+    """Parse an ISO date or datetime into a naive UTC datetime (None if empty or invalid)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def add_months(value, months, day=None):
+    """Add months to a datetime, clamping the day to the end of shorter months"""
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    day = min(day or value.day, monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+def next_payment_date(current, frequency, anchor_day=None):
+    """
+    Get the date of the next occurrence of a recurring payment
+    
+    Args:
+        current (datetime): This occurrence's due date
+        frequency (str): One of FREQUENCIES
+        anchor_day (int): Day of month monthly payments fall on (so a payment on
+            the 31st comes back to the 31st after a short month)
+        
+    Returns:
+        datetime: The next due date, or None for an unknown frequency
+    """
+    step = FREQUENCIES.get(frequency)
+    if step is None:
+        return None
+    weeks, months = step
+    if weeks:
+        return current + timedelta(weeks=weeks)
+    return add_months(current, months, anchor_day)
+
+def build_next_occurrence(transaction, amount):
+    """
+    Create the next scheduled occurrence of a recurring payment
+    
+    Args:
+        transaction (Transaction): The occurrence that has just been made (or attempted)
+        amount (float): The payment amount
+        
+    Returns:
+        Transaction: The new scheduled payment (not yet added to the session),
+        or None if the payment does not recur or its end date has passed
+    """
+    meta_data = dict(transaction.meta_data or {})
+    if not meta_data.get('is_recurring'):
+        return None
+    
+    current = transaction.scheduled_for or parse_datetime(meta_data.get('payment_date')) or datetime.utcnow()
+    first = parse_datetime(meta_data.get('first_payment_date')) or current
+    frequency = meta_data.get('frequency')
+    next_date = next_payment_date(current, frequency, first.day)
+    if next_date is None:
+        scheduler_logger.warning(f"Recurring payment {transaction.id} has unknown frequency {frequency!r}")
+        return None
+    
+    # An overdue payment runs once; occurrences missed while it was overdue are skipped
+    occurrence = meta_data.get('occurrence', 1) + 1
+    now = datetime.utcnow()
+    while next_date <= now:
+        next_date = next_payment_date(next_date, frequency, first.day)
+        occurrence += 1
+    
+    end_date = parse_datetime(meta_data.get('end_date'))
+    if end_date and next_date.date() > end_date.date():
+        return None
+    
+    for key in ('signature_info', 'failure_reason'):
+        meta_data.pop(key, None)
+    meta_data.update({
+        'payment_date': next_date.isoformat(),
+        'first_payment_date': first.isoformat(),
+        'series_id': meta_data.get('series_id') or transaction.id,
+        'occurrence': occurrence
+    })
+    
+    upcoming = Transaction(
+        id=str(uuid4()),
+        created_at=datetime.utcnow(),
+        transaction_type=transaction.transaction_type,
+        source_account_id=transaction.source_account_id,
+        description=transaction.description,
+        status='scheduled',
+        reference=f"PAY-{uuid4().hex[:6].upper()}",
+        category=transaction.category,
+        currency=transaction.currency,
+        meta_data=meta_data,
+        scheduled_for=next_date
+    )
+    upcoming.amount = amount
+    return upcoming
+
+def claim_due_payments(limit, now=None):
+    """
+    Lock up to limit due scheduled payments, skipping any another worker holds
+    
+    The row locks last until the caller commits or rolls back.
+    """
+    return Transaction.query.filter(
+        Transaction.status == 'scheduled',
+        Transaction.scheduled_for <= (now or datetime.utcnow())
+    ).order_by(
+        Transaction.scheduled_for
+    ).limit(limit).with_for_update(skip_locked=True).all()
+
+def process_due_batch(batch_size):
+    """
+    Claim and run one batch of due payments in a single database transaction
+    
+    Returns:
+        tuple: (completed count, failed count); (0, 0) once nothing is due
+    """
+    try:
+        payments = claim_due_payments(batch_size)
+        if not payments:
+            db.session.rollback()
+            return 0, 0
+        
+        completed, failed = execute_scheduled_payments(payments)
+        
+        # Recurring payments are rescheduled whether or not this occurrence went through
+        upcoming = []
+        for payment in completed + failed:
+            next_payment = build_next_occurrence(payment, payment.amount)
+            if next_payment is not None:
+                db.session.add(next_payment)
+                upcoming.append(next_payment)
+        
+        # Completed payments now have a destination, so they are signed again
+        to_sign = completed + upcoming
+        if to_sign and not sign_bank_transactions(to_sign):
+            raise RuntimeError('Failed to sign scheduled payments')
+        
+        db.session.commit()
+        return len(completed), len(failed)
+    except Exception:
+        db.session.rollback()
+        raise
+
+def _drain(app, batch_size):
+    """Worker loop: process batches until no due payments are left"""
+    totals = [0, 0]
+    with app.app_context():
+        try:
+            while True:
+                completed, failed = process_due_batch(batch_size)
+                if not completed and not failed:
+                    return totals
+                totals[0] += completed
+                totals[1] += failed
+        finally:
+            db.session.remove()
+
+def run_due_payments(workers=None, batch_size=None):
+    """
+    Run every payment due now across a pool of worker threads
+    
+    Returns:
+        dict: Counts of completed and failed payments
+    """
+    app = current_app._get_current_object()
+    workers = workers or app.config.get('SCHEDULER_WORKERS', 4)
+    batch_size = batch_size or app.config.get('SCHEDULER_BATCH_SIZE', 100)
+    
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='payment-scheduler') as pool:
+        results = list(pool.map(lambda _: _drain(app, batch_size), range(workers)))
+    
+    counts = {
+        'completed': sum(result[0] for result in results),
+        'failed': sum(result[1] for result in results)
+    }
+    if counts['completed'] or counts['failed']:
+        scheduler_logger.info(f"Scheduled payments run: {counts['completed']} completed, {counts['failed']} failed")
+    return counts
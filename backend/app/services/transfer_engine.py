@@ -0,0 +1,634 @@
+"""
+Transfer engine
+Moves money between accounts in a single database transaction: the account
+rows are locked with SELECT ... FOR UPDATE in a fixed (id) order, then the
+debit, credit, ledger postings, transaction insert and bank signature are
+written with one commit
+"""
+
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models.user import User
+from app.models.account import Account
+from app.models.transaction import Transaction
+from app.models.biller import Biller
+from app.security.transaction_signer import sign_bank_transaction, sign_bank_transactions
+from app.security.signing_queue import signing_queue, mark_signature_pending, sign_or_enqueue
+from app.services.ledger import is_append_only, ensure_opening_snapshot, post_transfer, get_balance, current_balances
+from app.services.aggregates import record_transfer, record_balance_changes
+from app.services.idempotency import store_response
+from app.security.encryption import decrypt_amounts
+from collections import defaultdict
+from datetime import datetime
+from uuid import uuid4
+import logging
+import math
+import time
+
+EXTERNAL_ACCOUNT_NUMBER = 'SYSTEM-EXTERNAL-BANK'
+
+class TransferError(Exception):
+    """A transfer rejected for a reason the client can fix"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def is_valid_amount(amount):
+    """Whether an amount can be moved: a finite number greater than zero (not NaN or infinity)"""
+    return isinstance(amount, (int, float)) and not isinstance(amount, bool) \
+        and math.isfinite(amount) and amount > 0
+
+def parse_amount(value, message='Amount must be greater than zero', allow_zero=False):
+    """
+    Convert a request's amount to a float, checking it can be moved
+    
+    Raises:
+        TransferError: If the value is not a number, or not finite and positive
+            (or zero, with allow_zero)
+    """
+    if isinstance(value, bool):
+        raise TransferError('Invalid amount')
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        raise TransferError('Invalid amount')
+    if not (is_valid_amount(amount) or (allow_zero and amount == 0)):
+        raise TransferError(message)
+    return amount
+
+def get_external_system_account():
+    """Get (or create) the system account that external transfers are booked against"""
+    external_system_account = Account.query.filter_by(account_number=EXTERNAL_ACCOUNT_NUMBER).first()
+    if external_system_account:
+        return external_system_account
+    
+    # Create a system user if it doesn't exist
+    system_user = User.query.filter_by(username='system').first()
+    if not system_user:
+        system_user = User(
+            username='system',
+            email='system@bank.internal',
+            first_name='System',
+            last_name='Account',
+            password='$uperSecurePassw0rd!',  # This is never used for login
+            is_active=True
+        )
+        db.session.add(system_user)
+        db.session.flush()  # Flush to get the ID without committing
+    
+    external_system_account = Account(
+        account_number=EXTERNAL_ACCOUNT_NUMBER,
+        account_type='system',
+        user_id=system_user.id,
+        is_active=True
+    )
+    external_system_account.balance = 0.0  # Use the property setter
+    db.session.add(external_system_account)
+    db.session.flush()
+    return external_system_account
+
+def lock_accounts(update_ids, share_ids=()):
+    """
+    Lock account rows, always in ascending id order
+    
+    Accounts whose balance is checked or rewritten are locked FOR UPDATE; accounts
+    that only receive a ledger posting are locked FOR SHARE, so concurrent credits
+    to a hot account do not queue behind each other (only behind compaction).
+    Every transfer takes its locks in the same order, so two transfers between
+    the same pair of accounts queue behind each other instead of deadlocking.
+    Each run of consecutive ids with the same lock mode is locked by one query.
+    
+    Returns:
+        dict: Locked accounts by id (missing ids are absent)
+    """
+    update_ids = set(update_ids)
+    runs = []
+    for account_id in sorted(update_ids | set(share_ids)):
+        read = account_id not in update_ids
+        if runs and runs[-1][0] == read:
+            runs[-1][1].append(account_id)
+        else:
+            runs.append((read, [account_id]))
+    
+    accounts = {}
+    for read, ids in runs:
+        for account in Account.query.filter(Account.id.in_(ids)).order_by(Account.id) \
+                .with_for_update(read=read).populate_existing():
+            accounts[account.id] = account
+    return accounts
+
+def _debit(user_id, source_account_id, amount, credit_account_id, credit_balance):
+    """
+    Lock the accounts for a debit and check the source can pay
+    
+    Args:
+        credit_balance (bool): Whether the credited account's stored balance is
+            updated too (internal transfers), rather than only receiving a posting
+    
+    Returns:
+        tuple: (source account, credited account)
+    """
+    append_only = is_append_only()
+    if credit_balance and not append_only:
+        accounts = lock_accounts([source_account_id, credit_account_id])
+    else:
+        accounts = lock_accounts([source_account_id], [credit_account_id])
+    
+    source_account = accounts.get(source_account_id)
+    if not source_account:
+        raise TransferError('Source account not found', 404)
+    
+    # Security check - ensure the source account belongs to the current user
+    if source_account.user_id != user_id:
+        raise TransferError('Access denied', 403)
+    
+    # Balances are read under the lock, so no concurrent debit can change them
+    balance = get_balance(source_account_id) if append_only else source_account.balance
+    if balance < amount:
+        raise TransferError('Insufficient funds')
+    
+    return source_account, accounts.get(credit_account_id)
+
+def _book(transaction, source_account, credit_account, amount, credit_balance):
+    """Apply a debit and credit and post them to the ledger"""
+    if not is_append_only():
+        ensure_opening_snapshot(source_account)
+        source_account.balance -= amount
+        if credit_balance:
+            ensure_opening_snapshot(credit_account)
+            credit_account.balance += amount
+    
+    post_transfer(transaction, amount, source_account.id, credit_account.id)
+    record_transfer(source_account, credit_account, amount)
+
+def _finalize(transaction, respond=None):
+    """
+    Sign (or mark for background signing) and commit a completed transaction
+    
+    Returns:
+        tuple: (transaction, response built by `respond`, or None)
+    """
+    if signing_queue.enabled:
+        mark_signature_pending(transaction)
+    elif not sign_bank_transaction(transaction):
+        raise RuntimeError('Failed to sign transaction')
+    
+    db.session.add(transaction)
+    response = _store_response(respond, transaction)
+    db.session.commit()
+    return transaction, response
+
+def _store_response(respond, result):
+    """
+    Build the request's response before the commit and store it for its Idempotency-Key
+    
+    The key is completed in the same database transaction as the transfer, so
+    a retry can never run a committed transfer again.
+    """
+    if respond is None:
+        return None
+    db.session.flush()  # Fills in the column defaults the response shows
+    response = respond(result)
+    store_response(*response)
+    return response
+
+def _run_with_retry(unit_of_work):
+    """
+    Run a locking unit of work, retrying it on deadlocks and lock timeouts
+    
+    Deadlocks, serialization failures and lock timeouts surface as
+    OperationalError and are safe to retry: the rollback leaves nothing behind.
+    """
+    max_retries = current_app.config.get('TRANSFER_MAX_RETRIES', 3)
+    backoff = current_app.config.get('TRANSFER_RETRY_BACKOFF', 0.05)
+    
+    attempt = 0
+    while True:
+        try:
+            return unit_of_work()
+        except OperationalError as e:
+            db.session.rollback()
+            attempt += 1
+            if attempt >= max_retries:
+                logging.error(f"Transfer failed after {attempt} attempts: {str(e)}")
+                raise
+            logging.warning(f"Transfer attempt {attempt} failed, retrying: {str(e)}")
+            time.sleep(backoff * attempt)
+        except Exception:
+            db.session.rollback()
+            raise
+
+def _enqueue_signing(transaction):
+    if signing_queue.enabled:
+        # Signed in the background (or inline, if the queue is full)
+        sign_or_enqueue(transaction)
+    return transaction
+
+def _new_transaction(**fields):
+    # The ID and timestamp are part of the signed data, so set them up front
+    # instead of waiting for the INSERT to fill them in
+    now = datetime.utcnow()
+    return Transaction(id=str(uuid4()), created_at=now, **fields)
+
+def _transfer(user_id, source_account_id, amount, destination_account_id=None,
+              destination_account_number=None, description=None, reference=None, meta_data=None,
+              respond=None):
+    internal = destination_account_number is None
+    if not internal:
+        # External transfers are booked against the system clearing account
+        destination_account_id = get_external_system_account().id
+    elif destination_account_id == source_account_id:
+        raise TransferError('Cannot transfer to the same account')
+    
+    source_account, destination_account = _debit(
+        user_id, source_account_id, amount, destination_account_id, credit_balance=internal
+    )
+    if not destination_account:
+        raise TransferError('Destination account not found', 404)
+    
+    if internal:
+        transaction = _new_transaction(
+            transaction_type='transfer',
+            description=description or 'Funds transfer',
+            reference=reference or f"TRF-{uuid4().hex[:8].upper()}"
+        )
+    else:
+        transaction = _new_transaction(
+            transaction_type='external_transfer',
+            description=description or 'External funds transfer',
+            reference=reference or f"EXT-{uuid4().hex[:8].upper()}",
+            meta_data=meta_data
+        )
+    
+    transaction.source_account_id = source_account.id
+    transaction.destination_account_id = destination_account_id
+    transaction.amount = amount
+    transaction.status = 'completed'
+    transaction.completed_at = transaction.created_at
+    
+    _book(transaction, source_account, destination_account, amount, credit_balance=internal)
+    return _finalize(transaction, respond)
+
+def execute_transfer(user_id, source_account_id, amount, destination_account_id=None,
+                     destination_account_number=None, description=None, reference=None,
+                     beneficiary_id=None, transaction_type=None, respond=None):
+    """
+    Transfer money from one of the user's accounts, internally or to another bank
+    
+    Args:
+        user_id (str): The user making the transfer (must own the source account)
+        source_account_id (str): Account to debit
+        amount (float): Amount to transfer
+        destination_account_id (str): Account to credit, for internal transfers
+        destination_account_number (str): Account number at another bank, for external transfers
+        respond (callable): Builds the request's (body, status) response from the
+            transaction; it is stored for the request's Idempotency-Key in the
+            transfer's own commit
+        
+    Returns:
+        Transaction: The committed (and signed, or queued for signing) transaction,
+        or the (body, status) response if `respond` is given
+        
+    Raises:
+        TransferError: If the transfer is invalid (not found, access denied, insufficient funds)
+    """
+    if not is_valid_amount(amount):
+        raise TransferError('Amount must be greater than zero')
+    if destination_account_id is None and destination_account_number is None:
+        raise TransferError('Either destination_account_id or destination_account_number must be provided')
+    
+    meta_data = None
+    if destination_account_id is not None:
+        destination_account_number = None
+    else:
+        # Store external account details in meta_data
+        meta_data = {
+            'destination_account_number': destination_account_number,
+            'beneficiary_id': beneficiary_id,
+            'transaction_type': transaction_type or 'external_transfer'
+        }
+    
+    transaction, response = _run_with_retry(lambda: _transfer(
+        user_id, source_account_id, amount, destination_account_id,
+        destination_account_number, description, reference, meta_data, respond
+    ))
+    _enqueue_signing(transaction)
+    return transaction if respond is None else response
+
+def _payment(user_id, source_account_id, amount, build_transaction, respond=None):
+    transaction = build_transaction()
+    transaction.id = transaction.id or str(uuid4())
+    transaction.created_at = transaction.created_at or datetime.utcnow()
+    transaction.source_account_id = source_account_id
+    transaction.amount = amount
+    
+    if transaction.status == 'completed':
+        # Payments leave the bank through the system clearing account
+        clearing_account_id = get_external_system_account().id
+        source_account, clearing_account = _debit(
+            user_id, source_account_id, amount, clearing_account_id, credit_balance=False
+        )
+        transaction.destination_account_id = clearing_account_id
+        transaction.completed_at = transaction.completed_at or datetime.utcnow()
+        _book(transaction, source_account, clearing_account, amount, credit_balance=False)
+    else:
+        # Future payments are only recorded; the debit happens when they run
+        source_account = Account.query.get(source_account_id)
+        if not source_account:
+            raise TransferError('Source account not found', 404)
+        if source_account.user_id != user_id:
+            raise TransferError('Access denied', 403)
+    
+    return _finalize(transaction, respond)
+
+def execute_payment(user_id, source_account_id, amount, build_transaction, respond=None):
+    """
+    Debit a payment from one of the user's accounts
+    
+    Args:
+        user_id (str): The user making the payment (must own the source account)
+        source_account_id (str): Account to debit
+        amount (float): Amount to pay
+        build_transaction (callable): Returns the new Transaction (type, status,
+            description, meta_data); called again if the payment is retried, so
+            any other session changes belonging to the payment should be made there
+        respond (callable): Builds the request's (body, status) response from the
+            transaction; it is stored for the request's Idempotency-Key in the
+            payment's own commit
+        
+    Returns:
+        Transaction: The committed transaction, or the (body, status) response if
+        `respond` is given. Only transactions built with status 'completed' debit
+        the account.
+        
+    Raises:
+        TransferError: If the payment is invalid (not found, access denied, insufficient funds)
+    """
+    if not is_valid_amount(amount):
+        raise TransferError('Invalid amount')
+    
+    transaction, response = _run_with_retry(
+        lambda: _payment(user_id, source_account_id, amount, build_transaction, respond)
+    )
+    _enqueue_signing(transaction)
+    return transaction if respond is None else response
+
+def _load_balances(accounts):
+    """Get the current balance of each locked account by id"""
+    ordered = list(accounts.values())
+    return dict(zip((account.id for account in ordered), current_balances(ordered)))
+
+def _parse_batch_item(item):
+    """Normalize one batch item, raising TransferError if it is malformed"""
+    if not isinstance(item, dict):
+        raise TransferError('Item must be an object')
+    
+    item_type = item.get('type', 'transfer')
+    if item_type not in ('transfer', 'payment'):
+        raise TransferError("Item type must be 'transfer' or 'payment'")
+    if not item.get('source_account_id'):
+        raise TransferError('source_account_id is required')
+    
+    amount = parse_amount(item.get('amount', 0))
+    
+    if item_type == 'payment':
+        if not item.get('biller_id'):
+            raise TransferError('biller_id is required')
+    elif not item.get('destination_account_id') and not item.get('destination_account_number'):
+        raise TransferError('Either destination_account_id or destination_account_number must be provided')
+    
+    return dict(item, type=item_type, amount=amount)
+
+def _batch(user_id, items):
+    results = [None] * len(items)
+    parsed = {}
+    for index, item in enumerate(items):
+        try:
+            parsed[index] = _parse_batch_item(item)
+        except TransferError as e:
+            results[index] = {'index': index, 'status': 'rejected', 'message': e.message}
+    
+    clearing_account_id = None
+    if any(item['type'] == 'payment' or not item.get('destination_account_id') for item in parsed.values()):
+        clearing_account_id = get_external_system_account().id
+    
+    # Every account the batch touches is loaded and locked in id order, the clearing account FOR SHARE
+    account_ids = set()
+    for item in parsed.values():
+        account_ids.add(item['source_account_id'])
+        if item['type'] == 'transfer' and item.get('destination_account_id'):
+            account_ids.add(item['destination_account_id'])
+    account_ids.discard(clearing_account_id)
+    accounts = lock_accounts(account_ids, [clearing_account_id] if clearing_account_id else [])
+    # The clearing account only receives ledger postings; its stored balance is not rewritten
+    accounts.pop(clearing_account_id, None)
+    
+    biller_ids = {item['biller_id'] for item in parsed.values() if item['type'] == 'payment'}
+    billers = {biller.id: biller for biller in Biller.query.filter(Biller.id.in_(biller_ids))} if biller_ids else {}
+    
+    # Running balances for the whole batch, decrypted once
+    append_only = is_append_only()
+    balances = _load_balances(accounts)
+    changed = set()
+    type_deltas = defaultdict(float)
+    
+    transactions = []
+    for index, item in parsed.items():
+        try:
+            source_account = accounts.get(item['source_account_id'])
+            if not source_account:
+                raise TransferError('Source account not found', 404)
+            if source_account.user_id != user_id:
+                raise TransferError('Access denied', 403)
+            
+            amount = item['amount']
+            credit_account_id = clearing_account_id
+            meta_data = None
+            if item['type'] == 'payment':
+                biller = billers.get(item['biller_id'])
+                if not biller:
+                    raise TransferError('Biller not found', 404)
+                fields = {
+                    'transaction_type': 'payment',
+                    'description': item.get('description') or f"Payment to {biller.name}",
+                    'reference': item.get('reference_number') or f"PAY-{uuid4().hex[:6].upper()}"
+                }
+                meta_data = {
+                    'biller_id': biller.id,
+                    'biller_name': biller.name,
+                    'biller_account_number': item.get('biller_account_number'),
+                    'batch_index': index
+                }
+            elif item.get('destination_account_id'):
+                credit_account_id = item['destination_account_id']
+                if credit_account_id == source_account.id:
+                    raise TransferError('Cannot transfer to the same account')
+                if credit_account_id not in accounts:
+                    raise TransferError('Destination account not found', 404)
+                fields = {
+                    'transaction_type': 'transfer',
+                    'description': item.get('description') or 'Funds transfer',
+                    'reference': item.get('reference') or f"TRF-{uuid4().hex[:8].upper()}"
+                }
+            else:
+                fields = {
+                    'transaction_type': 'external_transfer',
+                    'description': item.get('description') or 'External funds transfer',
+                    'reference': item.get('reference') or f"EXT-{uuid4().hex[:8].upper()}"
+                }
+                meta_data = {
+                    'destination_account_number': item['destination_account_number'],
+                    'beneficiary_id': item.get('beneficiary_id'),
+                    'transaction_type': 'external_transfer'
+                }
+            
+            if balances[source_account.id] < amount:
+                raise TransferError('Insufficient funds')
+        except TransferError as e:
+            results[index] = {'index': index, 'status': 'rejected', 'message': e.message}
+            continue
+        
+        balances[source_account.id] -= amount
+        changed.add(source_account.id)
+        type_deltas[source_account.account_type] -= amount
+        if credit_account_id in accounts:
+            balances[credit_account_id] += amount
+            changed.add(credit_account_id)
+            type_deltas[accounts[credit_account_id].account_type] += amount
+        
+        transaction = _new_transaction(
+            source_account_id=source_account.id,
+            destination_account_id=credit_account_id,
+            status='completed',
+            meta_data=meta_data,
+            **fields
+        )
+        transaction.amount = amount
+        transaction.completed_at = transaction.created_at
+        post_transfer(transaction, amount, source_account.id, credit_account_id)
+        db.session.add(transaction)
+        transactions.append((index, transaction, amount))
+    
+    if not append_only:
+        # Each account's stored balance is rewritten once, however many items touched it
+        for account_id in changed:
+            ensure_opening_snapshot(accounts[account_id])
+            accounts[account_id].balance = balances[account_id]
+    
+    record_balance_changes(type_deltas)
+    return results, transactions
+
+def execute_batch(user_id, items, atomic=False, respond=None):
+    """
+    Run a batch of transfers and bill payments in one database transaction
+    
+    All referenced accounts are loaded and locked in id order, items are
+    checked in order against running balances, and the completed transactions
+    are signed together under one Merkle root signature before a single commit.
+    
+    Args:
+        user_id (str): The user making the payments (must own every source account)
+        items (list): Dicts with type ('transfer' or 'payment'), source_account_id,
+            amount and either destination_account_id / destination_account_number
+            (transfers) or biller_id (payments)
+        atomic (bool): Reject the whole batch if any item is rejected
+        respond (callable): Builds the request's (body, status) response from the
+            results; it is stored for the request's Idempotency-Key in the
+            batch's own commit
+        
+    Returns:
+        list: Per-item results ({'index', 'status', 'transaction' or 'message'}), in order.
+        Status is 'completed', 'rejected', or 'not_processed' (atomic batches with a rejection).
+        The (body, status) response instead, if `respond` is given.
+    """
+    def unit_of_work():
+        results, transactions = _batch(user_id, items)
+        
+        if atomic and len(transactions) < len(items):
+            db.session.rollback()
+            for index, _, _ in transactions:
+                results[index] = {'index': index, 'status': 'not_processed'}
+            return results if respond is None else respond(results)
+        
+        if transactions and not sign_bank_transactions([transaction for _, transaction, _ in transactions]):
+            raise RuntimeError('Failed to sign batch')
+        
+        # Serialized before the commit expires them, so no row is read back
+        for index, transaction, amount in transactions:
+            results[index] = {'index': index, 'status': 'completed', 'transaction': transaction._to_dict(amount)}
+        
+        response = _store_response(respond, results)
+        db.session.commit()
+        return results if respond is None else response
+    
+    return _run_with_retry(unit_of_work)
+
+def execute_scheduled_payments(transactions):
+    """
+    Debit a batch of due scheduled payments
+    
+    The caller must hold the payments' row locks and is responsible for
+    signing and committing. Source accounts and the clearing account are
+    locked in id order and each payment is checked against running balances; payments that
+    cannot be made are marked failed rather than retried.
+    
+    Args:
+        transactions (list): Scheduled payment transactions
+        
+    Returns:
+        tuple: (completed transactions, failed transactions)
+    """
+    if not transactions:
+        return [], []
+    
+    clearing_account_id = get_external_system_account().id
+    source_ids = {transaction.source_account_id for transaction in transactions} - {clearing_account_id}
+    accounts = lock_accounts(source_ids, [clearing_account_id])
+    accounts.pop(clearing_account_id, None)
+    
+    append_only = is_append_only()
+    balances = _load_balances(accounts)
+    amounts = decrypt_amounts([transaction.amount_encrypted for transaction in transactions])
+    
+    now = datetime.utcnow()
+    completed, failed = [], []
+    changed = set()
+    type_deltas = defaultdict(float)
+    for transaction, amount in zip(transactions, amounts):
+        account = accounts.get(transaction.source_account_id)
+        if not account or not account.is_active:
+            reason = 'Source account not found or inactive'
+        elif balances[account.id] < amount:
+            reason = 'Insufficient funds'
+        else:
+            reason = None
+        
+        meta_data = dict(transaction.meta_data or {})
+        if reason:
+            meta_data['failure_reason'] = reason
+            transaction.meta_data = meta_data
+            transaction.status = 'failed'
+            failed.append(transaction)
+            continue
+        
+        balances[account.id] -= amount
+        changed.add(account.id)
+        type_deltas[account.account_type] -= amount
+        
+        # Payments leave the bank through the system clearing account
+        transaction.destination_account_id = clearing_account_id
+        transaction.status = 'completed'
+        transaction.completed_at = now
+        post_transfer(transaction, amount, account.id, clearing_account_id)
+        completed.append(transaction)
+    
+    if not append_only:
+        for account_id in changed:
+            ensure_opening_snapshot(accounts[account_id])
+            accounts[account_id].balance = balances[account_id]
+    
+    record_balance_changes(type_deltas)
+    return completed, failed
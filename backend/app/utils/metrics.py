@@ -0,0 +1,465 @@
+"""
+In-process Prometheus-style metrics
+Counters, gauges and histograms are updated under a per-metric lock. With
+METRICS_MULTIPROC_DIR set, each worker process writes its values to its own
+file in that directory and /metrics adds up the files of all workers, so a
+scrape through the load balancer sees the whole server rather than one worker.
+The files of workers that have exited are folded into an archive file (their
+counters and histograms; their gauges are dropped), so a new worker that gets
+a recycled pid starts from zero.
+"""
+
+from contextlib import contextmanager
+from bisect import bisect_left
+import atexit
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+
+# Request and database latencies in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Encryption and signing run in microseconds to milliseconds
+CRYPTO_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+
+class _Metric:
+    """Base class for a named metric with a fixed set of label names"""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or metrics_registry).register(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames) or any(name not in labels for name in self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        """Get a copy of the values, keyed by label values"""
+        with self._lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in self._values.items()}
+
+    def merge(self, current, value):
+        """Combine values for the same labels from two processes"""
+        return current + value
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Value that goes up and down
+
+    Across processes gauges are added up ('sum', e.g. connections in use) or
+    the largest is reported ('max'). A worker's gauges are dropped from the
+    shared directory when it exits.
+    """
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode='sum', registry=None):
+        if multiprocess_mode not in ('sum', 'max'):
+            raise ValueError(f"Unsupported multiprocess mode: {multiprocess_mode}")
+        self.multiprocess_mode = multiprocess_mode
+        super().__init__(name, documentation, labelnames, registry)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def merge(self, current, value):
+        return max(current, value) if self.multiprocess_mode == 'max' else current + value
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets
+
+    Each label set is stored as per-bucket counts (the last one for +Inf)
+    followed by the sum, so processes merge by adding element-wise.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def merge(self, current, value):
+        return [a + b for a, b in zip(current, value)]
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _pid_alive(pid):
+    """Whether a process with this pid exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class MetricsRegistry:
+    """All metrics of the process, rendered in the Prometheus text format"""
+
+    ARCHIVE_FILE = 'metrics-archive.json'
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.multiproc_dir = None
+        self.flush_interval = 5
+        self._last_flush = 0.0
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def configure(self, multiproc_dir=None, flush_interval=5):
+        """Share values with other worker processes through a directory"""
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        if multiproc_dir:
+            os.makedirs(multiproc_dir, exist_ok=True)
+            # A file under this process's pid was left by an earlier process
+            self.archive_dead_workers(include_own=True)
+
+    def _path(self, pid):
+        return os.path.join(self.multiproc_dir, f'metrics-{pid}.json')
+
+    def _worker_files(self):
+        """(pid, path) of each worker file in the shared directory"""
+        for filename in os.listdir(self.multiproc_dir):
+            pid = filename[len('metrics-'):-len('.json')]
+            if filename.startswith('metrics-') and filename.endswith('.json') and pid.isdigit():
+                yield int(pid), os.path.join(self.multiproc_dir, filename)
+
+    @contextmanager
+    def _directory_lock(self):
+        """Exclusive lock on the shared directory between worker processes"""
+        import fcntl
+        with open(os.path.join(self.multiproc_dir, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Skipping unreadable metrics file {os.path.basename(path)}: {str(e)}")
+            return {}
+
+    def _write(self, path, data):
+        # Written to a temporary file and renamed, so readers never see half a file
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+    def _merge_into(self, merged, data, include_gauges=True):
+        """Add one file's samples to {metric name: {label values: value}}"""
+        for name, samples in data.items():
+            metric = self._metrics.get(name)
+            if metric is None or (metric.type_name == 'gauge' and not include_gauges):
+                continue
+            values = merged.setdefault(name, {})
+            for key, value in samples:
+                key = tuple(key)
+                values[key] = metric.merge(values[key], value) if key in values else value
+
+    def archive_dead_workers(self, include_own=False):
+        """
+        Fold the files of exited workers into the archive file and delete them
+
+        Their counters and histograms are kept, so totals never go backwards;
+        their gauges (e.g. connections in use) are dropped.
+
+        Returns:
+            int: Number of worker files archived
+        """
+        if not self.multiproc_dir:
+            return 0
+        own_pid = os.getpid()
+        with self._directory_lock():
+            dead = [
+                path for pid, path in self._worker_files()
+                if (include_own and pid == own_pid) or (pid != own_pid and not _pid_alive(pid))
+            ]
+            if not dead:
+                return 0
+
+            archive_path = os.path.join(self.multiproc_dir, self.ARCHIVE_FILE)
+            merged = {}
+            self._merge_into(merged, self._read(archive_path))
+            for path in dead:
+                self._merge_into(merged, self._read(path), include_gauges=False)
+            self._write(archive_path, {
+                name: [[list(key), value] for key, value in values.items()]
+                for name, values in merged.items()
+            })
+            for path in dead:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return len(dead)
+
+    def flush(self, include_gauges=True):
+        """Write this process's values to its file in the shared directory"""
+        if not self.multiproc_dir:
+            return
+        data = {}
+        for metric in list(self._metrics.values()):
+            if metric.type_name == 'gauge' and not include_gauges:
+                continue
+            data[metric.name] = [[list(key), value] for key, value in metric.snapshot().items()]
+        self._write(self._path(os.getpid()), data)
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        """Flush if the last write is older than the flush interval"""
+        if self.multiproc_dir and time.monotonic() - self._last_flush >= self.flush_interval:
+            try:
+                self.flush()
+            except OSError as e:
+                logging.warning(f"Failed to write metrics file: {str(e)}")
+
+    def collect(self):
+        """Get {metric name: {label values: value}} for this process, or all workers"""
+        if not self.multiproc_dir:
+            return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+        self.flush()
+        self.archive_dead_workers()
+        merged = {name: {} for name in self._metrics}
+        self._merge_into(merged, self._read(os.path.join(self.multiproc_dir, self.ARCHIVE_FILE)))
+        for _, path in self._worker_files():
+            self._merge_into(merged, self._read(path))
+        return merged
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        collected = self.collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type_name}')
+            for key, value in sorted(collected.get(name, {}).items()):
+                if metric.type_name != 'histogram':
+                    lines.append(f'{name}{_format_labels(metric.labelnames, key)} {_format_value(value)}')
+                    continue
+
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), value[:-1]):
+                    cumulative += count
+                    le = ('le', _format_value(bound))
+                    lines.append(f'{name}_bucket{_format_labels(metric.labelnames, key, le)} {cumulative}')
+                labels = _format_labels(metric.labelnames, key)
+                lines.append(f'{name}_sum{labels} {_format_value(float(value[-1]))}')
+                lines.append(f'{name}_count{labels} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+# Global registry
+metrics_registry = MetricsRegistry()
+
+# Application metrics
+request_latency = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency',
+    ('blueprint', 'endpoint', 'method')
+)
+requests_total = Counter(
+    'http_requests_total', 'HTTP requests by response status',
+    ('blueprint', 'endpoint', 'method', 'status')
+)
+pool_checkout_wait = Histogram(
+    'db_pool_checkout_seconds', 'Time spent waiting for a database connection from the pool'
+)
+pool_connections_in_use = Gauge(
+    'db_pool_connections_in_use', 'Database connections currently checked out'
+)
+crypto_duration = Histogram(
+    'crypto_operation_duration_seconds', 'Duration of encryption and signing calls',
+    ('operation',), buckets=CRYPTO_BUCKETS
+)
+crypto_operations = Counter(
+    'crypto_operations_total', 'Values encrypted, decrypted, signed or verified',
+    ('operation',)
+)
+ids_decisions = Counter(
+    'ids_decisions_total', 'IDS decisions on incoming requests',
+    ('decision', 'event_type')
+)
+ids_table_entries = Gauge(
+    'ids_table_entries', 'Entries in IDS tracking tables', ('table',)
+)
+ids_table_evictions = Counter(
+    'ids_table_evictions_total', 'Entries removed from IDS tracking tables by TTL or capacity',
+    ('table', 'reason')
+)
+
+@contextmanager
+def track_crypto(operation, count=1):
+    """Time an encryption or signing call that handles `count` values"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        crypto_duration.observe(time.perf_counter() - start, operation=operation)
+        crypto_operations.inc(count, operation=operation)
+
+def _instrument_pool(engine):
+    """Time pool checkouts and track connections in use"""
+    from sqlalchemy import event
+
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - start)
+
+    # Engine.raw_connection looks up pool.connect on the instance
+    pool.connect = timed_connect
+
+    @event.listens_for(pool, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_connections_in_use.inc()
+
+    @event.listens_for(pool, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        pool_connections_in_use.dec()
+
+def _exit_flush():
+    # Fold this worker's counters and histograms into the archive, drop its gauges
+    try:
+        metrics_registry.flush(include_gauges=False)
+        metrics_registry.archive_dead_workers(include_own=True)
+    except OSError:
+        pass
+
+def _scrape_allowed(request, token, allowed_networks):
+    """Whether a request may read /metrics: a matching bearer token or an allowed address"""
+    auth = request.headers.get('Authorization', '')
+    if token and auth.startswith('Bearer ') and hmac.compare_digest(auth[7:].encode(), token.encode()):
+        return True
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(address.version == network.version and address in network for network in allowed_networks)
+
+def init_metrics(app):
+    """Collect request and pool metrics and serve /metrics if METRICS_ENABLED is set"""
+    if not app.config.get('METRICS_ENABLED', False):
+        return
+
+    from flask import g, request, Response, jsonify
+    from app import db
+
+    token = app.config.get('METRICS_AUTH_TOKEN')
+    allowed_networks = [
+        ipaddress.ip_network(value.strip(), strict=False)
+        for value in app.config.get('METRICS_ALLOWED_IPS', ['127.0.0.1', '::1']) if value.strip()
+    ]
+
+    metrics_registry.configure(
+        app.config.get('METRICS_MULTIPROC_DIR'),
+        app.config.get('METRICS_FLUSH_INTERVAL', 5)
+    )
+    if metrics_registry.multiproc_dir:
+        atexit.register(_exit_flush)
+
+    with app.app_context():
+        _instrument_pool(db.engine)
+
+    @app.before_request
+    def start_metrics_timer():
+        g.metrics_start_time = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = getattr(g, 'metrics_start_time', None)
+        if start is not None:
+            labels = {
+                'blueprint': request.blueprint or '',
+                'endpoint': request.endpoint or 'unmatched',
+                'method': request.method
+            }
+            request_latency.observe(time.perf_counter() - start, **labels)
+            requests_total.inc(status=response.status_code, **labels)
+        metrics_registry.maybe_flush()
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus scrape endpoint (bearer token or allowed scraper addresses only)"""
+        if not _scrape_allowed(request, token, allowed_networks):
+            return jsonify({'message': 'Access denied'}), 403
+        return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,201 @@
+"""
+Pagination helpers
+Keyset (cursor) pagination addresses pages by the (created_at, id) of the last
+row returned rather than an OFFSET, so the database seeks straight to the next
+page however deep the client pages. Page/limit pagination with sorting and
+approximate totals is used by the admin list endpoints.
+"""
+
+from flask import current_app
+from sqlalchemy import tuple_, func, union
+from app import db
+from datetime import datetime
+import base64
+import json
+import logging
+
+def encode_cursor(created_at, row_id):
+    """Encode the position after a row as an opaque cursor string"""
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), str(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def get_page_args(args, default_limit=None, max_limit=None):
+    """
+    Read cursor and limit query parameters
+
+    Returns:
+        tuple: (cursor or None, limit) with the limit clamped to the configured maximum
+    """
+    default_limit = default_limit or current_app.config.get('PAGE_SIZE_DEFAULT', 50)
+    max_limit = max_limit or current_app.config.get('PAGE_SIZE_MAX', 200)
+
+    limit = args.get('limit', default=default_limit, type=int)
+    limit = max(1, min(limit, max_limit))
+    return args.get('cursor') or None, limit
+
+def paginate_keyset_union(model, conditions, cursor, limit):
+    """
+    Fetch one page of the rows matching any of several conditions, newest first on (created_at, id)
+
+    Each condition is its own branch of a UNION, ordered and limited on its
+    own, so a condition on the leading column of a (column, created_at, id)
+    index is an ordered range scan of at most limit + 1 rows. An OR of the
+    conditions would read and sort every matching row instead. UNION (not
+    UNION ALL) drops rows matched by more than one branch; it only compares
+    the few (id, created_at) keys each branch returns. The page's rows are
+    then loaded by primary key.
+
+    Args:
+        model: Mapped class with created_at and id columns
+        conditions (list): Filter expressions, e.g. Transaction.source_account_id == account_id
+        cursor (str): Cursor from a previous page, or None for the first page
+        limit (int): Maximum rows to return
+
+    Returns:
+        tuple: (model instances, next_cursor) where next_cursor is None on the last page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    after = decode_cursor(cursor) if cursor else None
+
+    def branch(condition):
+        query = db.session.query(model.id, model.created_at).filter(condition)
+        if after:
+            query = query.filter(tuple_(model.created_at, model.id) < tuple_(*after))
+        # Wrapped so each branch keeps its own ORDER BY/LIMIT inside the UNION
+        return db.session.query(
+            query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).subquery()
+        ).statement
+
+    page = union(*[branch(condition) for condition in conditions]).subquery()
+    keys = db.session.query(page.c.id, page.c.created_at).order_by(
+        page.c.created_at.desc(), page.c.id.desc()
+    ).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(keys) > limit:
+        keys = keys[:limit]
+        next_cursor = encode_cursor(keys[-1].created_at, keys[-1].id)
+
+    rows = {row.id: row for row in model.query.filter(model.id.in_([key.id for key in keys]))} if keys else {}
+    return [rows[key.id] for key in keys if key.id in rows], next_cursor
+
+def get_offset_page_args(args, default_limit=None, max_limit=None):
+    """
+    Read page and limit query parameters
+    
+    Returns:
+        tuple: (page starting at 1, limit clamped to the configured maximum)
+    """
+    _, limit = get_page_args(args, default_limit, max_limit)
+    page = max(1, args.get('page', default=1, type=int))
+    return page, limit
+
+def apply_sort(query, sort, sort_fields, default):
+    """
+    Order a query by a client-chosen field
+    
+    Args:
+        sort (str): Field name, prefixed with '-' for descending (e.g. '-created_at')
+        sort_fields (dict): Allowed field names -> columns
+        default (str): Sort used when none is given
+        
+    Raises:
+        ValueError: If the field is not sortable
+    """
+    sort = sort or default
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+    if field not in sort_fields:
+        raise ValueError(f"Cannot sort by {field}; use one of: {', '.join(sort_fields)}")
+    
+    column = sort_fields[field]
+    order = column.desc() if descending else column.asc()
+    # Tie-break on the primary key so pages are stable
+    primary_key = column.class_.id
+    return query.order_by(order, primary_key.desc() if descending else primary_key.asc())
+
+def parse_date_range(args):
+    """
+    Read start_date and end_date (ISO format) query parameters
+    
+    Raises:
+        ValueError: If a date is malformed
+    """
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    try:
+        return (
+            datetime.fromisoformat(start_date) if start_date else None,
+            datetime.fromisoformat(end_date) if end_date else None
+        )
+    except ValueError:
+        raise ValueError('Dates must be in ISO format')
+
+def _estimate_rows(query):
+    """Ask the PostgreSQL planner how many rows a query returns"""
+    compiled = query.statement.compile(
+        dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True}
+    )
+    # In a savepoint, so a failed EXPLAIN does not abort the request's transaction
+    with db.session.begin_nested():
+        plan = db.session.connection().exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+        ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def count_rows(query):
+    """
+    Count the rows a query matches, approximately when there are many
+    
+    On PostgreSQL the planner's estimate is used once it exceeds
+    EXACT_COUNT_THRESHOLD, so large tables are never fully scanned just to
+    show a total.
+    
+    Returns:
+        tuple: (count, is_estimate)
+    """
+    threshold = current_app.config.get('EXACT_COUNT_THRESHOLD', 10000)
+    if db.engine.dialect.name == 'postgresql':
+        try:
+            estimate = _estimate_rows(query)
+            if estimate >= threshold:
+                return estimate, True
+        except Exception as e:
+            logging.warning(f"Row estimate failed, counting exactly: {str(e)}")
+    
+    return db.session.query(func.count()).select_from(query.order_by(None).subquery()).scalar(), False
+
+def paginate_offset(query, page, limit):
+    """
+    Fetch one page of an ordered query with its (possibly approximate) total
+    
+    Returns:
+        tuple: (rows, pagination dict)
+    """
+    rows = query.offset((page - 1) * limit).limit(limit).all()
+    total, estimated = count_rows(query)
+    return rows, {
+        'page': page,
+        'limit': limit,
+        'total': total,
+        'total_is_estimate': estimated,
+        'pages': (total + limit - 1) // limit
+    }
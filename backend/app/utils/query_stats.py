@@ -0,0 +1,78 @@
+"""
+Per-request SQL statistics
+Counts the statements each request runs and the time spent in the database,
+reports them in a Server-Timing header (if SERVER_TIMING_HEADER is set) and
+logs statements slower than SLOW_QUERY_THRESHOLD_MS together with the endpoint
+that issued them
+"""
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from app import db
+import logging
+import threading
+import time
+
+sql_logger = logging.getLogger('banking_sql')
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or request.path
+    return threading.current_thread().name
+
+def get_query_stats():
+    """Get (query count, database seconds) for the current request"""
+    return getattr(g, 'query_count', 0), getattr(g, 'query_time', 0.0)
+
+def init_query_stats(app):
+    """Hook SQLAlchemy engine events if SQL_INSTRUMENTATION_ENABLED is set"""
+    if not app.config.get('SQL_INSTRUMENTATION_ENABLED', False):
+        return
+    
+    slow_threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS', 200) / 1000.0
+    server_timing = app.config.get('SERVER_TIMING_HEADER', False)
+    
+    with app.app_context():
+        engine = db.engine
+    
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+    
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+        
+        if has_request_context():
+            g.query_count = getattr(g, 'query_count', 0) + 1
+            g.query_time = getattr(g, 'query_time', 0.0) + elapsed
+        
+        if elapsed >= slow_threshold:
+            sql_logger.warning(
+                f"Slow query ({elapsed * 1000:.1f}ms) in {_current_endpoint()}: "
+                f"{' '.join(statement.split())[:500]}"
+            )
+    
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(exception_context):
+        # Keep the timing stack balanced when a statement fails
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_start_time'):
+            conn.info['query_start_time'].pop()
+    
+    @app.before_request
+    def start_request_timer():
+        g.request_start_time = time.perf_counter()
+    
+    @app.after_request
+    def add_server_timing(response):
+        query_count, query_time = get_query_stats()
+        if server_timing:
+            timings = [f'db;dur={query_time * 1000:.1f};desc="{query_count} queries"']
+            start = getattr(g, 'request_start_time', None)
+            if start is not None:
+                timings.append(f'app;dur={(time.perf_counter() - start) * 1000:.1f}')
+            response.headers.add('Server-Timing', ', '.join(timings))
+        return response
+    
+    sql_logger.info(f"SQL instrumentation enabled (slow query threshold {slow_threshold * 1000:.0f}ms)")
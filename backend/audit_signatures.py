@@ -0,0 +1,241 @@
+"""
+Audit stored transaction signatures.
+
+Streams the transactions table with a server-side cursor (undated rows first,
+then in created_at, id order), verifies signatures across a process pool and writes a CSV report of
+valid, invalid and unsigned transactions. Only a bounded number of batches is
+held in memory at any time, and progress is checkpointed after every batch so
+an interrupted audit can be resumed. The checkpoint records the report size,
+so rows written after the last checkpoint are dropped when resuming.
+
+Usage:
+    python audit_signatures.py [--report signature_audit.csv] [--workers 4]
+                               [--batch-size 500] [--max-in-flight 8] [--resume]
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+from collections import deque
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import or_, and_
+
+# Add the backend directory to the path so we can import the app modules
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.transaction import Transaction
+from app.security.encryption import decrypt_amounts
+from app.security.key_store import BankKeyStore
+from app.security.transaction_signer import (
+    get_key_store, set_key_store, format_transaction_data, verify_transaction_signature
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+logger = logging.getLogger(__name__)
+
+REPORT_FIELDS = ['transaction_id', 'created_at', 'status', 'signature_type', 'key_id']
+
+def init_worker(key_dir, key_id, algorithm):
+    """Give each worker process its own key store (no app context needed)"""
+    set_key_store(BankKeyStore(key_dir, key_id, algorithm))
+
+def verify_batch(records):
+    """
+    Verify a batch of transaction records in a worker process
+
+    Args:
+        records (list): (transaction_id, created_at, transaction_data, signature, signature_info) tuples
+
+    Returns:
+        list: Report rows, in the same order as the records
+    """
+    rows = []
+    for transaction_id, created_at, transaction_data, signature, signature_info in records:
+        signature_info = signature_info or {}
+        if not signature:
+            status = 'unsigned'
+        elif verify_transaction_signature(transaction_data, signature, signature_info):
+            status = 'valid'
+        else:
+            status = 'invalid'
+
+        signature_type = signature_info.get('signature_type') or signature_info.get('status', '')
+        rows.append({
+            'transaction_id': transaction_id,
+            'created_at': created_at,
+            'status': status,
+            'signature_type': signature_type,
+            'key_id': signature_info.get('key_id', '')
+        })
+    return rows
+
+def load_checkpoint(path):
+    """Load the last checkpoint, if any"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path, last_created_at, last_id, counts, report_size):
+    """Atomically record how far the audit has got"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'last_created_at': last_created_at,
+            'last_id': last_id,
+            'counts': counts,
+            'report_size': report_size,
+            'updated_at': datetime.utcnow().isoformat()
+        }, f)
+    os.replace(tmp_path, path)
+
+def stream_batches(batch_size, checkpoint):
+    """
+    Stream transactions, yielding lists of verification records
+
+    Transactions without a created_at come first in id order, then the rest in
+    (created_at, id) order. Rows are fetched through a server-side cursor, so
+    only one batch of rows is loaded from the database at a time.
+    """
+    query = db.session.query(
+        Transaction.id,
+        Transaction.source_account_id,
+        Transaction.destination_account_id,
+        Transaction.amount_encrypted,
+        Transaction.created_at,
+        Transaction.digital_signature,
+        Transaction.meta_data
+    )
+    undated = query.filter(Transaction.created_at.is_(None)).order_by(Transaction.id)
+    dated = query.filter(Transaction.created_at.isnot(None)).order_by(Transaction.created_at, Transaction.id)
+
+    if checkpoint:
+        if checkpoint['last_created_at'] is None:
+            undated = undated.filter(Transaction.id > checkpoint['last_id'])
+        else:
+            last_created_at = datetime.fromisoformat(checkpoint['last_created_at'])
+            undated = None
+            dated = dated.filter(or_(
+                Transaction.created_at > last_created_at,
+                and_(Transaction.created_at == last_created_at, Transaction.id > checkpoint['last_id'])
+            ))
+
+    rows = chain.from_iterable(
+        q.execution_options(stream_results=True).yield_per(batch_size)
+        for q in (undated, dated) if q is not None
+    )
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield build_records(batch)
+            batch = []
+    if batch:
+        yield build_records(batch)
+
+def build_records(rows):
+    """Decrypt amounts and build the signed data string for a batch of rows"""
+    amounts = decrypt_amounts([row.amount_encrypted for row in rows])
+    return [
+        (
+            row.id,
+            row.created_at.isoformat() if row.created_at else None,
+            format_transaction_data(
+                row.id, row.source_account_id, row.destination_account_id, amount, row.created_at
+            ),
+            row.digital_signature,
+            (row.meta_data or {}).get('signature_info') if isinstance(row.meta_data, dict) else None
+        )
+        for row, amount in zip(rows, amounts)
+    ]
+
+def run_audit(report_path, checkpoint_path, workers, batch_size, max_in_flight, resume):
+    """Run the signature audit and return the status counts"""
+    app = create_app()
+
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    counts = checkpoint['counts'] if checkpoint else {'valid': 0, 'invalid': 0, 'unsigned': 0}
+    if checkpoint:
+        logger.info(f"Resuming audit after transaction {checkpoint['last_id']} ({checkpoint['last_created_at']})")
+
+    if checkpoint and checkpoint.get('report_size') is not None:
+        # Drop rows written after the checkpoint was saved; they are audited again
+        os.truncate(report_path, checkpoint['report_size'])
+
+    with app.app_context():
+        key_store = get_key_store()
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(key_store.key_dir, key_store.active_key_id, key_store.algorithm.name)
+        )
+
+        started = time.time()
+        in_flight = deque()
+
+        with open(report_path, 'a' if checkpoint else 'w', newline='') as report_file:
+            writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+            if not checkpoint:
+                writer.writeheader()
+
+            def drain_oldest():
+                # Batches are drained in submission order so the checkpoint only ever moves forward
+                future, last_record = in_flight.popleft()
+                rows = future.result()
+                writer.writerows(rows)
+                for row in rows:
+                    counts[row['status']] += 1
+                report_file.flush()
+                save_checkpoint(checkpoint_path, last_record[1], last_record[0], counts, report_file.tell())
+
+            try:
+                for records in stream_batches(batch_size, checkpoint):
+                    in_flight.append((pool.submit(verify_batch, records), records[-1]))
+                    # Cap the number of batches held in memory
+                    while len(in_flight) >= max_in_flight:
+                        drain_oldest()
+
+                while in_flight:
+                    drain_oldest()
+            finally:
+                pool.shutdown(cancel_futures=True)
+
+        total = sum(counts.values())
+        elapsed = time.time() - started
+        logger.info(f"Audited {total} transactions in {elapsed:.1f}s")
+
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify stored transaction signatures")
+    parser.add_argument('--report', default='signature_audit.csv', help="CSV report path")
+    parser.add_argument('--checkpoint', default=None, help="Checkpoint path (default: <report>.checkpoint)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help="Verification processes")
+    parser.add_argument('--batch-size', type=int, default=500, help="Transactions per batch")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="Maximum batches held in memory (default: 2 x workers)")
+    parser.add_argument('--resume', action='store_true', help="Continue from the last checkpoint")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or f"{args.report}.checkpoint"
+    max_in_flight = args.max_in_flight or args.workers * 2
+
+    try:
+        counts = run_audit(args.report, checkpoint_path, args.workers, args.batch_size, max_in_flight, args.resume)
+        logger.info(f"Valid: {counts['valid']}  Invalid: {counts['invalid']}  Unsigned: {counts['unsigned']}")
+        logger.info(f"Report written to {args.report}")
+        sys.exit(1 if counts['invalid'] else 0)
+    except Exception as e:
+        logger.error(f"Signature audit failed: {str(e)}")
+        sys.exit(2)
@@ -0,0 +1,91 @@
+"""
+Microbenchmark for the IDS threat signature matcher.
+
+Generates rule sets of increasing size and times scanning the same clean
+payloads (the common case: nothing matches, so every byte is examined) with
+the compiled ThreatMatcher and with the old approach of one re.search per
+pattern. The matcher's cost per byte should stay flat as rules are added,
+while the per-pattern loop grows with the rule count.
+
+Usage:
+    python benchmark_ids_matcher.py [--rules 10 100 500 1000] [--payload-size 2048]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import string
+import argparse
+
+# Add the backend directory to the path so we can import the app modules
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app.security.threat_matcher import ThreatMatcher, ThreatRule, DEFAULT_RULES
+
+def make_rules(count, rng):
+    """The built-in rules plus synthetic signatures, up to `count` signatures"""
+    rules = list(DEFAULT_RULES)
+    total = sum(len(rule.signatures) for rule in rules)
+    index = 0
+    while total < count:
+        signature = 'x' + ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 12)))
+        rules.append(ThreatRule(f'synthetic_{index}', 'synthetic', signatures=[signature]))
+        total += 1
+        index += 1
+    return rules
+
+def make_payload(size, rng):
+    """A JSON-ish transfer payload that matches no signature"""
+    words = ['amount', 'account', 'transfer', 'reference', 'currency', 'note', 'rent', 'paid']
+    parts = []
+    while sum(len(part) for part in parts) < size:
+        parts.append(f'"{rng.choice(words)}": "{rng.randint(0, 999999)} {rng.choice(words)}"')
+    return '{' + ', '.join(parts) + '}'
+
+def legacy_patterns(rules):
+    """One alternation per rule, scanned with re.search in turn (the old IDS loop)"""
+    return [
+        '(' + '|'.join(re.escape(signature) for signature in rule.signatures) + ')'
+        for rule in rules
+    ]
+
+def legacy_match(patterns, payload):
+    payload_lower = payload.lower()
+    for pattern in patterns:
+        if re.search(pattern, payload_lower, re.IGNORECASE):
+            return pattern
+    return None
+
+def measure(fn, payloads, seconds):
+    """Run fn over the payloads for the given time; return nanoseconds per byte"""
+    scanned = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for payload in payloads:
+            fn(payload)
+            scanned += len(payload)
+    return (time.perf_counter() - start) * 1e9 / scanned
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the IDS threat matcher against per-pattern regex search")
+    parser.add_argument('--rules', type=int, nargs='+', default=[10, 100, 500, 1000], help="Signature counts to test")
+    parser.add_argument('--payload-size', type=int, default=2048, help="Approximate payload size in bytes")
+    parser.add_argument('--seconds', type=float, default=1.0, help="Time to spend on each variant")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    payloads = [make_payload(args.payload_size, rng) for _ in range(20)]
+
+    print(f"{'signatures':>10} {'matcher ns/byte':>16} {'per-pattern ns/byte':>20} {'speedup':>8}")
+    for count in args.rules:
+        rules = make_rules(count, rng)
+        matcher = ThreatMatcher(rules)
+        assert all(matcher.match(payload) is None for payload in payloads)
+        patterns = legacy_patterns(rules)
+
+        compiled = measure(matcher.match, payloads, args.seconds)
+        legacy = measure(lambda payload: legacy_match(patterns, payload), payloads, args.seconds)
+        print(f"{matcher.signature_count:>10} {compiled:>16.1f} {legacy:>20.1f} {legacy / compiled:>7.1f}x")
@@ -0,0 +1,90 @@
+"""
+Microbenchmark for transaction signing throughput.
+
+Compares signatures per second when the private key PEM is parsed for every
+signature (the old sign_transaction behaviour) against the TransactionSigner
+fast path, which holds the already-parsed key. Also compares sign and verify
+throughput of the supported signature algorithms (RSA-PSS vs Ed25519).
+
+Usage:
+    python benchmark_signing.py [--seconds 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+
+# Add the backend directory to the path so we can import the app modules
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app.security.digital_signature import (
+    generate_key_pair_for_signing, TransactionSigner, SIGNATURE_ALGORITHMS
+)
+
+TRANSACTION_DATA = (
+    "3f1c2a7e-9b1d-4c55-8a2e-0d6f4b8e9a11:"
+    "b6a4e2c0-1f3d-4e5a-9c7b-2d8e6f0a1b3c:"
+    "c7b5f3d1-2e4a-4f6b-8d9c-3e0f7a1b2c4d:"
+    "250.0:2025-04-02 10:15:30.123456"
+).encode('utf-8')
+
+def sign_with_pem_parse(private_key_pem, data):
+    """Sign the way sign_transaction used to: parse the PEM on every call"""
+    private_key = serialization.load_pem_private_key(private_key_pem, password=None)
+    return private_key.sign(
+        data,
+        padding.PSS(
+            mgf=padding.MGF1(hashes.SHA256()),
+            salt_length=padding.PSS.MAX_LENGTH
+        ),
+        hashes.SHA256()
+    )
+
+def measure(label, fn, seconds, unit='sig/s'):
+    """Run fn repeatedly for the given time and report operations per second"""
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        fn()
+        count += 1
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed
+    print(f"{label:<32} {count:>7} ops in {elapsed:.2f}s  ->  {rate:>9.1f} {unit}")
+    return rate
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark transaction signing throughput")
+    parser.add_argument('--seconds', type=float, default=3.0, help="Time to spend on each variant")
+    args = parser.parse_args()
+
+    private_key_pem = generate_key_pair_for_signing()['private_key'].encode('utf-8')
+    signer = TransactionSigner.from_pem(private_key_pem)
+
+    print("RSA-2048 PSS/SHA-256 signing")
+    before = measure("parse PEM per signature", lambda: sign_with_pem_parse(private_key_pem, TRANSACTION_DATA), args.seconds)
+    after = measure("TransactionSigner.sign", lambda: signer.sign(TRANSACTION_DATA), args.seconds)
+    print(f"Speedup: {after / before:.2f}x")
+
+    print()
+    print("Signature algorithms (pre-parsed keys)")
+    results = {}
+    for name, algorithm in SIGNATURE_ALGORITHMS.items():
+        algorithm_signer = TransactionSigner(algorithm.generate_private_key())
+        signature = algorithm_signer.sign(TRANSACTION_DATA)
+        sign_rate = measure(f"{name} sign", lambda: algorithm_signer.sign(TRANSACTION_DATA), args.seconds)
+        verify_rate = measure(
+            f"{name} verify",
+            lambda: algorithm_signer.verify(TRANSACTION_DATA, signature),
+            args.seconds,
+            unit='verify/s'
+        )
+        results[name] = (sign_rate, verify_rate, len(signature))
+
+    print()
+    print(f"{'algorithm':<18} {'sign/s':>10} {'verify/s':>10} {'sig bytes':>10}")
+    for name, (sign_rate, verify_rate, size) in results.items():
+        print(f"{name:<18} {sign_rate:>10.1f} {verify_rate:>10.1f} {size:>10}")
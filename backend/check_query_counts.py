@@ -0,0 +1,114 @@
+"""
+Query-count regression check for the per-account transaction listing.
+
+Calls GET /api/accounts/<id>/transactions against the configured database with
+different page sizes and counts the SQL statements each request runs. The
+listing must use a fixed number of queries however many transactions a page
+holds; a count that grows with the page size means per-row (N+1) loading has
+crept back in.
+
+Uses the account with the most transactions, so run it against a database with
+some transaction history.
+
+Usage:
+    python check_query_counts.py [--max-queries 4]
+"""
+
+import os
+import sys
+import logging
+import argparse
+from sqlalchemy import event, func
+
+# Add the backend directory to the path so we can import the app modules
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.account import Account
+from app.models.transaction import Transaction
+from flask_jwt_extended import create_access_token
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZES = (1, 10, 100)
+
+class QueryCounter:
+    """Counts statements executed on an engine while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+def busiest_account():
+    """Find the account with the most transactions"""
+    outgoing = db.session.query(Transaction.source_account_id.label('account_id'))
+    incoming = db.session.query(Transaction.destination_account_id.label('account_id'))
+    sides = outgoing.union_all(incoming).subquery()
+    row = db.session.query(sides.c.account_id, func.count().label('total')) \
+        .filter(sides.c.account_id.isnot(None)) \
+        .group_by(sides.c.account_id) \
+        .order_by(func.count().desc()) \
+        .first()
+    return (Account.query.get(row.account_id), row.total) if row else (None, 0)
+
+def check_query_counts(max_queries):
+    """Return True if the listing runs a bounded, page-size independent number of queries"""
+    app = create_app()
+    client = app.test_client()
+
+    with app.app_context():
+        account, total = busiest_account()
+        if account is None:
+            logger.error("No transactions found; seed some data first")
+            return False
+        token = create_access_token(identity=account.user_id)
+        engine = db.engine
+        db.session.remove()
+
+    logger.info(f"Checking account {account.id} ({total} transactions)")
+    headers = {'Authorization': f'Bearer {token}'}
+
+    counts = {}
+    for limit in PAGE_SIZES:
+        with QueryCounter(engine) as counter:
+            response = client.get(f'/api/accounts/{account.id}/transactions?limit={limit}', headers=headers)
+        if response.status_code != 200:
+            logger.error(f"limit={limit}: HTTP {response.status_code} {response.get_data(as_text=True)}")
+            return False
+        rows = len(response.get_json()['transactions'])
+        counts[limit] = len(counter.statements)
+        logger.info(f"limit={limit}: {rows} transactions, {counts[limit]} queries")
+
+    ok = True
+    if len(set(counts.values())) != 1:
+        logger.error(f"Query count grows with page size: {counts}")
+        ok = False
+    if max(counts.values()) > max_queries:
+        logger.error(f"Listing ran {max(counts.values())} queries (budget {max_queries})")
+        ok = False
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the account transaction listing for N+1 queries")
+    parser.add_argument('--max-queries', type=int, default=4, help="Query budget per request")
+    args = parser.parse_args()
+
+    if check_query_counts(args.max_queries):
+        logger.info("✓ Query counts OK")
+        sys.exit(0)
+    sys.exit(1)
@@ -1,6 +1,8 @@
 import os
 from datetime import timedelta
 
+basedir = os.path.abspath(os.path.dirname(__file__))
+
 class Config:
     # Security settings
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-for-dev-only'
@@ -29,10 +31,111 @@ class Config:
     SQLALCHEMY_POOL_RECYCLE = 1800
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Per-request query counts/DB time (Server-Timing header) and slow query log
+    SQL_INSTRUMENTATION_ENABLED = os.environ.get('SQL_INSTRUMENTATION_ENABLED', 'true').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+    # Query counts and timings tell clients about the database; only turn on for debugging
+    SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', 'false').lower() == 'true'
+    
+    # Prometheus-style /metrics endpoint (off by default). Set METRICS_MULTIPROC_DIR
+    # to a local directory shared by all worker processes so a scrape reports the
+    # whole server. Scrapers need METRICS_AUTH_TOKEN as a bearer token or an
+    # address in METRICS_ALLOWED_IPS (addresses or CIDR ranges)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() == 'true'
+    METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN')
+    METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+    METRICS_FLUSH_INTERVAL = 5  # Seconds between writes of a worker's metrics file
+    
     # Encryption keys
     # In production, these would be stored securely and not in the code
     SYMMETRIC_KEY = os.environ.get('SYMMETRIC_KEY') or 'your-symmetric-key-for-dev'
     
+    # Bank transaction signing keys (generated on first run, shared by all workers)
+    SIGNING_KEY_DIR = os.environ.get('SIGNING_KEY_DIR') or os.path.join(basedir, 'keys')
+    SIGNING_KEY_ID = os.environ.get('SIGNING_KEY_ID') or 'bank-signing-1'
+    # Algorithm for newly generated keys ('rsa-pss-sha256' or 'ed25519'); use a new
+    # SIGNING_KEY_ID when switching so older signatures keep verifying with their key
+    SIGNING_ALGORITHM = os.environ.get('SIGNING_ALGORITHM') or 'rsa-pss-sha256'
+    
+    # Background signing: transfers return after their first commit and the
+    # signature is written by a worker pool in batched UPDATEs
+    ASYNC_SIGNING_ENABLED = os.environ.get('ASYNC_SIGNING_ENABLED', 'false').lower() == 'true'
+    SIGNING_WORKERS = 2
+    SIGNING_QUEUE_SIZE = 10000  # When full, transfers fall back to signing inline
+    SIGNING_BATCH_SIZE = 50
+    SIGNING_BATCH_WAIT = 0.05  # Seconds a worker waits to fill a batch
+    SIGNING_MAX_RETRIES = 3  # Retries of a failed batch, after 1, 2, 4 ... x SIGNING_RETRY_BACKOFF seconds
+    SIGNING_RETRY_BACKOFF = 1.0
+    # Committed transactions still pending a signature (e.g. lost with a stopped
+    # process's queue) are re-queued at startup and every SIGNING_SWEEP_INTERVAL
+    # seconds, once they are SIGNING_SWEEP_GRACE seconds old
+    SIGNING_SWEEP_INTERVAL = 300
+    SIGNING_SWEEP_GRACE = 60
+    # 'single' signs every transaction; 'merkle' signs one Merkle root per background batch
+    SIGNING_MODE = os.environ.get('SIGNING_MODE', 'single')
+    
+    # Transfers whose row locks hit a deadlock or lock timeout are retried
+    TRANSFER_MAX_RETRIES = 3
+    TRANSFER_RETRY_BACKOFF = 0.05  # Seconds, multiplied by the attempt number
+    
+    # Double-entry ledger: balances are the latest snapshot plus later postings.
+    # In append-only mode transfers only insert postings and the stored account
+    # balance is refreshed by compaction (run a compaction before switching back)
+    LEDGER_APPEND_ONLY = os.environ.get('LEDGER_APPEND_ONLY', 'false').lower() == 'true'
+    LEDGER_COMPACTION_ENABLED = os.environ.get('LEDGER_COMPACTION_ENABLED', 'false').lower() == 'true'
+    LEDGER_COMPACTION_INTERVAL = 60  # Seconds between compaction runs
+    LEDGER_COMPACTION_THRESHOLD = 100  # Postings since the last snapshot before an account is compacted
+    
+    # Rows each account type's running balance total is spread over, so
+    # concurrent transfers do not all wait on one aggregate row
+    BALANCE_AGGREGATE_SHARDS = 8
+    
+    # Maximum transfers/payments in one /api/transactions/batch request
+    BATCH_MAX_ITEMS = 1000
+    
+    # Scheduled payment executor (run_scheduler.py)
+    SCHEDULER_WORKERS = int(os.environ.get('SCHEDULER_WORKERS', 4))
+    SCHEDULER_BATCH_SIZE = 100  # Due payments claimed, debited and committed together
+    SCHEDULER_POLL_INTERVAL = 30  # Seconds between runs
+    
+    # Idempotency-Key support for transfer and payment POSTs
+    IDEMPOTENCY_KEY_TTL = 86400  # Seconds a stored response is replayed for
+    IDEMPOTENCY_CACHE_SIZE = 10000  # Responses kept in each process's LRU cache
+    IDEMPOTENCY_LEASE_TIMEOUT = 60  # Seconds before a retry may take over a key whose request died
+    IDEMPOTENCY_PURGE_INTERVAL = 3600  # Seconds between deletes of expired keys (by run_scheduler.py)
+    
+    # Cursor pagination for list endpoints
+    PAGE_SIZE_DEFAULT = 50
+    PAGE_SIZE_MAX = 200
+    # Admin list totals switch to the PostgreSQL planner's estimate above this many rows
+    EXACT_COUNT_THRESHOLD = 10000
+    
+    # Rows fetched and decrypted per chunk by the streaming statement export
+    EXPORT_CHUNK_SIZE = 1000
+    
+    # Bulk decryption of list endpoints (0 = decrypt inline on the request thread)
+    BULK_DECRYPT_WORKERS = int(os.environ.get('BULK_DECRYPT_WORKERS', 0))
+    BULK_DECRYPT_MIN_ROWS = 500  # Below this, a thread pool costs more than it saves
+    
+    # Where the IDS keeps rate counters, blocked IPs, sessions and events:
+    # 'local' (per worker process) or 'sqlite' (shared by all workers on the
+    # host; IDS_STATE_PATH must be on a local disk)
+    IDS_STATE_BACKEND = os.environ.get('IDS_STATE_BACKEND', 'local')
+    IDS_STATE_PATH = os.environ.get('IDS_STATE_PATH') or os.path.join(basedir, 'instance', 'ids_state.db')
+    # Keys (IPs/users) each in-process IDS table tracks before evicting the least
+    # recently used, and seconds an idle user session is remembered
+    IDS_TABLE_MAX_ENTRIES = 100000
+    IDS_SESSION_TTL = 86400
+    # Seconds an IP is blocked for its 1st, 2nd, ... rate limit or brute force
+    # offence (the last repeats); offences are forgotten after IDS_BLOCK_STRIKE_TTL
+    IDS_BLOCK_DURATIONS = [int(s) for s in os.environ.get('IDS_BLOCK_DURATIONS', '300,3600,86400').split(',')]
+    IDS_BLOCK_STRIKE_TTL = 7 * 86400
+    
+    # JSON file of IDS threat signature rules (see app/security/threat_matcher.py);
+    # unset uses the built-in SQL injection/XSS/path traversal signatures
+    IDS_RULES_PATH = os.environ.get('IDS_RULES_PATH')
+    
     # Security headers
     SECURITY_HEADERS = {
         'Content-Security-Policy': "default-src 'self'",
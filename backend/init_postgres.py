@@ -78,6 +78,9 @@ def init_db_tables():
         from app.models.security_settings import SecuritySettings
         from app.models.payee import Payee
         from app.models.biller import Biller, SavedBiller
+        from app.models.ledger import LedgerEntry, BalanceSnapshot
+        from app.models.idempotency import IdempotencyKey
+        from app.models.aggregate import BalanceAggregate
         
         # Create Flask app with PostgreSQL config
         app = create_app()
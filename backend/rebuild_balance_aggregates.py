@@ -0,0 +1,44 @@
+"""
+Rebuild the admin dashboard's balance aggregates.
+
+Recomputes the encrypted per-account-type balance totals and account counts
+from every account. Run it as part of the deploy that introduces the
+aggregates (the dashboard shows no totals until it has run) or to correct
+drift after manual data changes. Transfers keep running while it works.
+
+Usage:
+    python rebuild_balance_aggregates.py
+"""
+
+import os
+import sys
+import logging
+
+# Add the backend directory to the path so we can import the app modules
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app
+from app.services.aggregates import get_balance_totals, rebuild_balance_aggregates
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    app = create_app()
+
+    with app.app_context():
+        try:
+            before = get_balance_totals() or {}
+            after = rebuild_balance_aggregates()
+            for account_type, entry in sorted(after.items()):
+                previous = before.get(account_type, {'total': 0.0, 'count': 0})
+                logger.info(
+                    f"{account_type}: {entry['count']} accounts, total {entry['total']:.2f} "
+                    f"(was {previous['count']} accounts, {previous['total']:.2f})"
+                )
+        except Exception as e:
+            logger.error(f"Failed to rebuild balance aggregates: {str(e)}")
+            sys.exit(1)
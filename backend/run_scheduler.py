@@ -0,0 +1,78 @@
+"""
+Scheduled payment executor.
+
+Runs due scheduled and recurring bill payments in batches across a pool of
+worker threads, then sleeps until the next poll. Payments are claimed with
+SELECT ... FOR UPDATE SKIP LOCKED, so several scheduler processes can run side
+by side. Expired idempotency keys are purged every IDEMPOTENCY_PURGE_INTERVAL
+seconds.
+
+Usage:
+    python run_scheduler.py [--once] [--workers 4] [--batch-size 100] [--interval 30]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+# Add the backend directory to the path so we can import the app modules
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app
+from app.services.scheduler import run_due_payments
+from app.services.idempotency import purge_expired_keys
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+logger = logging.getLogger(__name__)
+
+def run(once, workers, batch_size, interval):
+    """Run due payments once, or keep polling until interrupted"""
+    app = create_app()
+    workers = workers or app.config.get('SCHEDULER_WORKERS', 4)
+    batch_size = batch_size or app.config.get('SCHEDULER_BATCH_SIZE', 100)
+    interval = interval or app.config.get('SCHEDULER_POLL_INTERVAL', 30)
+    purge_interval = app.config.get('IDEMPOTENCY_PURGE_INTERVAL', 3600)
+    next_purge = 0
+
+    logger.info(f"Payment scheduler started with {workers} workers, batches of {batch_size}")
+
+    with app.app_context():
+        while True:
+            started = time.time()
+            try:
+                counts = run_due_payments(workers, batch_size)
+                if counts['completed'] or counts['failed']:
+                    logger.info(f"Ran {counts['completed'] + counts['failed']} payments in {time.time() - started:.1f}s")
+            except Exception as e:
+                logger.error(f"Scheduler run failed: {str(e)}")
+
+            if time.time() >= next_purge:
+                next_purge = time.time() + purge_interval
+                try:
+                    removed = purge_expired_keys()
+                    if removed:
+                        logger.info(f"Purged {removed} expired idempotency keys")
+                except Exception as e:
+                    logger.error(f"Idempotency key purge failed: {str(e)}")
+
+            if once:
+                return
+            time.sleep(interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run due scheduled and recurring bill payments")
+    parser.add_argument('--once', action='store_true', help="Run due payments once and exit")
+    parser.add_argument('--workers', type=int, default=None, help="Worker threads (default: SCHEDULER_WORKERS)")
+    parser.add_argument('--batch-size', type=int, default=None, help="Payments per batch (default: SCHEDULER_BATCH_SIZE)")
+    parser.add_argument('--interval', type=float, default=None, help="Seconds between runs (default: SCHEDULER_POLL_INTERVAL)")
+    args = parser.parse_args()
+
+    try:
+        run(args.once, args.workers, args.batch_size, args.interval)
+    except KeyboardInterrupt:
+        logger.info("Payment scheduler stopped")